@@ -9,8 +9,14 @@ if sys.version_info.major == 3 and sys.version_info.minor < 11:
 else:
     import tomllib as tomli  # type: ignore
 
-from diamondpack.config import PackConfig, DPMode, App
-from diamondpack.pack import DiamondPacker
+from diamondpack.config import PackConfig, DPMode, App, RuntimeProfile
+from diamondpack.pack import DiamondPacker, DistLayout, build_runtime, get_runtime_root
+from diamondpack.analyze import DiamondAnalyzer
+from diamondpack.batch import BatchPacker, read_manifest
+from diamondpack.archive import ARCHIVE_FORMATS
+from diamondpack.delta import make_delta, apply_delta
+from diamondpack.watch import DiamondWatcher
+from diamondpack.plan import DiamondPlanner
 from diamondpack.log import logErr, log
 
 VERSION = "1.5.0"
@@ -26,9 +32,18 @@ class ConfigKeys:
     STDLIB_WL = "stdlib-whitelist"
     STDLIB_BL = "stdlib-blacklist"
     INC_TK = "include-tk"
+    TK_ENCODINGS = "tk-encodings"
+    TK_LOCALES = "tk-locales"
+    TK_FULL = "tk-full"
     DATA_GLOBS = "data-globs"
     DEBUG_LOGS = "debug-logs"
     ICONS = "icons"
+    ONEFILE = "onefile"
+    ARCHIVE = "archive"
+    SHARED_RUNTIME = "shared-runtime"
+    RUNTIME_ROOT = "runtime-root"
+    READAHEAD = "readahead"
+    RUNTIME = "runtime"
 
     VALID_KEYS = [
         MODE,
@@ -36,9 +51,36 @@ class ConfigKeys:
         STDLIB_WL,
         STDLIB_BL,
         INC_TK,
+        TK_ENCODINGS,
+        TK_LOCALES,
+        TK_FULL,
         DATA_GLOBS,
         DEBUG_LOGS,
         ICONS,
+        ONEFILE,
+        ARCHIVE,
+        SHARED_RUNTIME,
+        RUNTIME_ROOT,
+        READAHEAD,
+        RUNTIME,
+    ]
+
+
+class ProfileKeys:
+    GC_THRESHOLD = "gc-threshold"
+    GC_FREEZE = "gc-freeze"
+    MALLOC_ARENA_MAX = "malloc-arena-max"
+    HASH_SEED = "hash-seed"
+    X_OPTIONS = "x-options"
+    PRELOAD = "preload"
+
+    VALID_KEYS = [
+        GC_THRESHOLD,
+        GC_FREEZE,
+        MALLOC_ARENA_MAX,
+        HASH_SEED,
+        X_OPTIONS,
+        PRELOAD,
     ]
 
 
@@ -56,18 +98,93 @@ def parse_app(name, value, icons: Dict[str, str]) -> App | None:
     return App(name, path, entry, icon)
 
 
-def parse_project() -> Optional[PackConfig]:
+def parse_profile(name: str, values: Dict) -> Optional[RuntimeProfile]:
+    """
+    Parse an app's [tool.diamondpack.runtime.<name>] section
+    """
+    section = f'tool.diamondpack.{ConfigKeys.RUNTIME}.{name}'
+    profile = RuntimeProfile()
+
+    badConfig = False
+    for key in values.keys():
+        if key not in ProfileKeys.VALID_KEYS:
+            badConfig = True
+            logErr(f'Invalid project config {section}.{key}')
+
+    if badConfig:
+        return None
+
+    try:
+        threshold = values[ProfileKeys.GC_THRESHOLD]
+        valid = isinstance(threshold, list) and 1 <= len(threshold) <= 3
+        if not valid or not all(isinstance(x, int) and x >= 0 for x in threshold):
+            logErr(f"'{section}.{ProfileKeys.GC_THRESHOLD}' must be a list of 1 to 3 non negative ints")
+            return None
+        profile.gc_threshold = threshold
+    except KeyError:
+        pass
+
+    try:
+        profile.gc_freeze = values[ProfileKeys.GC_FREEZE]
+    except KeyError:
+        pass
+
+    try:
+        arenas = values[ProfileKeys.MALLOC_ARENA_MAX]
+        if not isinstance(arenas, int) or arenas < 1:
+            logErr(f"'{section}.{ProfileKeys.MALLOC_ARENA_MAX}' must be a positive int")
+            return None
+        profile.malloc_arena_max = arenas
+    except KeyError:
+        pass
+
+    try:
+        seed = values[ProfileKeys.HASH_SEED]
+        if seed != "random" and (isinstance(seed, bool) or not isinstance(seed, int) or not 0 <= seed <= 4294967295):
+            logErr(f"'{section}.{ProfileKeys.HASH_SEED}' must be \"random\" or an int from 0 to 4294967295")
+            return None
+        profile.hash_seed = str(seed)
+    except KeyError:
+        pass
+
+    try:
+        profile.x_options = values[ProfileKeys.X_OPTIONS]
+    except KeyError:
+        pass
+
+    for x in profile.x_options:
+        # The options end up on the command line
+        if re.fullmatch(r'[A-Za-z0-9_]+(=[A-Za-z0-9_.,]*)?', x) is None:
+            logErr(f"Invalid value in '{section}.{ProfileKeys.X_OPTIONS}': '{x}'")
+            return None
+
+    try:
+        profile.preload = values[ProfileKeys.PRELOAD]
+    except KeyError:
+        pass
+
+    if profile.preload is not None and os.path.isabs(profile.preload):
+        logErr(f"'{section}.{ProfileKeys.PRELOAD}' must be relative to the dist")
+        return None
+
+    return profile
+
+
+def parse_project(projectDir: str = ".") -> Optional[PackConfig]:
     """
     Load the pyproject.toml file
+
+    :param projectDir: Directory containing the project, all project paths are resolved relative to it
     """
     try:
-        with open(PROJECT_FILE, mode='rb') as f:
+        with open(os.path.join(projectDir, PROJECT_FILE), mode='rb') as f:
             root = tomli.load(f)
     except FileNotFoundError:
-        logErr("Cannot find pyproject.toml")
+        logErr(f"Cannot find pyproject.toml in '{projectDir}'")
         return None
 
     config = PackConfig()
+    config.project_dir = projectDir
 
     try:
         project = root['project']
@@ -148,6 +265,21 @@ def parse_project() -> Optional[PackConfig]:
     except KeyError:
         pass
 
+    try:
+        config.tk_encodings = dpConfigs[ConfigKeys.TK_ENCODINGS]
+    except KeyError:
+        pass
+
+    try:
+        config.tk_locales = dpConfigs[ConfigKeys.TK_LOCALES]
+    except KeyError:
+        pass
+
+    try:
+        config.tk_full = dpConfigs[ConfigKeys.TK_FULL]
+    except KeyError:
+        pass
+
     try:
         config.cache_block = dpConfigs[ConfigKeys.PYCACHE_BL]
     except KeyError:
@@ -163,12 +295,58 @@ def parse_project() -> Optional[PackConfig]:
     except KeyError:
         pass
 
+    try:
+        config.onefile = dpConfigs[ConfigKeys.ONEFILE]
+    except KeyError:
+        pass
+
+    if config.onefile and config.mode != DPMode.APP:
+        logErr(f"'tool.diamondpack.{ConfigKeys.ONEFILE}' requires 'app' mode")
+        return None
+
+    try:
+        config.readahead = dpConfigs[ConfigKeys.READAHEAD]
+    except KeyError:
+        pass
+
+    if config.readahead and config.mode != DPMode.APP:
+        logErr(f"'tool.diamondpack.{ConfigKeys.READAHEAD}' requires 'app' mode")
+        return None
+
+    try:
+        config.archive = dpConfigs[ConfigKeys.ARCHIVE]
+    except KeyError:
+        pass
+
+    if config.archive is not None and config.archive not in ARCHIVE_FORMATS:
+        logErr(
+            f"Invalid value for 'tool.diamondpack.{ConfigKeys.ARCHIVE}': '{config.archive}', expected one of {ARCHIVE_FORMATS}"
+        )
+        return None
+
+    try:
+        config.shared_runtime = dpConfigs[ConfigKeys.SHARED_RUNTIME]
+    except KeyError:
+        pass
+
+    try:
+        config.runtime_root = dpConfigs[ConfigKeys.RUNTIME_ROOT]
+    except KeyError:
+        pass
+
+    if not os.path.isabs(config.runtime_root):
+        logErr(f"'tool.diamondpack.{ConfigKeys.RUNTIME_ROOT}' must be an absolute path")
+        return None
+
     config.name = f'{config.projectName}-{config.version}'
 
     error = False
 
     try:
-        icons = dpConfigs[ConfigKeys.ICONS]
+        icons = {
+            name: os.path.join(projectDir, path)
+            for name, path in dpConfigs[ConfigKeys.ICONS].items()
+        }
     except KeyError:
         icons = {}
 
@@ -186,6 +364,32 @@ def parse_project() -> Optional[PackConfig]:
             continue
         config.gui_scripts.append(app)
 
+    try:
+        profiles = dpConfigs[ConfigKeys.RUNTIME]
+    except KeyError:
+        profiles = {}
+
+    apps = {
+        x.name: x
+        for x in config.scripts + config.gui_scripts
+    }
+    for name, values in profiles.items():
+        profile = parse_profile(name, values)
+        if profile is None:
+            error = True
+        elif name not in apps:
+            logErr(f"'tool.diamondpack.{ConfigKeys.RUNTIME}.{name}' doesn't match any script")
+            error = True
+        elif profile.gc_freeze and apps[name].entry is None:
+            # A module runs its imports while running, so there would be almost nothing to freeze yet
+            logErr(
+                f"'tool.diamondpack.{ConfigKeys.RUNTIME}.{name}.{ProfileKeys.GC_FREEZE}' needs an entry point, "
+                f"e.g. '{apps[name].path}:main'"
+            )
+            error = True
+        else:
+            apps[name].profile = profile
+
     normal_script_names = set(scripts.keys())
     gui_script_names = set(gui_scripts.keys())
 
@@ -199,26 +403,195 @@ def parse_project() -> Optional[PackConfig]:
     return config
 
 
+def load_project(projectDir: str, args) -> Optional[PackConfig]:
+    """
+    Load a project and apply the command line overrides
+    """
+    log(f"Loading pyproject.toml - {projectDir}")
+    config = parse_project(projectDir)
+
+    if config is None:
+        return None
+
+    config.dev_mode = args.dev
+    if args.onefile:
+        config.onefile = True
+    if args.readahead:
+        config.readahead = True
+    if args.archive is not None:
+        config.archive = args.archive
+    if args.jobs is not None:
+        config.jobs = args.jobs
+    if args.shared_runtime:
+        config.shared_runtime = True
+    if args.runtime_root is not None:
+        config.runtime_root = os.path.abspath(args.runtime_root)
+
+    return config
+
+
+def run_batch(args) -> int:
+    projects = list(args.paths)
+    if args.manifest is not None:
+        try:
+            projects.extend(read_manifest(args.manifest))
+        except FileNotFoundError:
+            logErr(f"Cannot find batch manifest '{args.manifest}'")
+            return -1
+
+    if len(projects) == 0:
+        logErr("No projects given, pass project directories or --manifest")
+        return -1
+
+    configs = []
+    for projectDir in projects:
+        config = load_project(projectDir, args)
+        if config is None:
+            return -1
+        configs.append(config)
+
+    log(f"Batch packing - {len(configs)} projects")
+    packer = BatchPacker(configs, args.workers, args.cache_dir)
+    if not packer.pack():
+        return -1
+
+    return 0
+
+
+def run_delta(args) -> int:
+    if len(args.paths) != 2:
+        if args.command == "delta":
+            logErr("'delta' expects the old dist (or its manifest) and the new dist")
+        else:
+            logErr("'apply' expects the delta package and the installed dist")
+        return -1
+
+    try:
+        if args.command == "delta":
+            old, new = args.paths
+            output = args.output
+            if output is None:
+                output = f'{os.path.basename(os.path.normpath(new))}.dpdelta'
+            make_delta(old, new, output)
+        else:
+            apply_delta(args.paths[0], args.paths[1])
+    except Exception as err:
+        logErr(f"Unable to {args.command}:")
+        logErr(str(err))
+        return -1
+
+    return 0
+
+
 def main():
     log("-----------------------------------------")
     log(f"        DiamondPack - v{VERSION}")
     log("-----------------------------------------")
 
     parser = ArgumentParser()
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="pack",
+        choices=["pack", "analyze", "batch", "delta", "apply", "runtime"],
+        help="'pack' builds the dist, 'analyze' reports the size and import cost of an already packed dist, "
+        "'batch' packs several projects, 'delta' writes an update package between two dists, "
+        "'apply' installs an update package, 'runtime' installs the shared runtime the project needs."
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help="Project directories for 'batch', OLD_DIST NEW_DIST for 'delta', DELTA INSTALLED_DIST for 'apply'."
+    )
     parser.add_argument("--dev", action="store_true", help="Simplify build process for speed.")
+    parser.add_argument(
+        "--watch", action="store_true", help="After packing, keep syncing changed project files into the dist."
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.5,
+        help="Poll interval in seconds for --watch, when inotify is unavailable."
+    )
     parser.add_argument("--project", help="Directory containing python project.", default=".")
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Write the files a pack would produce as JSON, without building anything. "
+        "Written to --output, or dist/<name>-plan.json."
+    )
+    parser.add_argument("--onefile", action="store_true", help="Also write each app as a single executable.")
+    parser.add_argument(
+        "--readahead", action="store_true", help="Record the files each app reads at startup, to prefetch them."
+    )
+    parser.add_argument(
+        "--archive",
+        choices=ARCHIVE_FORMATS,
+        help="Also write the dist to a compressed archive, in parallel. Set SOURCE_DATE_EPOCH for reproducible output."
+    )
+    parser.add_argument(
+        "--shared-runtime",
+        action="store_true",
+        help="Leave the interpreter and stdlib out of the dist, and run from a shared runtime."
+    )
+    parser.add_argument("--runtime-root", help="Directory containing the shared runtimes.")
+    parser.add_argument("--jobs", type=int, default=None, help="Max number of pack steps to run at once.")
+    parser.add_argument("--top", type=int, default=25, help="Number of entries to show per analyze report section.")
+    parser.add_argument("--manifest", help="File listing project directories for 'batch', one per line.")
+    parser.add_argument("--workers", type=int, default=2, help="Max number of projects to pack at once in 'batch'.")
+    parser.add_argument("--output", help="Output file for 'delta' and --plan.")
+    parser.add_argument(
+        "--cache-dir",
+        default=os.path.join("build", "dp-batch-cache"),
+        help="Directory for wheels and stdlib layers shared between projects in 'batch'."
+    )
 
     args = parser.parse_args()
 
-    os.chdir(args.project)
+    if args.command == "batch":
+        return run_batch(args)
+
+    if args.command == "delta" or args.command == "apply":
+        return run_delta(args)
 
-    log("Loading pyproject.toml")
-    config = parse_project()
+    config = load_project(args.project, args)
 
     if config is None:
         return -1
 
-    config.dev_mode = args.dev
+    if args.command == "analyze":
+        try:
+            DiamondAnalyzer(config).analyze(args.top)
+        except Exception as err:
+            logErr("Unable to analyze:")
+            logErr(str(err))
+            return -1
+        return 0
+
+    if args.command == "runtime":
+        try:
+            # An explicit root wins over the environment, unlike in the launchers
+            root = config.runtime_root if args.runtime_root is not None else get_runtime_root(config)
+            build_runtime(config, root)
+        except Exception as err:
+            logErr("Unable to build runtime:")
+            logErr(str(err))
+            return -1
+        return 0
+
+    if args.plan:
+        try:
+            DiamondPlanner(config).write(args.output)
+        except Exception as err:
+            logErr("Unable to plan:")
+            logErr(str(err))
+            return -1
+        return 0
+
+    if args.watch and not config.dev_mode:
+        # Reuse the venv of an earlier dev pack, like with --dev.
+        #  A full pack strips pip from the venv, so a dist from one gets a full pack again
+        config.dev_mode = os.path.exists(os.path.join(DistLayout(config).venvDir, "pyvenv.cfg"))
 
     log(f"Packing - {config.name}")
     packer = DiamondPacker(config)
@@ -229,6 +602,17 @@ def main():
         logErr(str(err))
         return -1
 
+    if args.watch:
+        watcher = DiamondWatcher(config, packer, lambda: load_project(args.project, args), args.interval)
+        try:
+            watcher.watch()
+        except KeyboardInterrupt:
+            log("Stopped watching")
+        except Exception as err:
+            logErr("Unable to watch:")
+            logErr(str(err))
+            return -1
+
     return 0
 
 
@@ -0,0 +1,328 @@
+# Dist analysis
+import os
+import re
+import subprocess as sp
+from typing import Dict, List, Optional, Set
+
+from diamondpack.config import App, PackConfig
+from diamondpack.pack import DistLayout, MINIMUM_STDLIB, TKINTER_LIBS
+from diamondpack.log import log, logErr, logRaw
+
+IMPORT_TIME_RE = re.compile(r'import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \|\s*(?P<name>\S+)')
+
+# Frames of a traceback, used to find packages that fail without their sources
+TRACEBACK_RE = re.compile(r'\s*File "(?P<filename>[^"]+)", line \d+')
+
+SHARED_LIB_RE = re.compile(r'\.(so(\.[0-9]+)*|dll|dylib)$')
+
+MODULE_EXTS = [".py", ".pyc", ".so", ".pyd"]
+
+
+class Category:
+    STDLIB = "stdlib"
+    PACKAGE = "site-packages"
+    SHARED_LIB = "shared-lib"
+    RUNTIME = "runtime"
+    DATA = "data"
+    BUILTIN = "builtin"
+
+
+class Entry:
+
+    def __init__(self, category: str, name: str) -> None:
+        """
+        Size and import cost of a single part of the dist
+
+        :param category: The kind of entry, one of Category
+        :param name: The module, distribution or file name
+        """
+        self.category = category
+        self.name = name
+        self.size = 0
+        self.files = 0
+        # Highest self import time across all apps, in microseconds
+        self.importUs = 0
+        self.imported = False
+        # Whether this is a package directory, rather than a single module
+        self.isPackage = False
+
+
+def _fmt_size(size: int) -> str:
+    value = float(size)
+    for unit in ["B", "KiB", "MiB"]:
+        if value < 1024:
+            return f'{value:.1f} {unit}'
+        value /= 1024
+    return f'{value:.1f} GiB'
+
+
+def _module_name(filename: str) -> str:
+    """
+    Strips extensions and ABI tags from a module file name
+    """
+    return filename.split(".")[0]
+
+
+def _top_module(parts: List[str]) -> str:
+    """
+    Returns the top level module for a path split into components,
+    relative to a folder on the python path
+    """
+    if len(parts) == 1:
+        return _module_name(parts[0])
+    if parts[0] == "__pycache__":
+        return _module_name(parts[1])
+    # Package directory names are used as is
+    return parts[0]
+
+
+class DiamondAnalyzer:
+
+    def __init__(self, config: PackConfig) -> None:
+        self._config = config
+        self._layout = DistLayout(config)
+        self._entries: Dict[str, Entry] = {}
+        # top level module name -> owning entry
+        self._modules: Dict[str, Entry] = {}
+        # site-packages top level module -> distribution name
+        self._distNames: Dict[str, str] = {}
+        # top level site-packages modules seen in failing tracebacks
+        self._failedModules: Set[str] = set()
+
+    def analyze(self, top: int) -> None:
+        """
+        Main entry point for analyzing
+
+        :param top: The number of entries to show per report section
+        """
+        if not os.path.isdir(self._layout.venvDir):
+            raise RuntimeError(f"Cannot find packed environment '{self._layout.venvDir}', pack the project first")
+
+        log(f"Analyzing - {self._layout.outputDir}")
+        self._load_dist_names()
+        self._walk_dist()
+
+        for app in self._config.scripts + self._config.gui_scripts:
+            self._trace_imports(app)
+
+        self._report(top)
+        self._suggest(top)
+
+    def _get_entry(self, category: str, name: str) -> Entry:
+        key = f'{category}:{name}'
+        try:
+            return self._entries[key]
+        except KeyError:
+            entry = Entry(category, name)
+            self._entries[key] = entry
+            return entry
+
+    def _load_dist_names(self) -> None:
+        """
+        Maps top level modules to their distributions, only possible when
+        the dist-info folders were kept (i.e. dev mode)
+        """
+        if not os.path.isdir(self._layout.sitePackages):
+            return
+
+        for folder in os.listdir(self._layout.sitePackages):
+            if not folder.endswith(".dist-info"):
+                continue
+            distName = folder[:-len(".dist-info")].rsplit("-", 1)[0]
+            record = os.path.join(self._layout.sitePackages, folder, "RECORD")
+            try:
+                with open(record, mode='r') as f:
+                    for line in f:
+                        path = line.split(",", 1)[0]
+                        topLevel = path.split("/", 1)[0]
+                        if topLevel.startswith("..") or topLevel == "__pycache__":
+                            continue
+                        self._distNames.setdefault(_module_name(topLevel), distName)
+            except FileNotFoundError:
+                continue
+
+    def _classify(self, relPath: str) -> Entry:
+        """
+        Find the entry a file belongs to
+
+        :param relPath: Path of the file relative to the output dir, using forward slashes
+        """
+        venvRel = os.path.relpath(self._layout.venvDir, self._layout.outputDir).replace(os.sep, "/") + "/"
+        libRel = os.path.relpath(self._layout.venvLib, self._layout.outputDir).replace(os.sep, "/") + "/"
+        siteRel = libRel + "site-packages/"
+        dynloadRel = libRel + "lib-dynload/"
+
+        if relPath.startswith(siteRel):
+            module = _top_module(relPath[len(siteRel):].split("/"))
+            entry = self._get_entry(Category.PACKAGE, self._distNames.get(module, module))
+            self._modules.setdefault(module, entry)
+            return entry
+
+        if relPath.startswith(dynloadRel):
+            module = _module_name(relPath[len(dynloadRel):])
+            entry = self._get_entry(Category.STDLIB, module)
+            self._modules.setdefault(module, entry)
+            return entry
+
+        basename = relPath.rsplit("/", 1)[-1]
+        if SHARED_LIB_RE.search(basename) is not None:
+            return self._get_entry(Category.SHARED_LIB, basename)
+
+        if relPath.startswith(libRel):
+            parts = relPath[len(libRel):].split("/")
+            isPackage = len(parts) > 1 and parts[0] != "__pycache__"
+            if not isPackage and os.path.splitext(basename)[1] not in MODULE_EXTS:
+                # e.g. the stdlib LICENSE.txt
+                return self._get_entry(Category.RUNTIME, basename)
+            module = _top_module(parts)
+            entry = self._get_entry(Category.STDLIB, module)
+            entry.isPackage = entry.isPackage or isPackage
+            self._modules.setdefault(module, entry)
+            return entry
+
+        if relPath.startswith(venvRel):
+            parts = relPath[len(venvRel):].split("/")
+            return self._get_entry(Category.RUNTIME, "/".join(parts[:2]))
+
+        return self._get_entry(Category.DATA, relPath.split("/", 1)[0])
+
+    def _walk_dist(self) -> None:
+        log("Measuring files")
+        for dirpath, _, filenames in os.walk(self._layout.outputDir):
+            for fname in filenames:
+                path = os.path.join(dirpath, fname)
+                if os.path.islink(path):
+                    continue
+                relPath = os.path.relpath(path, self._layout.outputDir).replace(os.sep, "/")
+                entry = self._classify(relPath)
+                entry.size += os.path.getsize(path)
+                entry.files += 1
+
+    def _trace_imports(self, app: App) -> None:
+        """
+        Import the app's module with the packed interpreter and record the import times.
+        The entry point itself isn't called, so this only measures startup cost.
+
+        :param app: The app
+        """
+        log(f"Tracing imports - {app.name}")
+        code = "; ".join(self._layout.setup + [f"import {app.path}"])
+        args = [os.path.abspath(self._layout.pythonExec), "-X", "importtime", "-c", code]
+        # Run from the dist, the project's sources in the working directory would shadow the packed modules
+        run = sp.run(
+            args, env=self._layout.get_env(), cwd=self._layout.outputDir, capture_output=True, universal_newlines=True
+        )
+
+        other: List[str] = []
+        for line in run.stderr.splitlines():
+            m = IMPORT_TIME_RE.match(line)
+            if m is None:
+                if not line.startswith("import time:"):
+                    other.append(line)
+                continue
+            module = m.group('name').split(".")[0]
+            try:
+                entry = self._modules[module]
+            except KeyError:
+                entry = self._get_entry(Category.BUILTIN, module)
+                self._modules[module] = entry
+            entry.imported = True
+            entry.importUs = max(entry.importUs, int(m.group('self')))
+
+        if run.returncode == 0:
+            return
+
+        logErr(f"Importing '{app.path}' failed: Return code ({run.returncode})")
+        logRaw("\u250C")
+        # The innermost package of each traceback is the one that failed, the outer ones just imported it
+        innermost: Optional[str] = None
+        for line in other:
+            logRaw("\u2502", line)
+            if line.startswith("Traceback") and innermost is not None:
+                # Chained exceptions print several tracebacks
+                self._failedModules.add(innermost)
+                innermost = None
+            m = TRACEBACK_RE.match(line)
+            if m is None:
+                continue
+            module = self._package_module(m.group('filename'))
+            if module is not None:
+                innermost = module
+        if innermost is not None:
+            self._failedModules.add(innermost)
+        logRaw("\u2514")
+
+    def _package_module(self, filename: str) -> Optional[str]:
+        """
+        Returns the top level site-packages module of a traceback frame, if it is in one.
+        Bytecode that replaced its source has a path relative to the folder on the python path,
+        so those are looked up in the modules found in the dist
+
+        :param filename: The frame's file name
+        """
+        filename = filename.replace("\\", "/")
+        idx = filename.find("/site-packages/")
+        if idx >= 0:
+            return _module_name(filename[idx + len("/site-packages/"):].split("/")[0])
+        # e.g. <frozen importlib._bootstrap>, or a file outside the dist
+        if filename.startswith("<") or os.path.isabs(filename):
+            return None
+        module = _top_module(filename.split("/"))
+        entry = self._modules.get(module)
+        if entry is not None and entry.category == Category.PACKAGE:
+            return module
+        return None
+
+    def _report(self, top: int) -> None:
+        entries = list(self._entries.values())
+        totalSize = sum(x.size for x in entries)
+        totalFiles = sum(x.files for x in entries)
+
+        def printEntries(title: str, items: List[Entry]):
+            log(title)
+            logRaw("\u250C")
+            logRaw("\u2502", f"{'SIZE':>10} {'FILES':>6} {'IMPORT':>10}  {'CATEGORY':<14} NAME")
+            for x in items[:top]:
+                importStr = f'{x.importUs / 1000:.2f} ms' if x.imported else '-'
+                logRaw("\u2502", f"{_fmt_size(x.size):>10} {x.files:>6} {importStr:>10}  {x.category:<14} {x.name}")
+            logRaw("\u2514")
+
+        entries.sort(key=lambda x: x.size, reverse=True)
+        printEntries(f"Largest entries - {_fmt_size(totalSize)} in {totalFiles} files", entries)
+
+        imported = [x for x in entries if x.imported]
+        imported.sort(key=lambda x: x.importUs, reverse=True)
+        totalUs = sum(x.importUs for x in imported)
+        printEntries(f"Slowest imports - {totalUs / 1000:.2f} ms self time", imported)
+
+    def _suggest(self, top: int) -> None:
+        required = set(MINIMUM_STDLIB)
+        if self._config.include_tk:
+            required.update(TKINTER_LIBS)
+
+        unused = [
+            x for x in self._entries.values()
+            if x.category == Category.STDLIB and not x.imported and x.name not in required
+        ]
+        unused.sort(key=lambda x: x.size, reverse=True)
+
+        if self._config.stdlib_blacklist is not None:
+            # Single file modules need a pattern to catch the .py and .pyc files
+            suggestions = [x.name if x.isPackage else f'{x.name}.*' for x in unused if x.size > 0]
+            suggestions = [x for x in suggestions if x not in self._config.stdlib_blacklist][:top]
+            unusedSize = sum(x.size for x in unused)
+            if len(suggestions) > 0:
+                log(f"Candidate 'stdlib-blacklist' entries, never imported at startup ({_fmt_size(unusedSize)}):")
+                logRaw("\u250C")
+                for x in suggestions:
+                    logRaw("\u2502", x)
+                logRaw("\u2514")
+        elif self._config.stdlib_whitelist is not None:
+            unusedNames = set(x.name for x in unused)
+            suggestions = [x for x in self._config.stdlib_whitelist if x in unusedNames]
+            if len(suggestions) > 0:
+                log(f"'stdlib-whitelist' entries never imported at startup: {suggestions}")
+
+        suggestions = sorted(x for x in self._failedModules if x not in self._config.cache_block)
+        if len(suggestions) > 0:
+            log(f"Candidate 'py-cache-blacklist' entries, seen in failing imports: {suggestions}")
@@ -2,9 +2,11 @@
 Template app
 */
 
+#include <algorithm>
 #include <cstring>
 #include <errno.h>
 #include <stdlib.h>
+#include <unistd.h>
 
 // Use forward slashes
 #define SEP "/"
@@ -34,6 +36,347 @@ bool write_env(const char* name, const std::string& value)
     return true;
 }
 
+// Environment from the app's runtime profile, name and value pairs
+const char* const APP_ENV[][2] = {
+@@ENV@@
+    {nullptr, nullptr}};
+
+// Library from the dist to preload, relative to the install dir, empty for none
+#define PRELOAD "@@PRELOAD@@"
+
+#ifdef DIAMOND_ONEFILE
+    #include <cstdint>
+    #include <fstream>
+    #include <sys/stat.h>
+
+// Name of the packed dist, used for the extraction cache directory
+    #define DIST_NAME "@@NAME@@"
+
+// The payload is appended to this executable, followed by the trailer:
+//  u64 payload offset, 64 char sha256 hex digest, 8 byte magic
+    #define ONEFILE_MAGIC "DPONEFIL"
+    #define MAGIC_SIZE 8
+    #define HASH_SIZE 64
+    #define TRAILER_SIZE (8 + HASH_SIZE + MAGIC_SIZE)
+    // Length of the hash prefix used in the cache directory name
+    #define HASH_KEY_SIZE 16
+
+enum EntryType : uint8_t
+{
+    ENTRY_FILE = 0,
+    ENTRY_SYMLINK = 1,
+    ENTRY_DIR = 2,
+    ENTRY_END = 255
+};
+
+template<typename T>
+bool read_value(std::ifstream& in, T& value)
+{
+    // Payload values are little endian, same as every platform we build for
+    in.read(reinterpret_cast<char*>(&value), sizeof(T));
+    return in.good();
+}
+
+std::string get_cache_root()
+{
+    const char* xdg = getenv("XDG_CACHE_HOME");
+    if(xdg != nullptr && xdg[0] != 0)
+    {
+        return std::string(xdg) + "/diamondpack";
+    }
+
+    const char* home = getenv("HOME");
+    if(home != nullptr && home[0] != 0)
+    {
+        return std::string(home) + "/.cache/diamondpack";
+    }
+
+    return "/tmp/diamondpack-" + std::to_string(getuid());
+}
+
+bool extract_payload(std::ifstream& in, const std::filesystem::path& outDir)
+{
+    std::vector<char> buffer(1 << 16);
+    while(true)
+    {
+        uint8_t type;
+        uint32_t mode, pathLen;
+        uint64_t size;
+        if(!read_value(in, type))
+        {
+            return false;
+        }
+
+        if(type == ENTRY_END)
+        {
+            return true;
+        }
+
+        if(!read_value(in, mode) || !read_value(in, pathLen))
+        {
+            return false;
+        }
+
+        std::string relPath(pathLen, '\0');
+        in.read(relPath.data(), pathLen);
+        if(!read_value(in, size))
+        {
+            return false;
+        }
+
+        std::filesystem::path path = outDir / relPath;
+        std::error_code err;
+        std::filesystem::create_directories(path.parent_path(), err);
+
+        if(type == ENTRY_DIR)
+        {
+            std::filesystem::create_directories(path, err);
+            if(err)
+            {
+                LOG("Cannot create directory " << path << std::endl);
+                return false;
+            }
+        }
+        else if(type == ENTRY_SYMLINK)
+        {
+            std::string target(size, '\0');
+            in.read(target.data(), size);
+            std::filesystem::create_symlink(target, path, err);
+            if(err)
+            {
+                LOG("Cannot create symlink " << path << std::endl);
+                return false;
+            }
+        }
+        else
+        {
+            std::ofstream out(path, std::ios::binary);
+            uint64_t remaining = size;
+            while(remaining > 0 && in.good() && out.good())
+            {
+                std::streamsize chunk =
+                    static_cast<std::streamsize>(std::min<uint64_t>(remaining, buffer.size()));
+                in.read(buffer.data(), chunk);
+                out.write(buffer.data(), chunk);
+                remaining -= chunk;
+            }
+            out.close();
+            if(remaining > 0 || !out)
+            {
+                LOG("Cannot write file " << path << std::endl);
+                return false;
+            }
+            chmod(path.c_str(), mode);
+        }
+
+        if(!in.good())
+        {
+            return false;
+        }
+    }
+}
+
+/*
+Find the extracted dist for the payload appended to this executable,
+extracting it into the cache first if needed.
+Sets outDir to an empty string if there isn't a payload
+*/
+bool get_onefile_dir(const std::string& exePath, std::string& outDir)
+{
+    outDir.clear();
+    std::ifstream in(exePath, std::ios::binary);
+    if(!in)
+    {
+        LOG("Cannot open " << exePath << std::endl);
+        return false;
+    }
+
+    in.seekg(0, std::ios::end);
+    uint64_t exeSize = in.tellg();
+    if(exeSize < TRAILER_SIZE)
+    {
+        return true;
+    }
+
+    in.seekg(exeSize - TRAILER_SIZE);
+    uint64_t offset;
+    char hash[HASH_SIZE];
+    char magic[MAGIC_SIZE];
+    read_value(in, offset);
+    in.read(hash, HASH_SIZE);
+    in.read(magic, MAGIC_SIZE);
+    if(!in.good() || std::memcmp(magic, ONEFILE_MAGIC, MAGIC_SIZE) != 0)
+    {
+        // No payload, run from next to the executable
+        return true;
+    }
+
+    std::filesystem::path cacheRoot = get_cache_root();
+    std::string key = std::string(DIST_NAME "-") + std::string(hash, HASH_KEY_SIZE);
+    std::filesystem::path finalDir = cacheRoot / key;
+    outDir = finalDir.string();
+
+    // The final dir only ever appears through the rename below, so it is always complete
+    if(std::filesystem::is_directory(finalDir))
+    {
+        LOG("Using cached dist: " << outDir << std::endl);
+        return true;
+    }
+
+    std::error_code err;
+    std::filesystem::create_directories(cacheRoot, err);
+    if(err)
+    {
+        std::cerr << "Cannot create cache directory " << cacheRoot << ": " << err.message() << std::endl;
+        return false;
+    }
+
+    std::filesystem::path tmpDir = cacheRoot / ("." + key + "." + std::to_string(getpid()) + ".tmp");
+    std::filesystem::remove_all(tmpDir, err);
+
+    LOG("Extracting to: " << tmpDir << std::endl);
+    in.seekg(offset);
+    if(!extract_payload(in, tmpDir))
+    {
+        std::cerr << "Cannot extract payload to " << tmpDir << std::endl;
+        std::filesystem::remove_all(tmpDir, err);
+        return false;
+    }
+
+    if(rename(tmpDir.c_str(), finalDir.c_str()) != 0)
+    {
+        int renameErr = errno;
+        std::filesystem::remove_all(tmpDir, err);
+        // Another launch finished extracting first, use its copy
+        if(!std::filesystem::is_directory(finalDir))
+        {
+            std::cerr << "Cannot move extracted dist to " << finalDir << ": " << strerror(renameErr)
+                      << std::endl;
+            return false;
+        }
+    }
+
+    return true;
+}
+#endif
+
+#ifdef DIAMOND_SHARED_RUNTIME
+    #include <fstream>
+
+// The shared runtime this app was packed for, and where it is installed by default
+    #define RUNTIME_NAME "@@RUNTIME@@"
+    #define RUNTIME_KEY "@@RUNTIMEKEY@@"
+    #define RUNTIME_ROOT "@@RUNTIMEROOT@@"
+    // Must match pack.py
+    #define RUNTIME_KEY_FILE "diamondpack-runtime"
+    #define RUNTIME_ROOT_ENV "DIAMONDPACK_RUNTIME_ROOT"
+
+/*
+Find the shared runtime and check that it was built for this app
+*/
+bool get_runtime_dir(std::string& outDir)
+{
+    std::string runtimeRoot = RUNTIME_ROOT;
+    const char* rootEnv = getenv(RUNTIME_ROOT_ENV);
+    if(rootEnv != nullptr && rootEnv[0] != 0)
+    {
+        runtimeRoot = rootEnv;
+    }
+
+    outDir = runtimeRoot + SEP RUNTIME_NAME;
+    LOG("Runtime location: " << outDir << std::endl);
+
+    std::ifstream in(outDir + SEP RUNTIME_KEY_FILE);
+    if(!in)
+    {
+        std::cerr << "Cannot find the DiamondPack runtime " RUNTIME_NAME " in " << runtimeRoot
+                  << ", install it with 'diamondpack runtime'" << std::endl;
+        return false;
+    }
+
+    std::string key;
+    std::getline(in, key);
+    if(key != RUNTIME_KEY)
+    {
+        std::cerr << "The DiamondPack runtime " << outDir << " is not compatible with this app" << std::endl;
+        return false;
+    }
+
+    return true;
+}
+#endif
+
+#ifdef DIAMOND_READAHEAD
+    #include <fcntl.h>
+    #include <fstream>
+    #include <thread>
+
+    #define APP_NAME "@@APP@@"
+    // Must match readahead.py
+    #define READAHEAD_DIR "readahead"
+    #define RUNTIME_PREFIX "$RUNTIME/"
+    // Set to 0 to skip prefetching, e.g. to compare cold starts
+    #define READAHEAD_ENV "DIAMONDPACK_READAHEAD"
+    // Opening the files also waits on the disk, so several threads work through the list
+    #define READAHEAD_THREADS 4
+
+void prefetch_files(const std::vector<std::string>* files, size_t start)
+{
+    for(size_t i = start; i < files->size(); i += READAHEAD_THREADS)
+    {
+        int fd = open((*files)[i].c_str(), O_RDONLY | O_CLOEXEC);
+        if(fd < 0)
+        {
+            continue;
+        }
+        // Only queues the reads, the page cache fills in the background
+        posix_fadvise(fd, 0, 0, POSIX_FADV_WILLNEED);
+        close(fd);
+    }
+}
+
+/*
+Start prefetching the files this app reads at startup, in the order they are read.
+Paths are relative to the install dir, or to the python home when they start with RUNTIME_PREFIX.
+files must outlive the returned threads
+*/
+std::vector<std::thread> start_readahead(
+    const std::string& installDir,
+    const std::string& pythonHome,
+    std::vector<std::string>& files
+)
+{
+    std::vector<std::thread> threads;
+    const char* enabled = getenv(READAHEAD_ENV);
+    if(enabled != nullptr && std::strcmp(enabled, "0") == 0)
+    {
+        return threads;
+    }
+
+    std::ifstream in(installDir + SEP READAHEAD_DIR SEP APP_NAME ".txt");
+    std::string line;
+    while(std::getline(in, line))
+    {
+        if(line.compare(0, sizeof(RUNTIME_PREFIX) - 1, RUNTIME_PREFIX) == 0)
+        {
+            files.push_back(pythonHome + SEP + line.substr(sizeof(RUNTIME_PREFIX) - 1));
+        }
+        else if(!line.empty())
+        {
+            files.push_back(installDir + SEP + line);
+        }
+    }
+
+    LOG("Prefetching " << files.size() << " files" << std::endl);
+    for(size_t i = 0; i < READAHEAD_THREADS && i < files.size(); ++i)
+    {
+        threads.emplace_back(prefetch_files, &files, i);
+    }
+
+    return threads;
+}
+#endif
+
 int main(int argc, char** argv)
 {
     // First we parse out the home directory of this application
@@ -55,27 +398,87 @@ int main(int argc, char** argv)
         installDir = std::filesystem::current_path().string();
     }
 
+#ifdef DIAMOND_ONEFILE
+    char exePath[4096];
+    ssize_t exeLen = readlink("/proc/self/exe", exePath, sizeof(exePath) - 1);
+    if(exeLen < 0)
+    {
+        std::cerr << "Cannot find executable path: " << strerror(errno) << std::endl;
+        return -1;
+    }
+    exePath[exeLen] = 0;
+
+    std::string onefileDir;
+    if(!get_onefile_dir(exePath, onefileDir))
+    {
+        return -1;
+    }
+
+    if(!onefileDir.empty())
+    {
+        installDir = onefileDir;
+    }
+#endif
+
     LOG("App location: " << installDir << std::endl);
 
+    // The interpreter and stdlib, bundled in the venv by default
+    std::string pythonHome = installDir + SEP "venv";
+
+#ifdef DIAMOND_SHARED_RUNTIME
+    if(!get_runtime_dir(pythonHome))
+    {
+        return -1;
+    }
+
+    // The runtime doesn't know about the app's packages
+    if(!write_env("PYTHONPATH", installDir + "/venv/lib/@@PYTHON@@/site-packages"))
+    {
+        return -1;
+    }
+#endif
+
     // Set up the PYTHONHOME var
     std::stringstream ss;
-    ss << installDir << SEP "venv";
+    ss << pythonHome;
     if(!write_env("PYTHONHOME", ss.str()))
     {
         return -1;
     }
 
     ss = std::stringstream();
-    ss << installDir << "/venv/bin";
+    ss << pythonHome << "/bin";
     if(!write_env("LD_LIBRARY_PATH", ss.str()))
     {
         return -1;
     }
 
+    for(int i = 0; APP_ENV[i][0] != nullptr; ++i)
+    {
+        if(!write_env(APP_ENV[i][0], APP_ENV[i][1]))
+        {
+            return -1;
+        }
+    }
+
+    if(sizeof(PRELOAD) > 1)
+    {
+        std::string preload = installDir + SEP PRELOAD;
+        const char* current = getenv("LD_PRELOAD");
+        if(current != nullptr && current[0] != 0)
+        {
+            preload = preload + ":" + current;
+        }
+        if(!write_env("LD_PRELOAD", preload))
+        {
+            return -1;
+        }
+    }
+
     // Set up exec string
     ss = std::stringstream();
-    ss << "\"" << installDir
-       << "/venv/bin/python"
+    ss << "\"" << pythonHome
+       << "/bin/python"
           "\" @@COMMAND@@ ";
 
     // Add all remaining cmd line args
@@ -84,9 +487,23 @@ int main(int argc, char** argv)
         ss << " " << argv[i];
     }
 
+#ifdef DIAMOND_READAHEAD
+    // Runs alongside the interpreter's startup
+    std::vector<std::string> readaheadFiles;
+    std::vector<std::thread> readaheadThreads = start_readahead(installDir, pythonHome, readaheadFiles);
+#endif
+
     // Exec the app
     LOG("Executing: " << ss.str() << std::endl);
     int out = std::system(ss.str().c_str());
     LOG("Return Code: " << out << std::endl);
+
+#ifdef DIAMOND_READAHEAD
+    for(auto& thread : readaheadThreads)
+    {
+        thread.join();
+    }
+#endif
+
     return out;
 }
\ No newline at end of file
@@ -0,0 +1,22 @@
+#!/bin/bash
+
+home=$(realpath $(dirname $0))
+
+runtime_root=${DIAMONDPACK_RUNTIME_ROOT:-@@RUNTIMEROOT@@}
+runtime=${runtime_root}/@@RUNTIME@@
+
+if [ ! -f "${runtime}/diamondpack-runtime" ]; then
+    echo "Cannot find the DiamondPack runtime @@RUNTIME@@ in ${runtime_root}, install it with 'diamondpack runtime'" >&2
+    exit 1
+fi
+
+if [ "$(head -n 1 "${runtime}/diamondpack-runtime")" != "@@RUNTIMEKEY@@" ]; then
+    echo "The DiamondPack runtime ${runtime} is not compatible with this app" >&2
+    exit 1
+fi
+
+export PYTHONHOME=${runtime}/
+export PYTHONPATH=${home}/venv/lib/@@PYTHON@@/site-packages
+export LD_LIBRARY_PATH=${runtime}/bin
+@@ENV@@
+"${runtime}/bin/python" @@COMMAND@@ $@
\ No newline at end of file
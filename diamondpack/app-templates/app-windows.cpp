@@ -67,6 +67,11 @@ bool write_env(const wchar_t* name, const std::wstring& value)
     return true;
 }
 
+// Environment from the app's runtime profile, name and value pairs
+const wchar_t* const APP_ENV[][2] = {
+@@ENV@@
+    {nullptr, nullptr}};
+
 std::wstring get_env(const wchar_t* name)
 {
     wchar_t buffer[1024];
@@ -126,6 +131,14 @@ int wmain(int argc, wchar_t** argv)
         return -1;
     }
 
+    for(int i = 0; APP_ENV[i][0] != nullptr; ++i)
+    {
+        if(!write_env(APP_ENV[i][0], APP_ENV[i][1]))
+        {
+            return -1;
+        }
+    }
+
     // Set up exec wstring
     ss = std::wstringstream();
     ss << L"\"" << installDir
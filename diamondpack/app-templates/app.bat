@@ -6,5 +6,6 @@ SET home=%~dp0
 
 SET PYTHONHOME=%home%venv\
 SET PATH=%home%\venv\Lib;%PATH%
+@@ENV@@
 "%home%venv\Scripts\python.exe" @@COMMAND@@ %*
 
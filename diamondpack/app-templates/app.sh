@@ -5,4 +5,5 @@ home=$(realpath $(dirname $0))
 export PYTHONHOME=${home}/venv/
 export PYTHONPATH=${home}/venv/lib/@@PYTHON@@/site-packages
 export LD_LIBRARY_PATH=${home}/venv/bin
+@@ENV@@
 "${home}/venv/bin/python" @@COMMAND@@ $@
\ No newline at end of file
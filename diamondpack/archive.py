@@ -0,0 +1,192 @@
+# Dist archives
+import gzip
+import hashlib
+import lzma
+import os
+import tarfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, BinaryIO, Callable, Deque, Dict, Optional
+
+try:
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None
+
+from diamondpack.delta import MANIFEST_FILE
+from diamondpack.log import log
+
+# Size of each independently compressed block.
+# Each block is a complete gzip member, xz stream or zstd frame, and concatenations
+#  of those are valid files, so the blocks can be compressed in parallel
+BLOCK_SIZE = 8 * 1024 * 1024
+
+ARCHIVE_FORMATS = ["tar.gz", "tar.xz", "tar.zst"]
+
+
+def _get_compressor(fmt: str) -> Callable[[bytes], bytes]:
+    if fmt == "tar.gz":
+        # Fixed header mtime for reproducible output
+        return lambda data: gzip.compress(data, compresslevel=6, mtime=0)
+    if fmt == "tar.xz":
+        return lambda data: lzma.compress(data, format=lzma.FORMAT_XZ, preset=6)
+    if fmt == "tar.zst":
+        if zstandard is None:
+            raise RuntimeError("'tar.zst' archives require the zstandard package, install 'diamondpack[zstd]'")
+        return lambda data: zstandard.ZstdCompressor(level=10).compress(data)
+    raise RuntimeError(f"Invalid archive format '{fmt}', expected one of {ARCHIVE_FORMATS}")
+
+
+class _ParallelCompressor:
+
+    def __init__(self, out: BinaryIO, fmt: str, jobs: int) -> None:
+        """
+        File-like sink that compresses blocks on a thread pool and writes them out in order.
+        The compression libraries release the GIL, so the blocks really are compressed in parallel.
+
+        :param out: The output file
+        :param fmt: The archive format
+        :param jobs: Number of blocks to compress at once
+        """
+        self._out = out
+        self._compress = _get_compressor(fmt)
+        self._jobs = max(jobs, 1)
+        self._pool = ThreadPoolExecutor(max_workers=self._jobs)
+        self._pending: Deque[Future] = deque()
+        self._buffer = bytearray()
+        self.rawSize = 0
+        self.compressedSize = 0
+
+    def write(self, data: bytes) -> int:
+        self._buffer.extend(data)
+        self.rawSize += len(data)
+        while len(self._buffer) >= BLOCK_SIZE:
+            block = bytes(self._buffer[:BLOCK_SIZE])
+            del self._buffer[:BLOCK_SIZE]
+            self._submit(block)
+        return len(data)
+
+    def _submit(self, block: bytes) -> None:
+        self._pending.append(self._pool.submit(self._compress, block))
+        # Bound the memory used by blocks waiting to be written
+        while len(self._pending) > self._jobs * 2:
+            self._write_next()
+
+    def _write_next(self) -> None:
+        data = self._pending.popleft().result()
+        self._out.write(data)
+        self.compressedSize += len(data)
+
+    def close(self) -> None:
+        if len(self._buffer) > 0:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while len(self._pending) > 0:
+            self._write_next()
+        self._pool.shutdown()
+
+
+class _HashingReader:
+
+    def __init__(self, f: BinaryIO) -> None:
+        """
+        Hashes a file while tarfile reads it
+        """
+        self._f = f
+        self.hash = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._f.read(size)
+        self.hash.update(data)
+        return data
+
+
+def _normalize(info: tarfile.TarInfo, mtime: Optional[int]) -> tarfile.TarInfo:
+    info.uid = 0
+    info.gid = 0
+    info.uname = ""
+    info.gname = ""
+    if info.isdir() or info.mode & 0o111:
+        info.mode = 0o755
+    else:
+        info.mode = 0o644
+    if mtime is not None:
+        info.mtime = min(int(info.mtime), mtime)
+    else:
+        info.mtime = int(info.mtime)
+    return info
+
+
+def write_archive(
+    srcDir: str,
+    outFile: str,
+    fmt: str,
+    jobs: int,
+    writeManifest: Optional[Callable[[Dict[str, str]], Any]] = None
+) -> None:
+    """
+    Write a directory into a compressed tarball, reading each file once.
+    Members are sorted and their owners and modes normalized, the output is the same for any number of jobs.
+    mtimes are kept unless SOURCE_DATE_EPOCH is set, which clamps them,
+    so the same dist only gives the same archive with it set.
+
+    :param srcDir: The directory to archive, it is stored under its own name
+    :param outFile: The output archive path
+    :param fmt: The archive format, one of ARCHIVE_FORMATS
+    :param jobs: Number of blocks to compress at once
+    :param writeManifest: Optional, writes the dist's manifest from the sha256 of each file, by relative path.
+        The files are hashed while they are archived, and the manifest is archived last
+    """
+    try:
+        mtime: Optional[int] = int(os.environ["SOURCE_DATE_EPOCH"])
+    except KeyError:
+        mtime = None
+
+    log(f"Writing archive - {outFile}")
+    start = time.perf_counter()
+    rootName = os.path.basename(os.path.normpath(srcDir))
+
+    tmpFile = f'{outFile}.tmp'
+    with open(tmpFile, mode='wb') as f:
+        sink = _ParallelCompressor(f, fmt, jobs)
+        # Stream mode, tarfile only ever writes forward
+        with tarfile.open(fileobj=sink, mode="w|", format=tarfile.PAX_FORMAT) as tar:  # type: ignore
+            hashes: Dict[str, str] = {}
+
+            def add(relPath: str) -> None:
+                path = os.path.join(srcDir, relPath)
+                info = _normalize(tar.gettarinfo(path, f'{rootName}/{relPath}'), mtime)
+                if info.isreg():
+                    with open(path, mode='rb') as inF:
+                        reader = _HashingReader(inF)
+                        tar.addfile(info, reader)
+                    hashes[relPath] = reader.hash.hexdigest()
+                elif info.islnk():
+                    # A hard link to a file archived earlier
+                    hashes[relPath] = hashes[info.linkname[len(rootName) + 1:]]
+                    tar.addfile(info)
+                else:
+                    tar.addfile(info)
+
+            for dirpath, dirnames, filenames in os.walk(srcDir):
+                dirnames.sort()
+                relDir = os.path.relpath(dirpath, srcDir)
+                for name in dirnames + sorted(filenames):
+                    relPath = os.path.normpath(os.path.join(relDir, name)).replace(os.sep, "/")
+                    if writeManifest is None or relPath != MANIFEST_FILE:
+                        add(relPath)
+
+            if writeManifest is not None:
+                writeManifest(hashes)
+                add(MANIFEST_FILE)
+        sink.close()
+    os.replace(tmpFile, outFile)
+
+    elapsed = time.perf_counter() - start
+    ratio = sink.compressedSize / sink.rawSize if sink.rawSize > 0 else 0
+    rawMiB = sink.rawSize / (1024 * 1024)
+    log(
+        f"Archive written in {elapsed:.1f}s - {rawMiB:.1f} MiB -> {sink.compressedSize / (1024 * 1024):.1f} MiB "
+        f"(ratio {ratio:.3f}, {rawMiB / max(elapsed, 0.001):.1f} MiB/s)"
+    )
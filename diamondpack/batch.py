@@ -0,0 +1,113 @@
+# Batch packing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from diamondpack.config import PackConfig
+from diamondpack.pack import DiamondPacker, SharedCache
+from diamondpack.log import log, logErr, logRaw, set_prefix
+
+
+def read_manifest(path: str) -> List[str]:
+    """
+    Read a batch manifest, one project directory per line.
+    Blank lines and lines starting with '#' are ignored, relative paths are relative to the manifest
+
+    :param path: The manifest file path
+    :return: The project directories
+    """
+    base = os.path.dirname(path)
+    out = []
+    with open(path, mode='r') as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0 or line.startswith("#"):
+                continue
+            out.append(os.path.join(base, line))
+    return out
+
+
+class ProjectResult:
+
+    def __init__(self, projectDir: str) -> None:
+        """
+        Outcome of packing a single project in a batch
+
+        :param projectDir: The project directory
+        """
+        self.projectDir = projectDir
+        self.name = projectDir
+        self.success = False
+        self.error: Optional[str] = None
+        # Pack time in seconds
+        self.elapsed = 0.0
+
+
+class BatchPacker:
+
+    def __init__(self, configs: List[PackConfig], workers: int, cacheDir: str) -> None:
+        """
+        Packs several projects concurrently, sharing built wheels, the pip cache and
+        prepared stdlib layers between them
+
+        :param configs: The parsed project configs
+        :param workers: Max number of projects to pack at once
+        :param cacheDir: Directory for the shared build products
+        """
+        self._configs = configs
+        self._workers = max(workers, 1)
+        self._shared = SharedCache(cacheDir)
+        self._packers = [DiamondPacker(x, self._shared) for x in configs]
+        self._results = [ProjectResult(x.project_dir) for x in configs]
+        for result, config in zip(self._results, configs):
+            result.name = config.name
+
+    def pack(self) -> bool:
+        """
+        Main entry point for batch packing.
+        All wheels are built first so projects can depend on each other,
+        then the projects are packed.
+
+        :return: True if every project packed successfully
+        """
+        jobs = list(zip(self._packers, self._results))
+        with ThreadPoolExecutor(max_workers=self._workers) as pool:
+            list(pool.map(self._build_wheel, jobs))
+            list(pool.map(self._pack_project, [x for x in jobs if x[1].error is None]))
+
+        self._report()
+        return all(x.success for x in self._results)
+
+    def _build_wheel(self, job: Tuple[DiamondPacker, ProjectResult]) -> None:
+        packer, result = job
+        set_prefix(f'{result.name}:wheel')
+        start = time.perf_counter()
+        try:
+            packer.build_wheel()
+        except Exception as err:
+            logErr(str(err))
+            result.error = str(err)
+        finally:
+            result.elapsed += time.perf_counter() - start
+            set_prefix("")
+
+    def _pack_project(self, job: Tuple[DiamondPacker, ProjectResult]) -> None:
+        packer, result = job
+        start = time.perf_counter()
+        try:
+            packer.pack(result.name)
+            result.success = True
+        except Exception as err:
+            logErr(f"{result.name}: {err}")
+            result.error = str(err)
+        finally:
+            result.elapsed += time.perf_counter() - start
+
+    def _report(self) -> None:
+        log("Batch results")
+        logRaw("\u250C")
+        for x in self._results:
+            status = "OK" if x.success else f"FAILED: {x.error}"
+            logRaw("\u2502", f"{x.elapsed:7.1f}s  {x.name} ({x.projectDir}) - {status}")
+        logRaw("\u2514")
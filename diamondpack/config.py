@@ -1,5 +1,9 @@
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 import enum
+import os
+
+# Where shared runtimes are installed, unless configured otherwise
+DEFAULT_RUNTIME_ROOT = "/opt/diamondpack/runtimes"
 
 
 class DPMode(enum.IntEnum):
@@ -7,6 +11,37 @@ class DPMode(enum.IntEnum):
     SCRIPT = enum.auto()
 
 
+class RuntimeProfile:
+
+    def __init__(self) -> None:
+        """
+        Interpreter and allocator settings applied by an app's launcher
+        """
+        # gc.set_threshold() arguments, None keeps python's defaults
+        self.gc_threshold: Optional[List[int]] = None
+        # gc.freeze() once the app's module is imported, so startup objects are never collected
+        self.gc_freeze = False
+        # MALLOC_ARENA_MAX for glibc malloc
+        self.malloc_arena_max: Optional[int] = None
+        # PYTHONHASHSEED, an int or "random"
+        self.hash_seed: Optional[str] = None
+        # -X options, e.g. "frozen_modules=on"
+        self.x_options: List[str] = []
+        # Library to LD_PRELOAD, relative to the dist, e.g. an allocator copied with data-globs
+        self.preload: Optional[str] = None
+
+    def get_env(self) -> Dict[str, str]:
+        """
+        Returns the environment variables the launcher sets for this profile, except LD_PRELOAD
+        """
+        env = {}
+        if self.malloc_arena_max is not None:
+            env["MALLOC_ARENA_MAX"] = str(self.malloc_arena_max)
+        if self.hash_seed is not None:
+            env["PYTHONHASHSEED"] = self.hash_seed
+        return env
+
+
 class App:
 
     def __init__(self, name: str, path: str, entry: Optional[str], icon: Optional[str]) -> None:
@@ -23,6 +58,8 @@ class App:
         self.path = path
         self.entry = entry
         self.icon = icon
+        # Settings from [tool.diamondpack.runtime.<name>]
+        self.profile = RuntimeProfile()
 
 
 class PackConfig:
@@ -44,6 +81,8 @@ class PackConfig:
         self.name = ""
         # Packaging mode
         self.mode: DPMode = DPMode.APP
+        # Project directory, all other paths are relative to it
+        self.project_dir = "."
         # Build directory
         self.build_dir = "build"
         # blacklisted modules to not remove .py files
@@ -54,10 +93,29 @@ class PackConfig:
         self.stdlib_blacklist: Optional[List[str]] = None
         # whether we should copy tk stuff
         self.include_tk = False
+        # extra Tcl encodings to copy, utf-8 and iso8859-1 are built in
+        self.tk_encodings: List[str] = []
+        # Tcl/Tk message catalogs to copy, e.g. "de" also copies "de_at"
+        self.tk_locales: List[str] = []
+        # copy the whole Tcl/Tk library instead, for apps using more of Tcl than tkinter needs
+        self.tk_full = False
         # list of file globs and dest dir to copy into the package
         self.data_globs: List[Tuple[str, str]] = []
         # enable debug logs
         self.debug_logs = False
+        # also write each app as a single self extracting executable
+        self.onefile = False
+        # record the files each app reads at startup, for the launcher to prefetch
+        self.readahead = False
+        # compressed archive format to write the dist to, if any
+        self.archive: Optional[str] = None
+        # leave the interpreter and stdlib out of the dist, and run from a shared runtime instead
+        self.shared_runtime = False
+        # directory containing the shared runtimes
+        self.runtime_root = DEFAULT_RUNTIME_ROOT
 
         # disable env cleaning and quicker building
         self.dev_mode = False
+        # max number of pack steps to run at once,
+        #  steps are mostly waiting on subprocesses and disk, same default as ThreadPoolExecutor
+        self.jobs = min(32, (os.cpu_count() or 1) + 4)
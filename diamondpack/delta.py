@@ -0,0 +1,335 @@
+# Dist manifests and delta updates
+import ctypes
+import errno
+import hashlib
+import json
+import os
+import shutil
+import stat
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from diamondpack.log import log
+
+MANIFEST_FILE = "diamondpack-manifest.json"
+
+# renameat2() arguments
+_AT_FDCWD = -100
+_RENAME_EXCHANGE = 2
+
+# Names inside a delta package
+_DELTA_INFO = "delta.json"
+_DELTA_FILES = "files/"
+
+
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, mode='rb') as f:
+        while True:
+            data = f.read(1 << 20)
+            if len(data) == 0:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+
+def _manifest_digest(files: Dict[str, Dict[str, Any]]) -> str:
+    """
+    Hash of a whole manifest, identifies a version of a dist
+    """
+    return hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()
+
+
+def write_manifest(distDir: str, name: str, jobs: int, hashes: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Hash every file in a dist and write the manifest into it
+
+    :param distDir: The dist directory
+    :param name: The dist name
+    :param jobs: Number of files to hash at once
+    :param hashes: Optional sha256 of files already read, by relative path, these aren't read again
+    :return: The manifest
+    """
+    log("Writing manifest")
+    files: Dict[str, Dict[str, Any]] = {}
+    regular: List[str] = []
+    for dirpath, dirnames, filenames in os.walk(distDir):
+        for fname in dirnames + filenames:
+            path = os.path.join(dirpath, fname)
+            relPath = os.path.relpath(path, distDir).replace(os.sep, "/")
+            if relPath == MANIFEST_FILE:
+                continue
+            if os.path.islink(path):
+                files[relPath] = {
+                    "link": os.readlink(path)
+                }
+            elif os.path.isfile(path):
+                regular.append(relPath)
+
+    digests = dict(hashes or {})
+    toHash = [x for x in regular if x not in digests]
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        digests.update(zip(toHash, pool.map(lambda x: _hash_file(os.path.join(distDir, x)), toHash)))
+
+    for relPath in regular:
+        path = os.path.join(distDir, relPath)
+        files[relPath] = {
+            "sha256": digests[relPath],
+            "size": os.path.getsize(path),
+            "mode": 0o755 if os.stat(path).st_mode & stat.S_IXUSR else 0o644,
+        }
+
+    files = dict(sorted(files.items()))
+    manifest = {
+        "name": name,
+        "digest": _manifest_digest(files),
+        "files": files,
+    }
+    with open(os.path.join(distDir, MANIFEST_FILE), mode='w') as f:
+        json.dump(manifest, f, indent=1)
+
+    return manifest
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    """
+    Load a manifest
+
+    :param path: A manifest file, or a dist directory containing one
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, MANIFEST_FILE)
+    try:
+        with open(path, mode='r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise RuntimeError(f"Cannot find manifest '{path}', the dist must be packed with this version of DiamondPack")
+
+
+def make_delta(oldPath: str, newDir: str, outFile: str) -> None:
+    """
+    Write a delta package with the files that differ between two dists
+
+    :param oldPath: The old dist directory, or just its manifest
+    :param newDir: The new dist directory
+    :param outFile: The output delta package
+    """
+    old = load_manifest(oldPath)
+    new = load_manifest(newDir)
+    oldFiles = old["files"]
+    newFiles = new["files"]
+
+    added: Dict[str, Dict[str, Any]] = {}
+    changed: Dict[str, Dict[str, Any]] = {}
+    for relPath, entry in newFiles.items():
+        if relPath not in oldFiles:
+            added[relPath] = entry
+        elif oldFiles[relPath] != entry:
+            # Keep the old entry, to verify the target before changing it
+            changed[relPath] = {
+                "old": oldFiles[relPath],
+                "new": entry,
+            }
+
+    removed: Dict[str, Dict[str, Any]] = {}
+    for relPath, entry in oldFiles.items():
+        if relPath not in newFiles:
+            removed[relPath] = entry
+
+    info = {
+        "from": {
+            "name": old["name"],
+            "digest": old["digest"],
+        },
+        "to": {
+            "name": new["name"],
+            "digest": new["digest"],
+        },
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+        "manifest": new,
+    }
+
+    log(f"Writing delta - {old['name']} -> {new['name']}")
+    log(f"{len(added)} added, {len(changed)} changed, {len(removed)} removed")
+    with zipfile.ZipFile(outFile, mode='w', compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr(_DELTA_INFO, json.dumps(info, indent=1))
+        for relPath in sorted(list(added.keys()) + list(changed.keys())):
+            if "link" in newFiles[relPath]:
+                continue
+            z.write(os.path.join(newDir, relPath), _DELTA_FILES + relPath)
+
+    fullSize = sum(x.get("size", 0) for x in newFiles.values())
+    deltaSize = os.path.getsize(outFile)
+    log(f"Delta written - {deltaSize / (1024 * 1024):.2f} MiB, full dist is {fullSize / (1024 * 1024):.2f} MiB")
+
+
+def _safe_path(relPath: str) -> bool:
+    """
+    Whether a path from a delta package stays inside the dist: relative, without a drive or '..'
+    """
+    parts = relPath.replace("\\", "/").split("/")
+    if os.path.isabs(relPath) or ":" in parts[0]:
+        return False
+    return all(x not in ["", ".", ".."] for x in parts)
+
+
+def _is_inside(path: str, root: str) -> bool:
+    """
+    Whether a path resolves to somewhere under root, following symlinks
+    """
+    realRoot = os.path.realpath(root)
+    return os.path.commonpath([os.path.realpath(path), realRoot]) == realRoot
+
+
+def _check_file(path: str, entry: Dict[str, Any]) -> bool:
+    """
+    Whether a file on disk matches its manifest entry
+    """
+    if "link" in entry:
+        return os.path.islink(path) and os.readlink(path) == entry["link"]
+    return os.path.isfile(path) and _hash_file(path) == entry["sha256"]
+
+
+def _stage_tree(srcDir: str, stageDir: str, skip: set) -> None:
+    """
+    Recreate a dist with hard links, so unchanged files aren't copied
+    """
+    for dirpath, dirnames, filenames in os.walk(srcDir):
+        relDir = os.path.relpath(dirpath, srcDir)
+        os.makedirs(os.path.join(stageDir, relDir), exist_ok=True)
+        for fname in dirnames + filenames:
+            path = os.path.join(dirpath, fname)
+            relPath = os.path.normpath(os.path.join(relDir, fname)).replace(os.sep, "/")
+            if relPath in skip:
+                continue
+            dst = os.path.join(stageDir, relPath)
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), dst)
+            elif os.path.isfile(path):
+                try:
+                    os.link(path, dst)
+                except OSError:
+                    shutil.copy2(path, dst)
+
+
+def _prune_dirs(root: str, relDir: str) -> None:
+    """
+    Remove a directory and its parents, up to the root, while they are empty
+    """
+    while len(relDir) > 0:
+        path = os.path.join(root, relDir)
+        if not os.path.isdir(path) or os.path.islink(path) or len(os.listdir(path)) > 0:
+            return
+        os.rmdir(path)
+        relDir = os.path.dirname(relDir)
+
+
+def _exchange_dirs(a: str, b: str) -> bool:
+    """
+    Atomically swap two directories with renameat2(RENAME_EXCHANGE), Linux only
+
+    :return: False if the platform or filesystem doesn't support it
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    libc = ctypes.CDLL(None, use_errno=True)
+    try:
+        renameat2 = libc.renameat2
+    except AttributeError:
+        # glibc before 2.28
+        return False
+    if renameat2(_AT_FDCWD, os.fsencode(a), _AT_FDCWD, os.fsencode(b), _RENAME_EXCHANGE) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err in [errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP]:
+        return False
+    raise OSError(err, os.strerror(err), a)
+
+
+def apply_delta(deltaFile: str, targetDir: str) -> None:
+    """
+    Update an installed dist with a delta package.
+    The update is built next to the dist and atomically swapped with it where the filesystem supports it,
+    the installed dist is only touched once everything has been verified.
+
+    :param deltaFile: The delta package
+    :param targetDir: The installed dist directory
+    """
+    targetDir = os.path.normpath(targetDir)
+    current = load_manifest(targetDir)
+
+    with zipfile.ZipFile(deltaFile, mode='r') as z:
+        info = json.loads(z.read(_DELTA_INFO))
+
+        if current["digest"] != info["from"]["digest"]:
+            raise RuntimeError(
+                f"Delta is for '{info['from']['name']}' ({info['from']['digest'][:16]}), "
+                f"but '{targetDir}' is '{current['name']}' ({current['digest'][:16]})"
+            )
+
+        for relPath in [*info["added"].keys(), *info["changed"].keys(), *info["removed"].keys()]:
+            if not _safe_path(relPath):
+                raise RuntimeError(f"Invalid path in delta package: {relPath}")
+
+        log(f"Verifying - {targetDir}")
+        for relPath, entry in info["removed"].items():
+            if not _check_file(os.path.join(targetDir, relPath), entry):
+                raise RuntimeError(f"Installed file was modified: {relPath}")
+        for relPath, entry in info["changed"].items():
+            if not _check_file(os.path.join(targetDir, relPath), entry["old"]):
+                raise RuntimeError(f"Installed file was modified: {relPath}")
+
+        stageDir = f'{targetDir}.dp-update'
+        oldDir = f'{targetDir}.dp-old'
+        for x in [stageDir, oldDir]:
+            if os.path.exists(x):
+                shutil.rmtree(x)
+
+        log(f"Staging update - {info['to']['name']}")
+        skip = set(info["removed"].keys()) | set(info["changed"].keys()) | {MANIFEST_FILE}
+        _stage_tree(targetDir, stageDir, skip)
+
+        newEntries = dict(info["added"])
+        for relPath, entry in info["changed"].items():
+            newEntries[relPath] = entry["new"]
+        for relPath, entry in newEntries.items():
+            dst = os.path.join(stageDir, relPath)
+            # e.g. a file below a symlink the delta added, pointing out of the dist
+            if not _is_inside(os.path.dirname(dst), stageDir):
+                shutil.rmtree(stageDir)
+                raise RuntimeError(f"Invalid path in delta package: {relPath}")
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if "link" in entry:
+                os.symlink(entry["link"], dst)
+                continue
+            with z.open(_DELTA_FILES + relPath) as src, open(dst, mode='wb') as out:
+                shutil.copyfileobj(src, out)
+            os.chmod(dst, entry["mode"])
+            if not _check_file(dst, entry):
+                shutil.rmtree(stageDir)
+                raise RuntimeError(f"Hash mismatch in delta package: {relPath}")
+
+        for relPath in info["removed"].keys():
+            _prune_dirs(stageDir, os.path.dirname(relPath))
+
+        with open(os.path.join(stageDir, MANIFEST_FILE), mode='w') as f:
+            json.dump(info["manifest"], f, indent=1)
+
+    if _exchange_dirs(stageDir, targetDir):
+        # The old dist is now in the staging directory
+        shutil.rmtree(stageDir)
+    else:
+        # Not atomic, the dist is missing between the renames, and left in oldDir if interrupted
+        os.rename(targetDir, oldDir)
+        try:
+            os.rename(stageDir, targetDir)
+        except OSError:
+            os.rename(oldDir, targetDir)
+            raise
+        shutil.rmtree(oldDir)
+
+    log(f"Updated - {targetDir} is now {info['to']['name']}")
@@ -1,4 +1,5 @@
 import sys
+import threading
 import colorama
 
 colorama.just_fix_windows_console()
@@ -9,18 +10,56 @@ OFF = "\x1B[0m"
 GRN = "\x1B[92;1m"
 DIAM = "\u25C6"
 
+# Serializes output from concurrent tasks so lines don't interleave
+_LOCK = threading.Lock()
+# Per thread prefix, set by the task scheduler
+_LOCAL = threading.local()
+
+
+def set_prefix(prefix: str) -> None:
+    """
+    Set the prefix for all output from the current thread
+    """
+    _LOCAL.prefix = prefix
+
+
+def get_prefix() -> str:
+    return getattr(_LOCAL, "prefix", "")
+
+
+def _tag() -> str:
+    prefix = get_prefix()
+    if len(prefix) == 0:
+        return ""
+    return f'[{prefix}] '
+
+
 def logErr(msg) -> None:
-    if IS_TERMINAL:
-        print(f'{ERR}{DIAM} Error: {msg}{OFF}')
-    else:
-        print(f'{DIAM} Error: {msg}')
-    sys.stdout.flush()
+    with _LOCK:
+        if IS_TERMINAL:
+            print(f'{ERR}{DIAM} {_tag()}Error: {msg}{OFF}')
+        else:
+            print(f'{DIAM} {_tag()}Error: {msg}')
+        sys.stdout.flush()
 
 
 def log(*msg: str) -> None:
     txt = " ".join(msg)
-    if IS_TERMINAL:
-        print(f'{GRN}{DIAM} {txt}{OFF}')
-    else:
-        print(f'{DIAM} {txt}')
-    sys.stdout.flush()
+    with _LOCK:
+        if IS_TERMINAL:
+            print(f'{GRN}{DIAM} {_tag()}{txt}{OFF}')
+        else:
+            print(f'{DIAM} {_tag()}{txt}')
+        sys.stdout.flush()
+
+
+def logRaw(box: str, msg: str = "") -> None:
+    """
+    Print a line of subprocess or listing output
+
+    :param box: The box drawing character to start the line with
+    :param msg: The line
+    """
+    with _LOCK:
+        print(f'  {box} {_tag()}{msg.rstrip()}')
+        sys.stdout.flush()
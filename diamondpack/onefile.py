@@ -0,0 +1,99 @@
+# Single file executables
+import hashlib
+import os
+import shutil
+import stat
+import struct
+from typing import BinaryIO, Set
+
+# Must match the launcher template
+ONEFILE_MAGIC = b"DPONEFIL"
+
+
+class EntryType:
+    FILE = 0
+    SYMLINK = 1
+    DIR = 2
+    END = 255
+
+
+class _HashWriter:
+
+    def __init__(self, out: BinaryIO) -> None:
+        """
+        Writes to a file while hashing everything written
+        """
+        self._out = out
+        self.hash = hashlib.sha256()
+
+    def write(self, data: bytes) -> None:
+        self._out.write(data)
+        self.hash.update(data)
+
+
+def _write_entry(out: _HashWriter, entryType: int, mode: int, relPath: str, size: int) -> None:
+    path = relPath.encode()
+    out.write(struct.pack("<BII", entryType, mode, len(path)))
+    out.write(path)
+    out.write(struct.pack("<Q", size))
+
+
+def write_payload(srcDir: str, payloadFile: str, exclude: Set[str]) -> str:
+    """
+    Write every file under a directory into a payload the launcher can extract.
+    Entries are written in sorted order so the payload, and its hash, are reproducible
+
+    :param srcDir: The directory to pack
+    :param payloadFile: The output payload path
+    :param exclude: Paths relative to srcDir to leave out
+    :return: The sha256 hex digest of the payload
+    """
+    with open(payloadFile, mode='wb') as f:
+        out = _HashWriter(f)
+        for dirpath, dirnames, filenames in os.walk(srcDir):
+            dirnames.sort()
+            relDir = os.path.relpath(dirpath, srcDir)
+            for name in dirnames + sorted(filenames):
+                path = os.path.join(dirpath, name)
+                relPath = os.path.normpath(os.path.join(relDir, name)).replace(os.sep, "/")
+                if relPath in exclude:
+                    continue
+                if os.path.islink(path):
+                    target = os.readlink(path).encode()
+                    _write_entry(out, EntryType.SYMLINK, 0o777, relPath, len(target))
+                    out.write(target)
+                elif os.path.isdir(path):
+                    _write_entry(out, EntryType.DIR, 0o755, relPath, 0)
+                else:
+                    mode = stat.S_IMODE(os.stat(path).st_mode)
+                    _write_entry(out, EntryType.FILE, mode, relPath, os.path.getsize(path))
+                    with open(path, mode='rb') as inF:
+                        while True:
+                            data = inF.read(1 << 20)
+                            if len(data) == 0:
+                                break
+                            out.write(data)
+        out.write(struct.pack("<B", EntryType.END))
+
+    return out.hash.hexdigest()
+
+
+def write_onefile(launcher: str, payloadFile: str, payloadHash: str, outFile: str) -> None:
+    """
+    Append a payload to a launcher executable
+
+    :param launcher: The launcher built with ONEFILE enabled
+    :param payloadFile: The payload from write_payload()
+    :param payloadHash: The payload's hash
+    :param outFile: The output executable path
+    """
+    with open(outFile, mode='wb') as out:
+        with open(launcher, mode='rb') as f:
+            shutil.copyfileobj(f, out)
+        offset = out.tell()
+        with open(payloadFile, mode='rb') as f:
+            shutil.copyfileobj(f, out)
+        out.write(struct.pack("<Q", offset))
+        out.write(payloadHash.encode())
+        out.write(ONEFILE_MAGIC)
+    os.chmod(outFile, 0o755)
@@ -3,27 +3,55 @@ import sys
 import os
 import shutil
 import subprocess as sp
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional, Set, Tuple
 import glob
 import re
 import sysconfig
+import functools
+import hashlib
+import json
+import threading
+import marshal
+import importlib.util
+import types
+import platform
 
 from diamondpack.config import App, PackConfig, DPMode
-from diamondpack.log import log, logErr
+from diamondpack.log import log, logErr, logRaw
+from diamondpack.tasks import TaskGraph
+from diamondpack.onefile import write_payload, write_onefile
+from diamondpack.archive import write_archive
+from diamondpack.delta import write_manifest
+from diamondpack.readahead import trace_startup_files, write_readahead
 
-_IS_WINDOWS = sys.platform == 'win32'
+IS_WINDOWS = sys.platform == 'win32'
 
 _CMD_REPLACE = '@@COMMAND@@'
 _PY_REPLACE = '@@PYTHON@@'
 _ICON_REPLACE = "@@ICON@@"
+_NAME_REPLACE = "@@NAME@@"
+_APP_REPLACE = "@@APP@@"
+_ENV_REPLACE = "@@ENV@@"
+_PRELOAD_REPLACE = "@@PRELOAD@@"
+_RUNTIME_REPLACE = "@@RUNTIME@@"
+_RUNTIME_KEY_REPLACE = "@@RUNTIMEKEY@@"
+_RUNTIME_ROOT_REPLACE = "@@RUNTIMEROOT@@"
 
 _PACKAGE_DIR = os.path.split(__file__)[0]
-_TEMPLATE_DIR = os.path.join(_PACKAGE_DIR, "app-templates")
+TEMPLATE_DIR = os.path.join(_PACKAGE_DIR, "app-templates")
 
 _REPLACE_RE = re.compile("@@[A-Z]+@@")
 
 _PY_VERSION = f'python{sys.version_info.major}.{sys.version_info.minor}'
 
+# Written last into a shared runtime, holds its key. Must match the launcher templates
+RUNTIME_KEY_FILE = "diamondpack-runtime"
+# Overrides the runtime root the launchers were packed with
+RUNTIME_ROOT_ENV = "DIAMONDPACK_RUNTIME_ROOT"
+# With a shared runtime the dist's site-packages is only on PYTHONPATH, and site doesn't process .pth files there.
+#  Run before the app, so they apply like with the dist's own interpreter
+SITE_SETUP = "import os, site; site.addsitedir(os.environ['PYTHONPATH'])"
+
 MINIMUM_STDLIB = [
     "encodings",
     "linecache",
@@ -45,6 +73,25 @@ TKINTER_LIBS = [
     "tkinter",
 ]
 
+# Removed from a venv's executable directory, the standalone python executable is copied in instead
+VENV_BIN_REMOVED = ["*ctivate*", "pip*", "python*"]
+# Stdlib sources that are kept, not replaced with their bytecode
+STDLIB_CACHE_BLOCK = ["encodings"]
+# The shared libraries copied from the python installation on Windows
+WINDOWS_LIBS = ["*.dll", os.path.join("DLLs", "*.dll"), os.path.join("DLLs", "*.pyd")]
+# The Tcl/Tk script libraries copied from the python installation's tcl directory on Windows
+WINDOWS_TCL_TK = ["tcl8.6", "tk8.6"]
+
+
+def _render(template: str, replacements: Dict[str, str]) -> str:
+    """
+    Returns the contents of the template with values replaced according to the map
+    :param template: The template file path
+    :param replacements: Dict of replacement values like @@KEY@@: "value"
+    """
+    with open(os.path.join(TEMPLATE_DIR, template), mode='r') as inF:
+        return _REPLACE_RE.sub(lambda x: replacements[x.group(0)], inF.read())
+
 
 def _do_replace(template: str, outfile: str, replacements: Dict[str, str]) -> None:
     """
@@ -53,20 +100,21 @@ def _do_replace(template: str, outfile: str, replacements: Dict[str, str]) -> No
     :param outfile: The output file path
     :param replacements: Dict of replacement values like @@KEY@@: "value"
     """
-    with open(outfile, mode='w') as outF, open(os.path.join(_TEMPLATE_DIR, template), mode='r') as inF:
-        for line in inF:
-            line = _REPLACE_RE.sub(lambda x: replacements[x.group(0)], line)
-            outF.write(line)
+    with open(outfile, mode='w') as outF:
+        outF.write(_render(template, replacements))
 
 
 def execute(args: List[str], env=None) -> int:
-    print("  \u250C")
-    run = sp.Popen(args, env, stdout=sp.PIPE, stderr=sp.STDOUT, universal_newlines=True)  # type: ignore
+    """
+    Run a subprocess, printing its output prefixed with the current task name.
+    Safe to call from several tasks at once.
+    """
+    logRaw("\u250C")
+    run = sp.Popen(args, env=env, stdout=sp.PIPE, stderr=sp.STDOUT, universal_newlines=True)
     if run.stdout is not None:
         for line in iter(run.stdout.readline, ''):
-            print("  \u2502", line, end='')
-    print("  \u2514")
-    sys.stdout.flush()
+            logRaw("\u2502", line)
+    logRaw("\u2514")
 
     return run.wait()
 
@@ -76,10 +124,14 @@ LIB_RE = re.compile(r'[a-zA-Z._0-9/\-+]+ => (?P<filename>[a-zA-Z._0-9\-/\\]+) \(
 LINUX_LIB_BLACKLIST = ["libc.so", "libm.so"]
 
 
-def _copy_linux_required_libs(target: str, outDir: str):
+def linux_required_libs(target: str) -> List[str]:
+    """
+    Returns the shared libraries a binary links to, except the blacklisted system ones
+    """
     out = sp.run(["ldd", target], capture_output=True)
     libStr = out.stdout.decode()
     libList = [x.strip() for x in libStr.split("\n")]
+    files = []
     for x in libList:
         m = LIB_RE.fullmatch(x)
         if m is None:
@@ -87,83 +139,713 @@ def _copy_linux_required_libs(target: str, outDir: str):
         file = m.group('filename')
         skip = False
         for ignore in LINUX_LIB_BLACKLIST:
-            if file.startswith(ignore):
+            if os.path.basename(file).startswith(ignore):
                 skip = True
                 break
         if skip:
             continue
+        files.append(file)
+    return files
+
+
+def _copy_linux_required_libs(target: str, outDir: str):
+    for file in linux_required_libs(target):
         if not os.path.exists(os.path.join(outDir, os.path.basename(file))):
             shutil.copy(file, outDir)
 
 
-class DiamondPacker:
+def _replace_filename(code: types.CodeType, filename: str) -> types.CodeType:
+    consts = tuple(_replace_filename(x, filename) if isinstance(x, types.CodeType) else x for x in code.co_consts)
+    return code.replace(co_filename=filename, co_consts=consts)
+
+
+def sourceless_pyc(data: bytes, sourceName: str) -> bytes:
+    """
+    Convert the contents of a cached .pyc to be loaded without its source.
+    The build path embedded in the code is replaced with the path relative to the lib root,
+    and the unused source timestamp is cleared, so the same source always gives the same file
+
+    :param data: The contents of the .pyc from __pycache__
+    :param sourceName: The source path to embed
+    """
+    # header is the magic number, flags, and the source mtime and size or hash
+    code = _replace_filename(marshal.loads(data[16:]), sourceName)
+    return data[:4] + bytes(12) + marshal.dumps(code)
+
+
+def _write_sourceless_pyc(cacheFile: str, outFile: str, sourceName: str) -> None:
+    """
+    Rewrite a cached .pyc to be loaded without its source
+
+    :param cacheFile: The .pyc from __pycache__
+    :param outFile: The output .pyc path
+    :param sourceName: The source path to embed
+    """
+    with open(cacheFile, mode='rb') as f:
+        data = f.read()
+    with open(outFile, mode='wb') as f:
+        f.write(sourceless_pyc(data, sourceName))
+
+
+def cache_block_re(blacklist: List[str]) -> Optional[re.Pattern]:
+    """
+    Returns the pattern matching the sources that keep their source, or None if all are replaced
+
+    :param blacklist: The regexes, e.g. the config's cache_block
+    """
+    if len(blacklist) == 0:
+        return None
+    return re.compile("|".join(blacklist))
+
+
+def _keep_cache(filename: str, root: str) -> None:
+    """
+    Replace a .py file with its cached bytecode, if there is any
+
+    :param filename: The .py file
+    :param root: The folder on the python path containing the file
+    """
+    folder, fname = os.path.split(filename)
+    fname = os.path.splitext(fname)[0]
+    # Exact name, a glob would also match e.g. wheel_legacy.pyc for wheel.py
+    cacheFile = importlib.util.cache_from_source(filename)
+    if not os.path.isfile(cacheFile):
+        return
+    # remove the original file
+    os.remove(filename)
+    # replace it with the cached file
+    sourceName = os.path.relpath(filename, root).replace(os.sep, "/")
+    _write_sourceless_pyc(cacheFile, os.path.join(folder, fname + ".pyc"), sourceName)
+    os.remove(cacheFile)
+
+
+def _swap_stdlib_cache(libDir: str) -> None:
+    """
+    Replace stdlib sources with their bytecode
+    """
+    BL_RE = cache_block_re(STDLIB_CACHE_BLOCK)
+
+    for xxx in glob.glob(os.path.join(libDir, "*/**.py"), recursive=True):
+        if BL_RE is not None and BL_RE.search(xxx) is not None:
+            continue
+        _keep_cache(xxx, libDir)
+
+
+def stdlib_selection(config: PackConfig) -> Set[str]:
+    """
+    The stdlib modules and packages copied when the config has no stdlib blacklist
+
+    :param config: The pack config
+    """
+    libs = set(MINIMUM_STDLIB)
+    if config.include_tk:
+        libs.update(TKINTER_LIBS)
+    if config.stdlib_whitelist is not None:
+        libs.update(config.stdlib_whitelist)
+    return libs
+
+
+def _copy_stdlib(config: PackConfig, libDir: str) -> None:
+    """
+    Copy the configured selection of the stdlib
+
+    :param config: The pack config
+    :param libDir: The destination lib directory
+    """
+    globalStdlib = sysconfig.get_path('stdlib')
+
+    if config.stdlib_blacklist is not None:
+        shutil.copytree(
+            globalStdlib,
+            libDir,
+            # site-packages is filled by pip, possibly at the same time as this copy
+            ignore=shutil.ignore_patterns("site-packages", *config.stdlib_blacklist),
+            dirs_exist_ok=True
+        )
+    else:
+        for x in stdlib_selection(config):
+            lib = os.path.join(globalStdlib, x)
+            if os.path.isdir(lib):
+                shutil.copytree(lib, os.path.join(libDir, x), dirs_exist_ok=True)
+            else:
+                lib += ".py"
+                if os.path.isfile(lib):
+                    shutil.copy(
+                        lib,
+                        libDir,
+                    )
+
+
+def _find_tcl_tk() -> Tuple[str, str]:
+    """
+    Find the Tcl and Tk script libraries the running interpreter's tkinter uses
+
+    :return: The Tcl and Tk library directories
+    """
+    # Only imported when needed, loading Tcl/Tk is slow
+    import tkinter
+
+    tcl = tkinter.Tcl()
+    tclLib = str(tcl.eval("info library"))
+    tkName = f'tk{tkinter.TkVersion}'
+    # Tk can't be loaded without a display, so look where Tk itself would
+    candidates = [os.environ.get("TK_LIBRARY", ""), os.path.join(os.path.dirname(tclLib), tkName)]
+    candidates.extend(os.path.join(x, tkName) for x in tcl.splitlist(tcl.eval("set auto_path")))
+    for x in candidates:
+        if len(x) > 0 and os.path.isfile(os.path.join(x, "tk.tcl")):
+            return tclLib, x
+    raise RuntimeError(f"Cannot find the Tk library '{tkName}' for Tcl library '{tclLib}'")
+
+
+def _locale_match(filename: str, locales: List[str]) -> bool:
+    """
+    Whether a message catalog is for one of the locales, "de" also selects "de_at"
+    """
+    name = os.path.splitext(filename)[0].lower()
+    return any(name == x.lower() or name.startswith(x.lower() + "_") for x in locales)
+
+
+def _find_tcl_modules(tclLib: str) -> Tuple[Optional[str], str]:
+    """
+    Find the Tcl modules (.tm files, e.g. msgcat) that go with a Tcl library.
+    Tcl looks for them in tcl8/8.N next to its library, some distros keep them in the library instead
+
+    :param tclLib: The Tcl library directory
+    :return: The modules directory, or None, and where it goes relative to the library's parent
+    """
+    major, _, minor = os.path.basename(tclLib)[len("tcl"):].partition(".")
+    inLib = os.path.join(tclLib, f'tcl{major}')
+    if os.path.isdir(inLib):
+        # Flattened, like Debian's /usr/share/tcltk/tcl8.6/tcl8
+        return inLib, f'tcl{major}/{major}.{minor}'
+    nextToLib = os.path.join(os.path.dirname(tclLib), f'tcl{major}')
+    if os.path.isdir(nextToLib):
+        return nextToLib, f'tcl{major}'
+    return None, f'tcl{major}'
+
+
+def _keep_tcl_file(config: PackConfig, relPath: str) -> bool:
+    """
+    Whether a Tcl library file is needed: the init scripts, and the selected encodings and clock locales
+    """
+    if config.tk_full:
+        return True
+    parts = relPath.split("/")
+    if len(parts) == 1:
+        return parts[0].endswith(".tcl") or parts[0] == "tclIndex"
+    if len(parts) == 2 and parts[0] == "encoding":
+        return os.path.splitext(parts[1])[0] in config.tk_encodings
+    return len(parts) == 2 and parts[0] == "msgs" and _locale_match(parts[1], config.tk_locales)
+
+
+def _keep_tcl_module(config: PackConfig, relPath: str) -> bool:
+    """
+    Whether a Tcl module is needed: msgcat, for Tk's dialogs
+    """
+    return config.tk_full or relPath.split("/")[-1].startswith("msgcat-")
+
+
+def _keep_tk_file(config: PackConfig, relPath: str) -> bool:
+    """
+    Whether a Tk library file is needed: the init scripts, the ttk themes, and the selected locales
+    """
+    if config.tk_full:
+        return True
+    parts = relPath.split("/")
+    if len(parts) == 1:
+        return parts[0].endswith(".tcl") or parts[0] == "tclIndex"
+    if parts[0] == "ttk":
+        return True
+    return len(parts) == 2 and parts[0] == "msgs" and _locale_match(parts[1], config.tk_locales)
+
+
+def tcl_tk_dirs() -> List[Tuple[str, str, Callable[[PackConfig, str], bool]]]:
+    """
+    The Tcl/Tk directories to copy, filtered, into an environment's lib directory
+
+    :return: The source directory, its destination relative to the lib directory, and its filter
+    """
+    tclLib, tkLib = _find_tcl_tk()
+    out = [(tclLib, os.path.basename(tclLib), _keep_tcl_file), (tkLib, os.path.basename(tkLib), _keep_tk_file)]
+    modules, modulesDst = _find_tcl_modules(tclLib)
+    if modules is not None:
+        out.append((modules, modulesDst, _keep_tcl_module))
+    return out
+
+
+def _copy_filtered(srcDir: str, dstDir: str, keep: Callable[[str], bool]) -> Tuple[int, int]:
+    """
+    Copy the files of a directory that pass a filter
+
+    :param srcDir: The source directory
+    :param dstDir: The destination directory
+    :param keep: Called with each file path relative to srcDir, using forward slashes
+    :return: The copied and the total size in bytes
+    """
+    copied = 0
+    total = 0
+    for dirpath, _, filenames in os.walk(srcDir):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            relPath = os.path.relpath(path, srcDir).replace(os.sep, "/")
+            size = os.path.getsize(path)
+            total += size
+            if not keep(relPath):
+                continue
+            dst = os.path.join(dstDir, relPath)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy(path, dst)
+            copied += size
+    return copied, total
+
+
+def windows_libs() -> List[str]:
+    """
+    The shared libraries python needs on Windows, from its installation
+    """
+    libpath = sysconfig.get_config_var("installed_base")
+    return [x for pattern in WINDOWS_LIBS for x in glob.glob(os.path.join(libpath, pattern))]
+
+
+def _copy_libs(config: PackConfig, venvDir: str, venvBin: str, venvLib: str) -> None:
+    """
+    Copy the shared libraries python needs into an environment
+
+    :param config: The pack config
+    :param venvDir: The environment root
+    :param venvBin: The environment's executable directory
+    :param venvLib: The environment's lib directory
+    """
+    if IS_WINDOWS:
+        libpath = sysconfig.get_config_var("installed_base")
+        for file in windows_libs():
+            fname = os.path.split(file)[1]
+            shutil.copyfile(file, os.path.join(venvLib, fname))
+        if config.include_tk:
+            for name in WINDOWS_TCL_TK:
+                shutil.copytree(os.path.join(libpath, "tcl", name), os.path.join(venvDir, "Lib", name))
+    else:
+        # _copy_linux_required_libs(python_exec, venvBin)
+
+        if config.include_tk:
+            spec = importlib.util.find_spec("_tkinter")
+            if spec is None or spec.origin is None:
+                raise RuntimeError("Cannot find _tkinter, the python used to pack was built without tkinter")
+            os.makedirs(os.path.join(venvLib, "lib-dynload"), exist_ok=True)
+            # Also brings in libtcl and libtk
+            _copy_linux_required_libs(spec.origin, venvBin)
+            shutil.copy(spec.origin, os.path.join(venvLib, "lib-dynload"))
+
+            # Tcl looks for its library in ../lib next to the executable, and Tk and the modules next to Tcl's
+            copied = 0
+            total = 0
+            for src, dstRel, keep in tcl_tk_dirs():
+                dst = os.path.join(venvDir, 'lib', dstRel)
+                sizes = _copy_filtered(src, dst, functools.partial(keep, config))
+                copied += sizes[0]
+                total += sizes[1]
+            log(
+                f"Copied Tcl/Tk - {copied / (1024 * 1024):.2f} of {total / (1024 * 1024):.2f} MiB, "
+                f"saved {(total - copied) / (1024 * 1024):.2f} MiB"
+            )
+
+
+def _copy_python(venvBin: str) -> None:
+    """
+    Copy the python executable into an environment
+
+    :param venvBin: The environment's executable directory
+    """
+    # Copy the python executable
+    python_exec = sys.executable
+    newExec = os.path.join(venvBin, "python")
+    if IS_WINDOWS:
+        newExec += ".exe"
+        python_w = os.path.join(sysconfig.get_config_var("installed_base"), f"pythonw.exe")
+        new_python_w = os.path.join(venvBin, "pythonw.exe")
+        shutil.copyfile(python_w, new_python_w)
+        python_exec = os.path.join(sysconfig.get_config_var("installed_base"), f"python.exe")
+    shutil.copyfile(python_exec, newExec)
+    # Set permissions
+    os.chmod(newExec, 0o755)
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """
+    Hard link a file, falling back to a copy across filesystems
+    """
+    try:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _stdlib_options(config: PackConfig) -> list:
+    """
+    Everything that changes the contents of a prepared stdlib
+    """
+    return [
+        sys.version,
+        config.stdlib_blacklist,
+        config.stdlib_whitelist,
+        config.include_tk,
+        config.tk_encodings,
+        config.tk_locales,
+        config.tk_full,
+    ]
+
+
+def get_runtime_key(config: PackConfig) -> str:
+    """
+    Identifies the shared runtime a dist needs, from the interpreter build and the stdlib options
+
+    :param config: The pack config
+    :return: The sha256 hex digest of the options
+    """
+    options = [sys.platform, platform.machine()] + _stdlib_options(config)
+    return hashlib.sha256(json.dumps(options).encode()).hexdigest()
+
+
+def get_runtime_name(config: PackConfig) -> str:
+    """
+    Directory name of the shared runtime a dist needs
+    """
+    version = sys.version_info
+    return f'python{version.major}.{version.minor}.{version.micro}-{get_runtime_key(config)[:16]}'
+
+
+def get_runtime_root(config: PackConfig) -> str:
+    """
+    Directory containing the shared runtimes, the environment overrides the config like in the launchers
+    """
+    root = os.environ.get(RUNTIME_ROOT_ENV, "")
+    if len(root) > 0:
+        return root
+    return config.runtime_root
+
+
+def _check_runtime(runtimeDir: str, key: str) -> bool:
+    try:
+        with open(os.path.join(runtimeDir, RUNTIME_KEY_FILE), mode='r') as f:
+            return f.read().strip() == key
+    except FileNotFoundError:
+        return False
+
+
+def build_runtime(config: PackConfig, root: str) -> str:
+    """
+    Install the shared runtime for the config's interpreter and stdlib options.
+    The runtime is built in a temporary directory and renamed into place,
+    so launchers never see a partial runtime
+
+    :param config: The pack config
+    :param root: Directory containing the shared runtimes
+    :return: The runtime directory
+    """
+    if IS_WINDOWS:
+        raise RuntimeError("Shared runtimes are only supported on Linux")
+
+    key = get_runtime_key(config)
+    runtimeDir = os.path.join(root, get_runtime_name(config))
+    if _check_runtime(runtimeDir, key):
+        log(f"Runtime already installed - {runtimeDir}")
+        return runtimeDir
+    if os.path.exists(runtimeDir):
+        raise RuntimeError(f"'{runtimeDir}' exists but isn't a complete runtime, remove it first")
+
+    log(f"Building runtime - {runtimeDir}")
+    tmpDir = f'{runtimeDir}.{os.getpid()}.tmp'
+    if os.path.exists(tmpDir):
+        shutil.rmtree(tmpDir)
+    binDir = os.path.join(tmpDir, "bin")
+    libDir = os.path.join(tmpDir, "lib", _PY_VERSION)
+    os.makedirs(binDir)
+    os.makedirs(libDir)
+
+    log("Copying stdlib")
+    _copy_stdlib(config, libDir)
+    _swap_stdlib_cache(libDir)
+    log("Copying required libraries")
+    _copy_libs(config, tmpDir, binDir, libDir)
+    log("Copying python executable")
+    _copy_python(binDir)
+
+    with open(os.path.join(tmpDir, RUNTIME_KEY_FILE), mode='w') as f:
+        f.write(key + "\n")
+
+    try:
+        os.rename(tmpDir, runtimeDir)
+    except OSError:
+        shutil.rmtree(tmpDir)
+        # Another install finished first
+        if not _check_runtime(runtimeDir, key):
+            raise
+
+    log(f"Runtime installed - {runtimeDir}")
+    return runtimeDir
+
+
+def find_project_wheel(config: PackConfig) -> str:
+    """
+    Find the project's wheel built into the dist directory
+
+    :param config: The pack config
+    :return: The wheel path
+    """
+    distDir = os.path.join(config.project_dir, "dist")
+    wheelName = f'{config.projectName.replace("-", "_")}-{config.version}*.whl'
+    wheelGlob = os.path.join(distDir, wheelName)
+
+    files = glob.glob(wheelGlob)
+    if len(files) != 1:
+        raise RuntimeError(f"Error finding exact wheel (glob='{wheelGlob}'), potentials: {files}")
+
+    return files[0]
+
+
+class SharedCache:
+
+    def __init__(self, cacheDir: str) -> None:
+        """
+        Build products shared between several packers, e.g. during batch packing
+
+        :param cacheDir: Directory to store shared files in
+        """
+        self.cacheDir = cacheDir
+        # Built project wheels, used to resolve dependencies between packed projects
+        self.wheelDir = os.path.join(cacheDir, "wheels")
+        # Shared pip download cache
+        self.pipCacheDir = os.path.join(cacheDir, "pip")
+        self._lock = threading.Lock()
+        self._layerLocks: Dict[str, threading.Lock] = {}
+        os.makedirs(self.wheelDir, exist_ok=True)
+        os.makedirs(self.pipCacheDir, exist_ok=True)
+
+    def get_stdlib_layer(self, config: PackConfig) -> str:
+        """
+        Returns a prepared stdlib directory for the config's stdlib options, building it if needed.
+        Packers with the same options share a single layer.
+
+        :param config: The pack config
+        :return: The layer's lib directory
+        """
+        options = _stdlib_options(config) + [sys.executable]
+        key = hashlib.sha256(json.dumps(options).encode()).hexdigest()[:16]
+        layerDir = os.path.join(self.cacheDir, f"stdlib-{key}")
+
+        with self._lock:
+            lock = self._layerLocks.setdefault(key, threading.Lock())
+
+        with lock:
+            if os.path.isdir(layerDir):
+                return layerDir
+            log(f"Preparing stdlib layer - {key}")
+            # The lock only covers this process, other packs can share the cache dir
+            tmpDir = f'{layerDir}.{os.getpid()}.tmp'
+            if os.path.isdir(tmpDir):
+                shutil.rmtree(tmpDir)
+            os.makedirs(tmpDir)
+            _copy_stdlib(config, tmpDir)
+            _swap_stdlib_cache(tmpDir)
+            try:
+                os.rename(tmpDir, layerDir)
+            except OSError:
+                shutil.rmtree(tmpDir)
+                # Another process finished first
+                if not os.path.isdir(layerDir):
+                    raise
+
+        return layerDir
+
+
+class DistLayout:
 
     def __init__(self, config: PackConfig) -> None:
-        self._config = config
-        self._buildDir = config.build_dir
-        self._outputDir = os.path.join("dist", config.name)
-        self._venvDir = os.path.join(self._outputDir, "venv")
-        if _IS_WINDOWS:
-            self._venvBin = os.path.join(self._venvDir, "Scripts")
-            self._venvLib = os.path.join(self._venvDir, "Lib")
+        """
+        The output paths of a packed distribution
+
+        :param config: The pack config
+        """
+        self.distDir = os.path.join(config.project_dir, "dist")
+        self.outputDir = os.path.join(self.distDir, config.name)
+        # Single file executables, when enabled
+        self.onefileDir = os.path.join(self.distDir, f'{config.name}-onefile')
+        self.venvDir = os.path.join(self.outputDir, "venv")
+        if IS_WINDOWS:
+            self.venvBin = os.path.join(self.venvDir, "Scripts")
+            self.venvLib = os.path.join(self.venvDir, "Lib")
+            self.pythonExec = os.path.join(self.venvBin, "python.exe")
+        else:
+            self.venvBin = os.path.join(self.venvDir, "bin")
+            self.venvLib = os.path.join(self.venvDir, "lib", _PY_VERSION)
+            self.pythonExec = os.path.join(self.venvBin, "python")
+        self.sitePackages = os.path.join(self.venvLib, "site-packages")
+        # The shared runtime holding the interpreter and stdlib, when the dist uses one
+        self.runtimeDir: Optional[str] = None
+        # Statements to run before the app's code, with the env from get_env()
+        self.setup: List[str] = []
+        if config.shared_runtime:
+            self.runtimeDir = os.path.join(get_runtime_root(config), get_runtime_name(config))
+            self.pythonExec = os.path.join(self.runtimeDir, "bin", "python")
+            self.setup.append(SITE_SETUP)
+
+    def get_env(self) -> Dict[str, str]:
+        """
+        Returns an environment matching what the app launchers set up
+        """
+        env = os.environ.copy()
+        if self.runtimeDir is not None:
+            env["PYTHONHOME"] = os.path.abspath(self.runtimeDir)
+            env["PYTHONPATH"] = os.path.abspath(self.sitePackages)
+            env["LD_LIBRARY_PATH"] = os.path.abspath(os.path.join(self.runtimeDir, "bin"))
+            return env
+        # dev mode dists are still real venvs, setting the home would break them
+        if not os.path.exists(os.path.join(self.venvDir, "pyvenv.cfg")):
+            env["PYTHONHOME"] = os.path.abspath(self.venvDir)
+        env["PYTHONPATH"] = os.path.abspath(self.sitePackages)
+        if IS_WINDOWS:
+            env["PATH"] = os.path.abspath(self.venvLib) + os.pathsep + env.get("PATH", "")
         else:
-            self._venvBin = os.path.join(self._venvDir, "bin")
-            self._venvLib = os.path.join(self._venvDir, "lib", _PY_VERSION)
+            env["LD_LIBRARY_PATH"] = os.path.abspath(self.venvBin)
+        return env
 
-    def pack(self):
+
+class DiamondPacker:
+
+    def __init__(self, config: PackConfig, shared: Optional[SharedCache] = None) -> None:
         """
-        Main entry point for packing
+        :param config: The pack config
+        :param shared: Optional cache of build products shared with other packers
         """
+        self._config = config
+        self._shared = shared
+        self._buildDir = os.path.join(config.project_dir, config.build_dir)
+        self._layout = DistLayout(config)
+        self._outputDir = self._layout.outputDir
+        self._venvDir = self._layout.venvDir
+        self._venvBin = self._layout.venvBin
+        self._venvLib = self._layout.venvLib
+
+    def check_config(self) -> None:
+        """
+        Raise if the config can't be packed on this platform
+        """
+        if self._config.onefile and (IS_WINDOWS or self._config.mode != DPMode.APP):
+            raise RuntimeError("Single file output is only supported in 'app' mode on Linux")
+        if self._config.shared_runtime and IS_WINDOWS:
+            raise RuntimeError("Shared runtimes are only supported on Linux")
+        if self._config.readahead and (IS_WINDOWS or self._config.mode != DPMode.APP):
+            raise RuntimeError("Readahead is only supported in 'app' mode on Linux")
+        if IS_WINDOWS and any(x.profile.preload is not None for x in self._config.scripts + self._config.gui_scripts):
+            raise RuntimeError("Preload libraries are only supported on Linux")
+
+    def pack(self, label: str = ""):
+        """
+        Main entry point for packing.
+        The steps are run as a task graph, so independent steps overlap
+
+        :param label: Optional label to prefix the output with
+        """
+        self.check_config()
+
+        os.makedirs(self._outputDir, exist_ok=True)
+        shutil.copy(os.path.join(TEMPLATE_DIR, "diamondpack-license.txt"), self._outputDir)
 
-        self._build_wheel()
-        self._build_env()
+        graph = TaskGraph(label)
+        graph.add("venv", self._create_venv)
+        if len(self._config.wheels) == 0:
+            graph.add("wheel", self.build_wheel)
+            graph.add("install", self._install_wheels, ["wheel", "venv"])
+        else:
+            # Wheels were already built, e.g. by the batch packer
+            graph.add("install", self._install_wheels, ["venv"])
+
+        if self._config.shared_runtime:
+            # The interpreter and stdlib come from the shared runtime, only site-packages is kept
+            stripDeps = ["install"]
+            if not self._config.dev_mode:
+                graph.add("clean", self._clean_env, ["install"])
+                stripDeps.append("clean")
+            graph.add("strip", self._strip_venv, stripDeps)
+        elif not self._config.dev_mode:
+            graph.add("libs", self._copy_libs, ["venv"])
+            graph.add("stdlib", self._copy_stdlib, ["venv"])
+            # pip runs from the venv, so it can only be stripped after installing
+            graph.add("python", self._copy_python, ["install"])
+            graph.add("clean", self._clean_env, ["install", "stdlib"])
 
         for script in self._config.scripts:
-            log(f"Generating app - {script.name}")
-            if self._config.mode == DPMode.APP:
-                self._make_exec(script, False)
-            else:
-                self._make_script(script)
+            graph.add(f"app-{script.name}", functools.partial(self.make_app, script, False))
 
         for script in self._config.gui_scripts:
-            log(f"Generating GUI app - {script.name}")
-            if self._config.mode == DPMode.APP:
-                self._make_exec(script, True)
-            else:
-                self._make_script(script)
+            graph.add(f"app-{script.name}", functools.partial(self.make_app, script, True))
 
-        self._copy_data()
+        graph.add("data", self._copy_data)
 
-    def _build_wheel(self):
-        log("Building wheel")
-        args = [sys.executable, "-m", "build", "--wheel"]
-        execute(args)
+        graph.run(self._config.jobs)
 
-        if not os.path.isdir("dist"):
-            logErr("Cannot find 'dist' directory")
-            return None
+        for app in self._config.scripts + self._config.gui_scripts:
+            preload = app.profile.preload
+            if preload is not None and not os.path.isfile(os.path.join(self._outputDir, preload)):
+                raise RuntimeError(f"Cannot find the preload library '{preload}' of {app.name} in the dist")
 
-        wheelName = f'{self._config.projectName.replace("-", "_")}-{self._config.version}*.whl'
-        wheelGlob = os.path.join('dist', wheelName)
+        if self._config.readahead:
+            self._record_readahead()
 
-        files = glob.glob(wheelGlob)
-        if len(files) != 1:
-            logErr(f"Error finding exact wheel (glob='{wheelGlob}'), potentials: {files}")
-            return None
+        manifest = functools.partial(write_manifest, self._outputDir, self._config.name, self._config.jobs)
+        if self._config.archive is not None:
+            # The manifest is written from the hashes of the archived files, so they're only read once
+            archive = os.path.join(self._layout.distDir, f'{self._config.name}.{self._config.archive}')
+            write_archive(self._outputDir, archive, self._config.archive, self._config.jobs, manifest)
+        else:
+            manifest()
 
-        self._config.wheels = [files[0]]
+        if self._config.onefile:
+            self._make_onefile()
 
-    def _build_env(self):
-        """
-        Creates a virtual env and optionally installs requirements
-        """
-        log(f"Building Virtual Environment")
-        python_exec = sys.executable
+        log(f"Success - {self._config.name}")
 
-        if not os.path.exists(self._venvDir) or not self._config.dev_mode:
-            log("Creating venv")
-            execute([python_exec, '-m', 'venv', self._venvDir, '--copies'])
+    def make_app(self, app: App, is_gui: bool):
+        if is_gui:
+            log(f"Generating GUI app - {app.name}")
+        else:
+            log(f"Generating app - {app.name}")
+        if self._config.mode == DPMode.APP:
+            self._make_exec(app, is_gui)
+        else:
+            self._make_script(app)
+
+    def build_wheel(self):
+        log("Building wheel")
+        args = [sys.executable, "-m", "build", "--wheel", self._config.project_dir]
+        execute(args)
+
+        distDir = os.path.join(self._config.project_dir, "dist")
+        if not os.path.isdir(distDir):
+            raise RuntimeError(f"Cannot find '{distDir}' directory")
+
+        wheel = find_project_wheel(self._config)
+        self._config.wheels = [wheel]
+
+        if self._shared is not None:
+            shutil.copy(wheel, self._shared.wheelDir)
 
+    def _create_venv(self):
+        # A full pack strips the venv, pip can't run in it anymore
+        stripped = os.path.isdir(self._venvDir) and not os.path.exists(os.path.join(self._venvDir, "pyvenv.cfg"))
+        if not os.path.exists(self._venvDir) or not self._config.dev_mode or stripped:
+            log("Creating venv")
+            args = [sys.executable, '-m', 'venv', self._venvDir, '--copies']
+            if stripped and self._config.dev_mode:
+                # Don't keep the full pack's stdlib and libraries in a dev venv
+                args.append('--clear')
+            ret = execute(args)
+            if ret != 0:
+                raise RuntimeError(f"Unable to create venv: Return code ({ret})")
+
+    def _install_wheels(self):
         venvExec = os.path.join(self._venvBin, "python")
 
         args = [
@@ -174,159 +856,79 @@ class DiamondPacker:
             "--disable-pip-version-check",
             "--force-reinstall",
         ]
+        env = None
+        if self._shared is not None:
+            args.extend(["--find-links", self._shared.wheelDir])
+            env = os.environ.copy()
+            env["PIP_CACHE_DIR"] = os.path.abspath(self._shared.pipCacheDir)
         args.extend(self._config.wheels)
         log("Installing wheels")
-        ret = execute(args)
+        ret = execute(args, env)
         if ret != 0:
             raise RuntimeError(f"Unable to install wheel: Return code ({ret})")
 
-        if not self._config.dev_mode:
-            venvCfgFile = os.path.join(self._venvDir, "pyvenv.cfg")
-            os.remove(venvCfgFile)
-            # Remove scripts
-            toRemove = ["*ctivate*", "pip*", "python*"]
-
-            for xxx in toRemove:
-                for f in glob.glob(os.path.join(self._venvBin, xxx)):
-                    os.remove(f)
-
-            # Copy required libraries
-            log("Copying required libraries")
-            if _IS_WINDOWS:
-                libpath = sysconfig.get_config_var("installed_base")
-                for file in glob.glob(os.path.join(libpath, "*.dll")):
-                    fname = os.path.split(file)[1]
-                    shutil.copyfile(file, os.path.join(self._venvLib, fname))
-                otherDLLs = os.path.join(libpath, 'DLLs')
-                for file in glob.glob(os.path.join(otherDLLs, "*.dll")):
-                    fname = os.path.split(file)[1]
-                    shutil.copyfile(file, os.path.join(self._venvLib, fname))
-                for file in glob.glob(os.path.join(otherDLLs, "*.pyd")):
-                    fname = os.path.split(file)[1]
-                    shutil.copyfile(file, os.path.join(self._venvLib, fname))
-                if self._config.include_tk:
-                    shutil.copytree(
-                        os.path.join(libpath, "tcl", "tcl8.6"), os.path.join(self._venvDir, "Lib", "tcl8.6")
-                    )
-                    shutil.copytree(os.path.join(libpath, "tcl", "tk8.6"), os.path.join(self._venvDir, "Lib", "tk8.6"))
-            else:
-                # _copy_linux_required_libs(python_exec, self._venvBin)
-
-                if self._config.include_tk:
-                    libpath = sysconfig.get_config_var("DESTSHARED")
-                    os.makedirs(os.path.join(self._venvLib, "lib-dynload"), exist_ok=True)
-                    for x in glob.glob(os.path.join(libpath, "_tkinter*")):
-                        _copy_linux_required_libs(x, self._venvBin)
-                        lib = os.path.basename(x)
-                        shutil.copy(x, os.path.join(self._venvLib, "lib-dynload", lib))
-
-                    _copy_linux_required_libs("/usr/lib64/libtk8.6.so", self._venvBin)
-
-                    # shutil.copy("/usr/lib64/libtk8.6.so", os.path.join(self._venvBin, "libtk8.6.so"))
-                    shutil.copytree(
-                        "/usr/lib64/tk8.6",
-                        os.path.join(
-                            self._venvDir,
-                            'lib',
-                            "tk8.6",
-                        ),
-                        dirs_exist_ok=True,
-                    )
+    def _copy_libs(self):
+        """
+        Copy required shared libraries
+        """
+        log("Copying required libraries")
+        _copy_libs(self._config, self._venvDir, self._venvBin, self._venvLib)
 
-                    # shutil.copy("/usr/lib64/libtcl8.6.so", os.path.join(self._venvBin, "libtcl8.6.so"))
-                    shutil.copytree(
-                        "/usr/lib64/tcl8.6",
-                        os.path.join(self._venvDir, 'lib', "tcl8.6"),
-                        dirs_exist_ok=True,
-                    )
+    def _copy_python(self):
+        """
+        Strip the venv scripts and replace them with a standalone python executable
+        """
+        venvCfgFile = os.path.join(self._venvDir, "pyvenv.cfg")
+        os.remove(venvCfgFile)
+        # Remove scripts
+        for xxx in VENV_BIN_REMOVED:
+            for f in glob.glob(os.path.join(self._venvBin, xxx)):
+                os.remove(f)
 
-            log("Copying python executable")
-            # Copy the python executable
-            newExec = os.path.join(self._venvBin, "python")
-            if _IS_WINDOWS:
-                newExec += ".exe"
-                python_w = os.path.join(sysconfig.get_config_var("installed_base"), f"pythonw.exe")
-                new_python_w = os.path.join(self._venvBin, "pythonw.exe")
-                shutil.copyfile(python_w, new_python_w)
-                python_exec = os.path.join(sysconfig.get_config_var("installed_base"), f"python.exe")
-            shutil.copyfile(python_exec, newExec)
-            # Set permissions
-            os.chmod(newExec, 0o755)
-
-            log("Copying stdlib")
-            # Copy the stdlib
-            globalStdlib = sysconfig.get_path('stdlib')
-
-            if self._config.stdlib_blacklist is not None:
-                shutil.copytree(
-                    globalStdlib,
-                    self._venvLib,
-                    ignore=shutil.ignore_patterns(*self._config.stdlib_blacklist),
-                    dirs_exist_ok=True
-                )
-            else:
-                libs = set(MINIMUM_STDLIB)
-                if self._config.include_tk:
-                    libs.update(TKINTER_LIBS)
-                if self._config.stdlib_whitelist is not None:
-                    libs.update(self._config.stdlib_whitelist)
-
-                for x in libs:
-                    lib = os.path.join(globalStdlib, x)
-                    if os.path.isdir(lib):
-                        shutil.copytree(lib, os.path.join(self._venvLib, x), dirs_exist_ok=True)
-                    else:
-                        lib += ".py"
-                        if os.path.isfile(lib):
-                            shutil.copy(
-                                lib,
-                                self._venvLib,
-                            )
-
-            log("Cleaning environment")
-            if _IS_WINDOWS:
-                packageDir = os.path.join(self._venvDir, "Lib", "site-packages")
-            else:
-                packageDir = os.path.join(self._venvDir, "lib", _PY_VERSION, "site-packages")
-
-            for xxx in glob.glob(os.path.join(packageDir, "*.dist-info")):
-                shutil.rmtree(xxx)
-
-            def keepCache(filename: str):
-                folder, fname = os.path.split(filename)
-                fname = os.path.splitext(fname)[0]
-                cache = os.path.join(folder, "__pycache__", fname + "*.pyc")
-                try:
-                    cacheFile = glob.glob(cache)[0]
-                except IndexError:
-                    return
-                # remove the original file
-                os.remove(filename)
-                # rename the cached file
-                shutil.move(cacheFile, os.path.join(folder, fname + ".pyc"))
-
-            if len(self._config.cache_block) > 0:
-                BL_RE = re.compile("|".join(self._config.cache_block))
-            else:
-                BL_RE = None
+        log("Copying python executable")
+        _copy_python(self._venvBin)
 
-            for xxx in glob.glob(os.path.join(packageDir, "**/**.py"), recursive=True):
-                if BL_RE is not None and BL_RE.search(xxx) is not None:
-                    continue
-                keepCache(xxx)
+    def _strip_venv(self):
+        """
+        Remove everything but site-packages from the venv
+        """
+        log(f"Stripping venv for runtime - {get_runtime_name(self._config)}")
+        sitePackages = self._layout.sitePackages
+        tmpDir = os.path.join(self._outputDir, "dp-site-packages.tmp")
+        if os.path.exists(tmpDir):
+            shutil.rmtree(tmpDir)
+        os.rename(sitePackages, tmpDir)
+        shutil.rmtree(self._venvDir)
+        os.makedirs(self._venvLib)
+        os.rename(tmpDir, sitePackages)
+
+    def _copy_stdlib(self):
+        log("Copying stdlib")
+        if self._shared is None:
+            _copy_stdlib(self._config, self._venvLib)
+            return
 
-            stdlibCacheBlacklist = ["encodings"]
-            BL_RE = re.compile("|".join(stdlibCacheBlacklist))
+        layerDir = self._shared.get_stdlib_layer(self._config)
+        shutil.copytree(layerDir, self._venvLib, copy_function=_link_or_copy, dirs_exist_ok=True)
 
-            for xxx in glob.glob(os.path.join(self._venvLib, "*/**.py"), recursive=True):
-                if BL_RE.search(xxx) is not None:
-                    continue
-                keepCache(xxx)
-        # end if not dev mode
+    def _clean_env(self):
+        """
+        Remove package metadata and replace sources with their bytecode
+        """
+        log("Cleaning environment")
+        packageDir = self._layout.sitePackages
+
+        for xxx in glob.glob(os.path.join(packageDir, "*.dist-info")):
+            shutil.rmtree(xxx)
 
-        shutil.copy(os.path.join(_TEMPLATE_DIR, "diamondpack-license.txt"), self._outputDir)
+        BL_RE = cache_block_re(self._config.cache_block)
 
-        log("Success - Virtual Environment")
+        for xxx in glob.glob(os.path.join(packageDir, "**/**.py"), recursive=True):
+            if BL_RE is not None and BL_RE.search(xxx) is not None:
+                continue
+            _keep_cache(xxx, packageDir)
+
+        _swap_stdlib_cache(self._venvLib)
 
     def _get_cmd(self, app: App) -> str:
         """
@@ -334,42 +936,147 @@ class DiamondPacker:
         :param app: The app
         :return: The command string
         """
+        profile = app.profile
+        options = "".join(f'-X {x} ' for x in profile.x_options)
+
+        # Statements to run before the app, from the dist's layout and the runtime profile
+        setup = list(self._layout.setup)
+        if profile.gc_threshold is not None:
+            setup.append(f'import gc; gc.set_threshold({", ".join(str(x) for x in profile.gc_threshold)})')
+        freeze = ["import gc; gc.freeze()"] if profile.gc_freeze else []
+
         if app.entry is not None:
             # If the app has an entry point defined, run python in "command" mode
             # import the func from the specified module, and execute it
-            return f'-c "from {app.path} import {app.entry}; exit({app.entry}())"'
+            code = setup + [f'from {app.path} import {app.entry}'] + freeze + [f'exit({app.entry}())']
+            return f'{options}-c "{"; ".join(code)}"'
+        elif len(setup) > 0:
+            # gc-freeze needs an entry point, the module's imports only happen while it runs
+            code = setup + [f"import runpy; runpy.run_module('{app.path}', run_name='__main__', alter_sys=True)"]
+            return f'{options}-c "{"; ".join(code)}"'
         else:
             # else just run the script as a module
-            return f'-m {app.path}'
+            return f'{options}-m {app.path}'
 
-    def _make_script(self, app: App):
+    def _get_env_lines(self, app: App, template: str) -> str:
         """
-        Generate a .sh or .bat script for the given app
+        Returns the template's statements setting the app's profile environment
         :param app: The app
-        :return: None
+        :param template: The template file name
         """
-        cmd = self._get_cmd(app)
-
-        # Select script extension
-        if _IS_WINDOWS:
-            extension = ".bat"
+        env = app.profile.get_env()
+        if template.endswith(".cpp"):
+            prefix = "L" if IS_WINDOWS else ""
+            lines = [f'    {{{prefix}"{x}", {prefix}"{y}"}},' for x, y in env.items()]
+        elif template.endswith(".bat"):
+            lines = [f'SET {x}={y}' for x, y in env.items()]
         else:
-            extension = ".sh"
+            lines = [f'export {x}={y}' for x, y in env.items()]
+            if app.profile.preload is not None:
+                lines.append(f'export LD_PRELOAD="${{home}}/{app.profile.preload}${{LD_PRELOAD:+:$LD_PRELOAD}}"')
+        return "\n".join(lines)
 
-        # generate filenames
-        template = "app" + extension
-        outfile = os.path.join(self._outputDir, app.name + extension)
-
-        # generate replacements
+    def _get_replacements(self, app: App, cmd: str, template: str) -> Dict[str, str]:
+        """
+        Returns the replacement values for the app templates
+        :param app: The app
+        :param cmd: The python cmd arguments
+        :param template: The template file name
+        """
         replace = {
             _CMD_REPLACE: cmd,
-            _PY_REPLACE: _PY_VERSION
+            _PY_REPLACE: _PY_VERSION,
+            _NAME_REPLACE: self._config.name,
+            _APP_REPLACE: app.name,
+            _ENV_REPLACE: self._get_env_lines(app, template),
+            _PRELOAD_REPLACE: "" if app.profile.preload is None else app.profile.preload,
+            _RUNTIME_REPLACE: "",
+            _RUNTIME_KEY_REPLACE: "",
+            _RUNTIME_ROOT_REPLACE: "",
         }
+        if self._config.shared_runtime:
+            replace[_RUNTIME_REPLACE] = get_runtime_name(self._config)
+            replace[_RUNTIME_KEY_REPLACE] = get_runtime_key(self._config)
+            replace[_RUNTIME_ROOT_REPLACE] = self._config.runtime_root
+        return replace
+
+    def render_app(self, app: App) -> Tuple[str, str, str]:
+        """
+        Render the app's launcher template, a script in 'script' mode, or the executable's source in 'app' mode
+        :param app: The app
+        :return: The output file name, the template name and the rendered template
+        """
+        cmd = self._get_cmd(app)
+
+        if self._config.mode == DPMode.APP:
+            # Escape quotes
+            cmd = re.sub(r'"', '\\"', cmd)
+            if IS_WINDOWS:
+                template = 'app-windows.cpp'
+                outName = f'{app.name}.exe'
+            else:
+                template = "app-linux.cpp"
+                outName = app.name
+        else:
+            # Select script extension
+            if IS_WINDOWS:
+                extension = ".bat"
+            else:
+                extension = ".sh"
+
+            if self._config.shared_runtime:
+                template = "app-runtime" + extension
+            else:
+                template = "app" + extension
+            outName = app.name + extension
+
+        return outName, template, _render(template, self._get_replacements(app, cmd, template))
+
+    def get_cmake_options(self, app: App, is_gui: bool) -> List[str]:
+        """
+        Returns the CMake options for building the app's executable
+        :param app: The app
+        :param is_gui: Whether the app is a GUI app
+        """
+        options = [f"-DEXEC_NAME={app.name}"]
+
+        if app.icon is not None:
+            options.append("-DHAS_ICON=ON")
+
+        if is_gui:
+            options.append("-DGUI_APP=ON")
+
+        if not IS_WINDOWS:
+            options.append("-DCMAKE_BUILD_TYPE=Release")
+
+        if self._config.debug_logs:
+            options.append("-DDEBUG_LOGS=ON")
+
+        if self._config.onefile:
+            options.append("-DONEFILE=ON")
 
-        _do_replace(template, outfile, replace)
+        if self._config.shared_runtime:
+            options.append("-DSHARED_RUNTIME=ON")
+
+        if self._config.readahead:
+            options.append("-DREADAHEAD=ON")
+
+        return options
+
+    def _make_script(self, app: App):
+        """
+        Generate a .sh or .bat script for the given app
+        :param app: The app
+        :return: None
+        """
+        outName, _, text = self.render_app(app)
+        outfile = os.path.join(self._outputDir, outName)
+
+        with open(outfile, mode='w') as f:
+            f.write(text)
 
         # chmod
-        if not _IS_WINDOWS:
+        if not IS_WINDOWS:
             os.chmod(outfile, 0o755)
 
         log(f'Success - {app.name}')
@@ -381,62 +1088,33 @@ class DiamondPacker:
         :return: None
         """
 
-        cmd = self._get_cmd(app)
-        # Escape quotes
-        cmd = re.sub(r'"', '\\"', cmd)
-
-        # setup cmake dirs
-        cmakeBuild = os.path.join(self._buildDir, "dp-cmake-build")
-        cmakeSrc = os.path.join(self._buildDir, "dp-app-src-dir")
+        # setup cmake dirs, one per app so they can be built concurrently
+        cmakeBuild = os.path.join(self._buildDir, f"dp-cmake-build-{app.name}")
+        cmakeSrc = os.path.join(self._buildDir, f"dp-app-src-dir-{app.name}")
         os.makedirs(cmakeSrc, exist_ok=True)
 
-        if _IS_WINDOWS:
-            template = 'app-windows.cpp'
-        else:
-            template = "app-linux.cpp"
-        outfile = os.path.join(cmakeSrc, f'app.cpp')
-
-        replace = {
-            _CMD_REPLACE: cmd,
-            _PY_REPLACE: _PY_VERSION
-        }
-
-        _do_replace(template, outfile, replace)
+        _, _, text = self.render_app(app)
+        with open(os.path.join(cmakeSrc, f'app.cpp'), mode='w') as f:
+            f.write(text)
 
         # Copy the build config
-        shutil.copy(os.path.join(_TEMPLATE_DIR, "CMakeLists.txt"), cmakeSrc)
-
-        configureParams = [
-            "cmake",
-            "-S",
-            cmakeSrc,
-            "-B",
-            cmakeBuild,
-            f"-DEXEC_NAME={app.name}",
-        ]
+        shutil.copy(os.path.join(TEMPLATE_DIR, "CMakeLists.txt"), cmakeSrc)
 
         if app.icon is not None:
             icon_fname = os.path.basename(app.icon)
             shutil.copy(app.icon, cmakeSrc)
             _do_replace(
-                os.path.join(_TEMPLATE_DIR, "app.rc"), os.path.join(cmakeSrc, "app.rc"), {
+                os.path.join(TEMPLATE_DIR, "app.rc"), os.path.join(cmakeSrc, "app.rc"), {
                     _ICON_REPLACE: icon_fname
                 }
             )
-            configureParams.append("-DHAS_ICON=ON")
 
-        if is_gui:
-            configureParams.append("-DGUI_APP=ON")
+        configureParams = ["cmake", "-S", cmakeSrc, "-B", cmakeBuild] + self.get_cmake_options(app, is_gui)
 
         buildParams = ["cmake", "--build", cmakeBuild]
 
-        if _IS_WINDOWS:
+        if IS_WINDOWS:
             buildParams.append("--config=Release")
-        else:
-            configureParams.append("-DCMAKE_BUILD_TYPE=Release")
-
-        if self._config.debug_logs:
-            configureParams.append("-DDEBUG_LOGS=ON")
 
         log(f"Building executable - {app.name}")
 
@@ -452,7 +1130,7 @@ class DiamondPacker:
 
         log(f"Copying executable - {app.name}")
 
-        if _IS_WINDOWS:
+        if IS_WINDOWS:
             execName = f'{app.name}.exe'
             execPath = os.path.join(cmakeBuild, "Release", execName)
         else:
@@ -464,25 +1142,58 @@ class DiamondPacker:
 
         shutil.copy(execPath, os.path.join(self._outputDir, execName))
 
-        if not _IS_WINDOWS:
+        if not IS_WINDOWS:
             #_copy_linux_required_libs(execPath, self._outputDir)
             pass
 
         log(f'Success - {app.name}')
 
+    def _record_readahead(self):
+        """
+        Record the files each app reads at startup, the launchers prefetch them in parallel
+        """
+        if not os.path.isfile(self._layout.pythonExec):
+            raise RuntimeError(f"Cannot find '{self._layout.pythonExec}', install the shared runtime first")
+
+        env = self._layout.get_env()
+        for app in self._config.scripts + self._config.gui_scripts:
+            log(f"Recording startup files - {app.name}")
+            files = trace_startup_files(self._layout.pythonExec, env, app, self._outputDir, self._layout.setup)
+            count = write_readahead(self._outputDir, app.name, files, self._layout.runtimeDir)
+            log(f"{count} files listed for readahead - {app.name}")
+
+    def _make_onefile(self):
+        """
+        Append the packed dist to each app's executable
+        """
+        log("Writing single file executables")
+        apps = [x.name for x in self._config.scripts + self._config.gui_scripts]
+        payloadFile = os.path.join(self._buildDir, "dp-onefile-payload")
+        os.makedirs(self._buildDir, exist_ok=True)
+        # The launchers are left out, they don't need to be extracted
+        payloadHash = write_payload(self._outputDir, payloadFile, set(apps))
+
+        os.makedirs(self._layout.onefileDir, exist_ok=True)
+        for name in apps:
+            outFile = os.path.join(self._layout.onefileDir, name)
+            write_onefile(os.path.join(self._outputDir, name), payloadFile, payloadHash, outFile)
+            log(f"Success - {outFile}")
+
+        os.remove(payloadFile)
+
     def _copy_data(self):
         if len(self._config.data_globs) == 0:
             return
         log("Copying Data")
-        print("  \u250C")
+        logRaw("\u250C")
         for globPath, dest in self._config.data_globs:
             outDir = os.path.join(self._outputDir, dest)
             if not os.path.exists(outDir):
                 os.makedirs(outDir, exist_ok=True)
-            for f in glob.iglob(globPath):
+            for f in glob.iglob(os.path.join(self._config.project_dir, globPath)):
                 if not os.path.isfile(f):
                     continue
-                print(f"  \u2502 {f} -> {outDir}\\{os.path.basename(f)}")
+                logRaw("\u2502", f"{f} -> {os.path.join(outDir, os.path.basename(f))}")
                 shutil.copy(f, outDir)
-        print("  \u2514")
+        logRaw("\u2514")
         log("Copying Data - Done")
@@ -0,0 +1,896 @@
+# Dry run pack plans
+import base64
+import csv
+import fnmatch
+import functools
+import glob
+import hashlib
+import importlib.metadata
+import importlib.util
+import io
+import json
+import marshal
+import os
+import re
+import shutil
+import stat
+import sys
+import sysconfig
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import canonicalize_name
+
+from diamondpack.config import DPMode, PackConfig
+from diamondpack.pack import (
+    DiamondPacker,
+    DistLayout,
+    IS_WINDOWS,
+    STDLIB_CACHE_BLOCK,
+    TEMPLATE_DIR,
+    VENV_BIN_REMOVED,
+    WINDOWS_TCL_TK,
+    cache_block_re,
+    find_project_wheel,
+    get_runtime_key,
+    get_runtime_name,
+    get_runtime_root,
+    linux_required_libs,
+    sourceless_pyc,
+    stdlib_selection,
+    tcl_tk_dirs,
+    windows_libs,
+)
+from diamondpack.delta import MANIFEST_FILE
+from diamondpack.readahead import READAHEAD_DIR
+from diamondpack.log import log, logErr
+
+# Files pip writes into a dist-info directory itself
+_PIP_DIST_INFO = ["INSTALLER", "REQUESTED", "RECORD", "direct_url.json"]
+
+_ENTRY_POINT_GROUPS = ["console_scripts", "gui_scripts"]
+
+
+def _file_mode(path: str) -> int:
+    return 0o755 if os.stat(path).st_mode & stat.S_IXUSR else 0o644
+
+
+def _record_hash(value: str) -> Optional[str]:
+    """
+    Convert a RECORD hash like "sha256=<urlsafe base64>" to a hex digest
+    """
+    algo, _, digest = value.partition("=")
+    if algo != "sha256" or len(digest) == 0:
+        return None
+    return base64.urlsafe_b64decode(digest + "=" * (-len(digest) % 4)).hex()
+
+
+def _find_installed(name: str) -> Optional[importlib.metadata.Distribution]:
+    """
+    Find a distribution installed in the local interpreter.
+    Only installs have a RECORD, e.g. not the egg-info a build leaves in a project
+    """
+    for dist in importlib.metadata.distributions(name=name):
+        if dist.read_text("RECORD") is not None:
+            return dist
+    return None
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, mode='rb') as f:
+        return f.read()
+
+
+class _PlanFile:
+
+    def __init__(self, source: str, mode: int = 0o644) -> None:
+        """
+        A file in the planned dist
+
+        :param source: Where the file comes from, only for display
+        :param mode: 0o755 or 0o644, like in the dist manifest
+        """
+        self.source = source
+        self.mode = mode
+        # Returns the file's contents, None when they are only known after packing
+        self.load: Optional[Callable[[], bytes]] = None
+        # Already known contents, e.g. generated bytecode
+        self.data: Optional[bytes] = None
+        self.size: Optional[int] = None
+        self.sha256: Optional[str] = None
+        # False if the exact contents can differ between packs, e.g. bytecode,
+        #  marshal's output depends on which objects the packing process holds
+        self.stable = True
+        # Hash of what a built file depends on, when its contents are only known after packing
+        self.inputs: Optional[str] = None
+        # Symlink target
+        self.link: Optional[str] = None
+
+    def read(self) -> bytes:
+        if self.data is not None:
+            return self.data
+        if self.load is None:
+            raise RuntimeError(f"The contents of '{self.source}' are only known after packing")
+        return self.load()
+
+    def describe(self) -> Dict[str, Any]:
+        """
+        The file's plan entry, using the same keys as the dist manifest where they are known
+        """
+        if self.link is not None:
+            return {
+                "link": self.link,
+                "source": self.source
+            }
+        if self.size is None and (self.data is not None or self.load is not None):
+            data = self.read()
+            self.size = len(data)
+            if self.stable:
+                self.sha256 = hashlib.sha256(data).hexdigest()
+        elif self.sha256 is None and self.stable and self.load is not None:
+            self.sha256 = hashlib.sha256(self.read()).hexdigest()
+        entry: Dict[str, Any] = {
+            "source": self.source,
+            "size": self.size,
+            "sha256": self.sha256 if self.stable else None,
+            "mode": self.mode,
+        }
+        if self.inputs is not None:
+            entry["inputs"] = self.inputs
+        return entry
+
+
+def _local_file(path: str, source: Optional[str] = None) -> _PlanFile:
+    out = _PlanFile(path if source is None else source, _file_mode(path))
+    out.size = os.path.getsize(path)
+    out.load = lambda: _read_file(path)
+    return out
+
+
+def _generated_file(source: str, mode: int = 0o644, inputs: Optional[str] = None) -> _PlanFile:
+    out = _PlanFile(source, mode)
+    out.stable = False
+    out.inputs = inputs
+    return out
+
+
+def _data_file(source: str, data: bytes, mode: int = 0o644) -> _PlanFile:
+    out = _PlanFile(source, mode)
+    out.data = data
+    return out
+
+
+class _Install:
+
+    def __init__(self, name: str, version: str) -> None:
+        """
+        The files pip installs for one distribution, relative to the dist
+        """
+        self.name = name
+        self.version = version
+        self.files: Dict[str, _PlanFile] = {}
+        # (group, name, value) from entry_points.txt
+        self.entryPoints: List[Tuple[str, str, str]] = []
+        self.distInfo = ""
+        self.requires: List[str] = []
+        # Installed directly from a wheel file, instead of as a dependency
+        self.requested = False
+        self.fromFile = False
+
+
+class DiamondPlanner:
+
+    def __init__(self, config: PackConfig) -> None:
+        """
+        Computes the files a pack would produce, without building anything.
+        The stdlib and shared libraries come from the local interpreter, like in a real pack,
+        installed packages from the RECORD files of the project's wheel, of the wheels the venv
+        bootstraps pip from, and of the dependencies installed in the local interpreter
+
+        :param config: The pack config
+        """
+        self._config = config
+        self._layout = DistLayout(config)
+        self._packer = DiamondPacker(config)
+        self._outputDir = self._layout.outputDir
+        self._venv = self._rel(self._layout.venvDir)
+        self._venvBin = self._rel(self._layout.venvBin)
+        self._venvLib = self._rel(self._layout.venvLib)
+        self._sitePackages = self._rel(self._layout.sitePackages)
+        self._files: Dict[str, _PlanFile] = {}
+        self._outputs: Dict[str, _PlanFile] = {}
+        self._unresolved: List[str] = []
+        self._zips: List[zipfile.ZipFile] = []
+
+    def _rel(self, path: str) -> str:
+        return os.path.relpath(path, self._outputDir).replace(os.sep, "/")
+
+    def _abs(self, relPath: str) -> str:
+        """
+        The path a planned file has during the pack, as the packer's globs see it
+        """
+        return os.path.join(self._outputDir, *relPath.split("/"))
+
+    def plan(self) -> Dict[str, Any]:
+        """
+        Compute the plan
+
+        :return: The plan, "files" has an entry per output file, like the dist manifest
+        """
+        self._packer.check_config()
+        start = time.perf_counter()
+        try:
+            self._plan_files()
+            # Hashing releases the GIL
+            with ThreadPoolExecutor(max_workers=max(self._config.jobs, 1)) as pool:
+                entries = sorted(self._files.items())
+                files = dict(zip([x[0] for x in entries], pool.map(lambda x: x[1].describe(), entries)))
+        finally:
+            for z in self._zips:
+                z.close()
+
+        outputs = {
+            x: y.describe()
+            for x, y in sorted(self._outputs.items())
+        }
+        plan: Dict[str, Any] = {
+            "name": self._config.name,
+            "python": sys.version,
+            "mode": "app" if self._config.mode == DPMode.APP else "script",
+            "dev": self._config.dev_mode,
+            "digest": "",
+            "size": sum(x.get("size") or 0 for x in files.values()),
+            "unknownSizes": sum(1 for x in files.values() if "link" not in x and x["size"] is None),
+            "files": files,
+            "outputs": outputs,
+            "unresolved": self._unresolved,
+        }
+        if self._config.shared_runtime:
+            runtimeDir = os.path.join(get_runtime_root(self._config), get_runtime_name(self._config))
+            plan["runtime"] = {
+                "name": get_runtime_name(self._config),
+                "key": get_runtime_key(self._config),
+                "dir": runtimeDir,
+                "installed": os.path.isfile(self._layout.pythonExec),
+            }
+
+        # Sources are left out, they contain local paths
+        digestInfo = {
+            "files": {
+                x: {
+                    k: v
+                    for k, v in y.items() if k != "source"
+                }
+                for x, y in files.items()
+            },
+            "outputs": {
+                x: {
+                    k: v
+                    for k, v in y.items() if k != "source"
+                }
+                for x, y in outputs.items()
+            },
+            "unresolved": self._unresolved,
+            "runtime": plan.get("runtime", {}).get("key"),
+            "python": sys.version,
+        }
+        plan["digest"] = hashlib.sha256(json.dumps(digestInfo, sort_keys=True).encode()).hexdigest()
+
+        elapsed = time.perf_counter() - start
+        log(
+            f"Planned {len(files)} files in {elapsed:.1f}s - {plan['size'] / (1024 * 1024):.1f} MiB, "
+            f"{plan['unknownSizes']} sizes only known after packing"
+        )
+        for x in self._unresolved:
+            logErr(f"Unresolved requirement: {x}")
+        return plan
+
+    def write(self, outFile: Optional[str]) -> Dict[str, Any]:
+        """
+        Compute the plan and write it as JSON, reporting whether it changed since the last one
+
+        :param outFile: The output file, defaults to <name>-plan.json in the dist directory
+        :return: The plan
+        """
+        if outFile is None:
+            outFile = os.path.join(self._layout.distDir, f'{self._config.name}-plan.json')
+
+        try:
+            with open(outFile, mode='r') as f:
+                oldDigest = json.load(f).get("digest")
+        except (FileNotFoundError, ValueError):
+            oldDigest = None
+
+        plan = self.plan()
+        if len(os.path.dirname(outFile)) > 0:
+            os.makedirs(os.path.dirname(outFile), exist_ok=True)
+        with open(outFile, mode='w') as f:
+            json.dump(plan, f, indent=1)
+
+        if oldDigest is None:
+            log(f"Plan written - {outFile} ({plan['digest'][:16]})")
+        elif oldDigest == plan["digest"]:
+            log(f"Plan unchanged - {outFile} ({plan['digest'][:16]})")
+        else:
+            log(f"Plan changed - {outFile} ({oldDigest[:16]} -> {plan['digest'][:16]})")
+        return plan
+
+    def _plan_files(self) -> None:
+        """
+        Follows the steps of DiamondPacker.pack()
+        """
+        config = self._config
+        self._files["diamondpack-license.txt"] = _local_file(os.path.join(TEMPLATE_DIR, "diamondpack-license.txt"))
+
+        self._plan_venv()
+        self._plan_installs()
+
+        if config.shared_runtime:
+            if not config.dev_mode:
+                self._plan_clean()
+            # Only site-packages is kept
+            prefix = self._sitePackages + "/"
+            self._files = {
+                x: y
+                for x, y in self._files.items() if not x.startswith(self._venv + "/") or x.startswith(prefix)
+            }
+        elif not config.dev_mode:
+            self._plan_libs()
+            self._plan_stdlib()
+            self._plan_python()
+            self._plan_clean()
+
+        self._plan_apps()
+        self._plan_data()
+
+        for app in config.scripts + config.gui_scripts:
+            preload = app.profile.preload
+            if preload is not None and os.path.normpath(preload).replace(os.sep, "/") not in self._files:
+                raise RuntimeError(f"Cannot find the preload library '{preload}' of {app.name} in the dist")
+
+        if config.readahead:
+            for app in config.scripts + config.gui_scripts:
+                self._files[f'{READAHEAD_DIR}/{app.name}.txt'] = _generated_file("readahead trace")
+
+        self._files[MANIFEST_FILE] = _generated_file("manifest")
+
+        distDir = self._layout.distDir
+        if config.onefile:
+            for app in config.scripts + config.gui_scripts:
+                relPath = os.path.relpath(os.path.join(self._layout.onefileDir, app.name), distDir)
+                self._outputs[relPath.replace(os.sep, "/")] = _generated_file("onefile", 0o755)
+        if config.archive is not None:
+            self._outputs[f'{config.name}.{config.archive}'] = _generated_file("archive")
+
+    def _plan_venv(self) -> None:
+        """
+        The files 'python -m venv --copies' creates, before pip installs anything
+        """
+        if sys.maxsize > 2**32 and os.name == 'posix' and sys.platform != 'darwin':
+            link = _PlanFile("venv")
+            link.link = "lib"
+            self._files[f'{self._venv}/lib64'] = link
+
+        self._files[f'{self._venv}/pyvenv.cfg'] = _generated_file("venv")
+        scriptsDir = os.path.join(sysconfig.get_path('stdlib'), "venv", "scripts")
+        for kind in ["common", "nt" if IS_WINDOWS else "posix"]:
+            for x in glob.glob(os.path.join(scriptsDir, kind, "*")):
+                if os.path.isfile(x):
+                    self._files[f'{self._venvBin}/{os.path.basename(x)}'] = _generated_file(f"venv:{x}")
+
+        if IS_WINDOWS:
+            installedBase = sysconfig.get_config_var("installed_base")
+            for x in ["python.exe", "pythonw.exe"]:
+                self._files[f'{self._venvBin}/{x}'] = _local_file(os.path.join(installedBase, x))
+        else:
+            executable = getattr(sys, "_base_executable", sys.executable)
+            names = ["python", "python3", f'python{sys.version_info.major}.{sys.version_info.minor}']
+            for x in names:
+                self._files[f'{self._venvBin}/{x}'] = _local_file(executable)
+
+    def _plan_installs(self) -> None:
+        """
+        The packages pip installs: pip itself from the wheels bundled with the interpreter,
+        the project, and the project's dependencies
+        """
+        installs: Dict[str, _Install] = {}
+        bundled = os.path.join(sysconfig.get_path('stdlib'), "ensurepip", "_bundled")
+        for wheel in sorted(glob.glob(os.path.join(bundled, "*.whl"))):
+            install = self._wheel_install(wheel)
+            install.requested = True
+            installs[install.name] = install
+
+        if len(self._config.wheels) > 0:
+            wheels = list(self._config.wheels)
+        else:
+            try:
+                wheels = [find_project_wheel(self._config)]
+            except RuntimeError:
+                wheels = []
+
+        requires: List[str] = []
+        if len(wheels) > 0:
+            projects = [self._wheel_install(x) for x in wheels]
+            for x in projects:
+                x.requested = True
+                x.fromFile = True
+                requires.extend(x.requires)
+        else:
+            project = self._installed_project()
+            projects = [project]
+            requires.extend(project.requires)
+
+        for x in projects:
+            if x.name == canonicalize_name(self._config.projectName):
+                self._apply_sources(x)
+
+        projectNames = set(x.name for x in projects)
+        for dist in self._resolve(requires, projectNames):
+            install = self._installed_install(dist)
+            installs[install.name] = install
+
+        for x in projects:
+            installs[x.name] = x
+
+        for install in installs.values():
+            self._add_install(install)
+
+    def _installed_project(self) -> _Install:
+        """
+        The project from the local interpreter, when it hasn't been built into a wheel
+        """
+        dist = _find_installed(self._config.projectName)
+        if dist is not None and dist.version == self._config.version:
+            directUrl = dist.read_text("direct_url.json")
+            editable = directUrl is not None and json.loads(directUrl).get("dir_info", {}).get("editable", False)
+            if not editable:
+                install = self._installed_install(dist)
+                install.requested = True
+                return install
+
+        raise RuntimeError(
+            f"Cannot find a wheel or a non-editable install of '{self._config.name}', "
+            "build its wheel with 'python -m build --wheel' or install it first"
+        )
+
+    def _resolve(self, requires: List[str], skip: Set[str]) -> List[importlib.metadata.Distribution]:
+        """
+        Resolve the dependencies of the project from the packages installed in the local interpreter
+
+        :param requires: The project's requirements
+        :param skip: Normalized names of the projects being packed
+        :return: The distributions, dependencies that aren't installed are added to the unresolved list
+        """
+        found: Dict[str, importlib.metadata.Distribution] = {}
+        extras: Dict[str, Set[str]] = {}
+        queue: List[Tuple[str, Set[str]]] = [(x, {""}) for x in requires]
+        while len(queue) > 0:
+            reqStr, parentExtras = queue.pop(0)
+            try:
+                req = Requirement(reqStr)
+            except InvalidRequirement:
+                self._unresolved.append(f"{reqStr} - invalid requirement")
+                continue
+            if req.marker is not None and not any(req.marker.evaluate({
+                    "extra": x
+            }) for x in parentExtras):
+                continue
+
+            name = canonicalize_name(req.name)
+            if name in skip:
+                continue
+            wanted = set(req.extras) | {""}
+            if name in found:
+                newExtras = wanted - extras[name]
+                if len(newExtras) > 0:
+                    extras[name] |= newExtras
+                    queue.extend((x, newExtras) for x in found[name].requires or [])
+                continue
+
+            dist = _find_installed(req.name)
+            if dist is None:
+                self._unresolved.append(f"{reqStr} - not installed")
+                continue
+            if not req.specifier.contains(dist.version, prereleases=True):
+                self._unresolved.append(f"{reqStr} - {dist.version} is installed")
+                continue
+
+            found[name] = dist
+            extras[name] = wanted
+            queue.extend((x, wanted) for x in dist.requires or [])
+
+        return list(found.values())
+
+    def _wheel_install(self, wheel: str) -> _Install:
+        """
+        The files pip installs from a wheel, from its RECORD
+        """
+        z = zipfile.ZipFile(wheel, mode='r')
+        self._zips.append(z)
+        records = [x for x in z.namelist() if re.fullmatch(r'[^/]+\.dist-info/RECORD', x)]
+        if len(records) != 1:
+            raise RuntimeError(f"Cannot find the RECORD of '{wheel}'")
+        distInfo = records[0].split("/", 1)[0]
+        dist = importlib.metadata.PathDistribution(zipfile.Path(z, f'{distInfo}/'))  # type: ignore
+        install = _Install(canonicalize_name(dist.metadata["Name"]), dist.version)
+        install.distInfo = f'{self._sitePackages}/{distInfo}'
+        install.requires = dist.requires or []
+        install.entryPoints = [(x.group, x.name, x.value) for x in dist.entry_points if x.group in _ENTRY_POINT_GROUPS]
+        dataDir = distInfo[:-len(".dist-info")] + ".data"
+        wheelName = os.path.basename(wheel)
+        for row in csv.reader(io.StringIO(z.read(records[0]).decode())):
+            if len(row) == 0 or row[0].endswith("/"):
+                continue
+            member = row[0]
+            relPath = self._wheel_dest(member, distInfo, dataDir, install.name)
+            if relPath is None:
+                continue
+
+            info = z.getinfo(member)
+            mode = info.external_attr >> 16
+            entry = _PlanFile(f'{wheelName}:{member}', 0o755 if mode and stat.S_ISREG(mode) and mode & 0o111 else 0o644)
+            entry.load = functools.partial(z.read, member)
+            if relPath.startswith(self._venvBin + "/"):
+                # pip rewrites the script's shebang
+                entry.stable = False
+                entry.mode = 0o755
+                entry.load = None
+            elif len(row) >= 3 and len(row[2]) > 0:
+                entry.size = int(row[2])
+                entry.sha256 = _record_hash(row[1])
+            install.files[relPath] = entry
+
+        return install
+
+    def _wheel_dest(self, member: str, distInfo: str, dataDir: str, name: str) -> Optional[str]:
+        """
+        Where pip installs a wheel member, relative to the dist
+        """
+        if member == f'{distInfo}/RECORD':
+            return None
+        if not member.startswith(dataDir + "/"):
+            return f'{self._sitePackages}/{member}'
+        parts = member.split("/", 2)
+        if len(parts) != 3:
+            return None
+        scheme, rest = parts[1], parts[2]
+        if scheme in ["purelib", "platlib"]:
+            return f'{self._sitePackages}/{rest}'
+        if scheme == "scripts":
+            return f'{self._venvBin}/{rest}'
+        if scheme == "data":
+            return f'{self._venv}/{rest}'
+        if scheme == "headers":
+            return f'{self._venv}/include/site/python{sys.version_info.major}.{sys.version_info.minor}/{name}/{rest}'
+        return None
+
+    def _apply_sources(self, install: _Install) -> None:
+        """
+        Take the project's modules from its sources, so the plan follows
+        changes made since the wheel was built or installed
+        """
+        prefix = self._sitePackages + "/"
+        members = [x[len(prefix):] for x in install.files.keys() if x.startswith(prefix)]
+        overlay, added = self._source_overlay(members)
+        for member, src in overlay.items():
+            if src is None:
+                del install.files[prefix + member]
+            else:
+                install.files[prefix + member] = _local_file(src)
+        for member, src in added:
+            install.files[prefix + member] = _local_file(src)
+
+    def _source_overlay(self, members: List[str]) -> Tuple[Dict[str, Optional[str]], List[Tuple[str, str]]]:
+        """
+        Map the project's installed files to the project's sources
+
+        :param members: The installed files, relative to site-packages
+        :return: member -> source path, or None if the source was removed,
+            and the (member, source path) of modules added to the project's packages
+        """
+        roots: Dict[str, str] = {}
+        for member in members:
+            topLevel = member.split("/", 1)[0]
+            if topLevel in roots or topLevel.endswith(".dist-info"):
+                continue
+            for srcDir in [self._config.project_dir, os.path.join(self._config.project_dir, "src")]:
+                src = os.path.join(srcDir, topLevel)
+                if os.path.exists(src):
+                    roots[topLevel] = src
+                    break
+
+        overlay: Dict[str, Optional[str]] = {}
+        packageDirs: Set[str] = set()
+        for member in members:
+            topLevel, _, rest = member.partition("/")
+            if topLevel not in roots:
+                continue
+            src = roots[topLevel] if len(rest) == 0 else os.path.join(roots[topLevel], *rest.split("/"))
+            overlay[member] = src if os.path.isfile(src) else None
+            if os.path.isdir(roots[topLevel]) and os.path.isfile(src):
+                packageDirs.add(os.path.dirname(src))
+
+        sources = set(x for x in overlay.values() if x is not None)
+        added = []
+        for packageDir in packageDirs:
+            for name in sorted(os.listdir(packageDir)):
+                path = os.path.join(packageDir, name)
+                if name.endswith(".py") and os.path.isfile(path) and path not in sources:
+                    for topLevel, root in roots.items():
+                        if path.startswith(root + os.sep):
+                            relPath = os.path.relpath(path, root).replace(os.sep, "/")
+                            added.append((f'{topLevel}/{relPath}', path))
+        return overlay, added
+
+    def _installed_install(self, dist: importlib.metadata.Distribution) -> _Install:
+        """
+        The files pip would install for a distribution installed in the local interpreter, from its RECORD
+        """
+        install = _Install(canonicalize_name(dist.metadata["Name"]), dist.version)
+        install.requires = dist.requires or []
+        install.entryPoints = [(x.group, x.name, x.value) for x in dist.entry_points if x.group in _ENTRY_POINT_GROUPS]
+        if dist.files is None:
+            return install
+
+        siteDir = os.path.normpath(str(dist.locate_file("")))
+        scriptsDir = os.path.normpath(sysconfig.get_path('scripts'))
+        prefix = os.path.normpath(sys.prefix)
+        scripts = set(x[1] for x in install.entryPoints)
+        for file in dist.files:
+            path = os.path.normpath(str(dist.locate_file(file)))
+            if "__pycache__" in file.parts:
+                continue
+            if path.startswith(siteDir + os.sep):
+                relPath = os.path.relpath(path, siteDir).replace(os.sep, "/")
+                if relPath.endswith(".dist-info") or relPath.split("/", 1)[0].endswith(".dist-info"):
+                    install.distInfo = f'{self._sitePackages}/{relPath.split("/", 1)[0]}'
+                    if os.path.basename(relPath) in _PIP_DIST_INFO:
+                        continue
+                relPath = f'{self._sitePackages}/{relPath}'
+            elif path.startswith(scriptsDir + os.sep):
+                if os.path.basename(path) in scripts:
+                    # Generated again from the entry points
+                    continue
+                install.files[f'{self._venvBin}/{os.path.basename(path)}'] = _generated_file(path, 0o755)
+                continue
+            elif path.startswith(prefix + os.sep):
+                relPath = f'{self._venv}/{os.path.relpath(path, prefix).replace(os.sep, "/")}'
+            else:
+                continue
+
+            if not os.path.isfile(path):
+                self._unresolved.append(f"{dist.metadata['Name']} - missing installed file '{path}'")
+                continue
+            entry = _local_file(path)
+            if file.hash is not None and file.hash.mode == "sha256" and file.size is not None:
+                entry.size = file.size
+                entry.sha256 = _record_hash(f'sha256={file.hash.value}')
+            install.files[relPath] = entry
+        return install
+
+    def _add_install(self, install: _Install) -> None:
+        """
+        Add an install's files, with the files pip writes itself
+        """
+        for relPath, entry in install.files.items():
+            self._files[relPath] = entry
+            if relPath.startswith(self._sitePackages + "/") and relPath.endswith(".py"):
+                self._add_pip_cache(relPath, entry)
+
+        if len(install.distInfo) > 0:
+            self._files[f'{install.distInfo}/INSTALLER'] = _data_file("pip", b"pip\n")
+            self._files[f'{install.distInfo}/RECORD'] = _generated_file("pip")
+            if install.requested:
+                self._files[f'{install.distInfo}/REQUESTED'] = _data_file("pip", b"")
+            if install.fromFile:
+                self._files[f'{install.distInfo}/direct_url.json'] = _generated_file("pip")
+
+        for group, name, value in install.entryPoints:
+            if group not in _ENTRY_POINT_GROUPS:
+                continue
+            inputs = hashlib.sha256(f'{group}:{name}={value}'.encode()).hexdigest()
+            self._files[f'{self._venvBin}/{name}'] = _generated_file(f"pip:{install.name}", 0o755, inputs)
+
+    def _add_pip_cache(self, relPath: str, source: _PlanFile) -> None:
+        """
+        pip byte compiles every module it installs, the bytecode embeds the installed path
+        """
+        cacheRel = importlib.util.cache_from_source(relPath.replace("/", os.sep)).replace(os.sep, "/")
+        absPath = os.path.abspath(self._abs(relPath))
+        entry = _PlanFile(f"pip:{relPath}")
+        # The header holds the source's timestamp
+        entry.stable = False
+
+        def compile_module() -> bytes:
+            code = compile(source.read(), absPath, 'exec', dont_inherit=True)
+            return importlib.util.MAGIC_NUMBER + bytes(12) + marshal.dumps(code)
+
+        entry.load = compile_module
+        self._files[cacheRel] = entry
+
+    def _plan_libs(self) -> None:
+        """
+        Follows pack._copy_libs()
+        """
+        config = self._config
+        if IS_WINDOWS:
+            libpath = sysconfig.get_config_var("installed_base")
+            for file in windows_libs():
+                self._files[f'{self._venvLib}/{os.path.basename(file)}'] = _local_file(file)
+            if config.include_tk:
+                for name in WINDOWS_TCL_TK:
+                    self._add_tree(os.path.join(libpath, "tcl", name), f'{self._venv}/Lib/{name}')
+            return
+
+        if not config.include_tk:
+            return
+        spec = importlib.util.find_spec("_tkinter")
+        if spec is None or spec.origin is None:
+            raise RuntimeError("Cannot find _tkinter, the python used to pack was built without tkinter")
+        for lib in linux_required_libs(spec.origin):
+            relPath = f'{self._venvBin}/{os.path.basename(lib)}'
+            if relPath not in self._files:
+                self._files[relPath] = _local_file(lib)
+        self._files[f'{self._venvLib}/lib-dynload/{os.path.basename(spec.origin)}'] = _local_file(spec.origin)
+
+        for src, dstRel, keep in tcl_tk_dirs():
+            dst = f'{self._venv}/lib/{dstRel}'
+            for dirpath, _, filenames in os.walk(src):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    relPath = os.path.relpath(path, src).replace(os.sep, "/")
+                    if keep(config, relPath):
+                        self._files[f'{dst}/{relPath}'] = _local_file(path)
+
+    def _add_tree(
+        self, srcDir: str, dstRel: str, ignore: Optional[Callable[[str, List[str]], Set[str]]] = None
+    ) -> None:
+        """
+        Add the files shutil.copytree() would copy
+        """
+        for dirpath, dirnames, filenames in os.walk(srcDir, followlinks=True):
+            if ignore is not None:
+                ignored = ignore(dirpath, dirnames + filenames)
+                dirnames[:] = [x for x in dirnames if x not in ignored]
+                filenames = [x for x in filenames if x not in ignored]
+            relDir = os.path.relpath(dirpath, srcDir).replace(os.sep, "/")
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if not os.path.isfile(path):
+                    continue
+                relPath = name if relDir == "." else f'{relDir}/{name}'
+                self._files[f'{dstRel}/{relPath}'] = _local_file(path)
+
+    def _plan_stdlib(self) -> None:
+        """
+        Follows pack._copy_stdlib()
+        """
+        config = self._config
+        globalStdlib = sysconfig.get_path('stdlib')
+
+        if config.stdlib_blacklist is not None:
+            self._add_tree(
+                globalStdlib, self._venvLib, shutil.ignore_patterns("site-packages", *config.stdlib_blacklist)
+            )
+            return
+
+        for x in stdlib_selection(config):
+            lib = os.path.join(globalStdlib, x)
+            if os.path.isdir(lib):
+                self._add_tree(lib, f'{self._venvLib}/{x}')
+            elif os.path.isfile(lib + ".py"):
+                self._files[f'{self._venvLib}/{x}.py'] = _local_file(lib + ".py")
+
+    def _plan_python(self) -> None:
+        """
+        Follows DiamondPacker._copy_python()
+        """
+        self._files.pop(f'{self._venv}/pyvenv.cfg', None)
+        prefix = self._venvBin + "/"
+        for relPath in list(self._files.keys()):
+            if relPath.startswith(prefix) and "/" not in relPath[len(prefix):]:
+                if any(fnmatch.fnmatch(relPath[len(prefix):], x) for x in VENV_BIN_REMOVED):
+                    del self._files[relPath]
+
+        if IS_WINDOWS:
+            installedBase = sysconfig.get_config_var("installed_base")
+            for x in ["python.exe", "pythonw.exe"]:
+                self._files[f'{self._venvBin}/{x}'] = _local_file(os.path.join(installedBase, x))
+        else:
+            self._files[f'{self._venvBin}/python'] = _local_file(sys.executable)
+
+    def _plan_clean(self) -> None:
+        """
+        Follows DiamondPacker._clean_env(), package metadata is removed and sources are replaced with their bytecode
+        """
+        prefix = self._sitePackages + "/"
+        distInfos = set()
+        for relPath in self._files.keys():
+            if relPath.startswith(prefix):
+                topLevel = relPath[len(prefix):].split("/", 1)[0]
+                if fnmatch.fnmatch(topLevel, "*.dist-info") and not topLevel.startswith("."):
+                    distInfos.add(prefix + topLevel + "/")
+        self._files = {
+            x: y
+            for x, y in self._files.items() if not any(x.startswith(d) for d in distInfos)
+        }
+
+        BL_RE = cache_block_re(self._config.cache_block)
+
+        # glob "**/**.py" in site-packages, hidden names don't match
+        for relPath in sorted(self._files.keys()):
+            if not relPath.startswith(prefix) or not relPath.endswith(".py"):
+                continue
+            if any(x.startswith(".") for x in relPath[len(prefix):].split("/")):
+                continue
+            if BL_RE is not None and BL_RE.search(self._abs(relPath)) is not None:
+                continue
+            self._keep_cache(relPath, self._sitePackages)
+
+        # glob "*/**.py" in the lib directory, only files one directory down
+        libPrefix = self._venvLib + "/"
+        stdlibBL = cache_block_re(STDLIB_CACHE_BLOCK)
+        for relPath in sorted(self._files.keys()):
+            if not relPath.startswith(libPrefix) or not relPath.endswith(".py"):
+                continue
+            parts = relPath[len(libPrefix):].split("/")
+            if len(parts) != 2 or any(x.startswith(".") for x in parts):
+                continue
+            if stdlibBL is not None and stdlibBL.search(self._abs(relPath)) is not None:
+                continue
+            self._keep_cache(relPath, self._venvLib)
+
+    def _keep_cache(self, relPath: str, rootRel: str) -> None:
+        """
+        Follows pack._keep_cache()
+        """
+        cacheRel = importlib.util.cache_from_source(relPath.replace("/", os.sep)).replace(os.sep, "/")
+        cache = self._files.get(cacheRel)
+        if cache is None:
+            return
+        try:
+            data = cache.read()
+        except SyntaxError:
+            # pip doesn't write bytecode for modules that don't compile
+            del self._files[cacheRel]
+            return
+        sourceName = relPath[len(rootRel) + 1:]
+        source = self._files.pop(relPath)
+        del self._files[cacheRel]
+        entry = _data_file(f"bytecode:{source.source}", sourceless_pyc(data, sourceName))
+        entry.stable = False
+        entry.inputs = hashlib.sha256(source.read() + b"\0" + sourceName.encode()).hexdigest()
+        self._files[relPath[:-3] + ".pyc"] = entry
+
+    def _plan_apps(self) -> None:
+        """
+        The launchers, scripts are rendered here, executables only after building
+        """
+        isApp = self._config.mode == DPMode.APP
+        for app, isGui in [(x, False) for x in self._config.scripts] + [(x, True) for x in self._config.gui_scripts]:
+            outName, template, text = self._packer.render_app(app)
+            if not isApp:
+                self._files[outName] = _data_file(
+                    f"template:{template}", text.replace("\n", os.linesep).encode(), 0o755
+                )
+                continue
+            h = hashlib.sha256(text.encode())
+            h.update("\0".join(self._packer.get_cmake_options(app, isGui)).encode())
+            h.update(_read_file(os.path.join(TEMPLATE_DIR, "CMakeLists.txt")))
+            if app.icon is not None:
+                h.update(_read_file(app.icon))
+            self._files[outName] = _generated_file(f"cmake:{template}", 0o755, h.hexdigest())
+
+    def _plan_data(self) -> None:
+        """
+        Follows DiamondPacker._copy_data()
+        """
+        for globPath, dest in self._config.data_globs:
+            for f in glob.iglob(os.path.join(self._config.project_dir, globPath)):
+                if not os.path.isfile(f):
+                    continue
+                relPath = os.path.normpath(os.path.join(dest, os.path.basename(f))).replace(os.sep, "/")
+                self._files[relPath] = _local_file(f)
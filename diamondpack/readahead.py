@@ -0,0 +1,102 @@
+# Cold start readahead lists
+import os
+import subprocess as sp
+from typing import List, Optional
+
+from diamondpack.config import App
+
+# Directory in the dist holding one list per app. Must match the launcher template
+READAHEAD_DIR = "readahead"
+# Starts the paths of files in the shared runtime, which are relative to it. Must match the launcher template
+RUNTIME_PREFIX = "$RUNTIME/"
+
+# Run by the packed interpreter, prints every file opened while importing the app's module, in order.
+# Modules imported before the hook is installed and shared libraries loaded with dlopen
+#  don't show up as open events, so they are taken from sys.modules and the memory maps.
+_TRACE_SCRIPT = """
+import sys
+_opened = [sys.executable]
+for _mod in list(sys.modules.values()):
+    _spec = getattr(_mod, "__spec__", None)
+    if _spec is not None:
+        _opened.append(_spec.cached or _spec.origin)
+def _hook(event, args):
+    if event == "open" and isinstance(args[0], str):
+        _opened.append(args[0])
+sys.addaudithook(_hook)
+{setup}
+import {module}
+# os is always loaded during startup, anything else would add its own files
+import os
+with open("/proc/self/maps") as _maps:
+    for _line in _maps:
+        _parts = _line.split(None, 5)
+        if len(_parts) == 6 and _parts[5].startswith("/"):
+            _opened.append(_parts[5].strip())
+print("{marker}")
+for _x in _opened:
+    if isinstance(_x, str):
+        print(os.path.abspath(_x))
+"""
+
+# Separates the list from anything the module prints while importing
+_MARKER = "--diamondpack-readahead--"
+
+
+def trace_startup_files(pythonExec: str, env: dict, app: App, outputDir: str, setup: List[str]) -> List[str]:
+    """
+    Import the app's module with the packed interpreter and list the files it reads, in order.
+    The entry point itself isn't called, so this only covers startup.
+
+    :param pythonExec: The packed python executable
+    :param env: The environment the launchers set up
+    :param app: The app
+    :param outputDir: The dist directory, the trace runs from it
+    :param setup: Statements the launchers run before the app
+    :return: Absolute paths, first use order, without duplicates
+    """
+    script = _TRACE_SCRIPT.format(setup="\n".join(setup), module=app.path, marker=_MARKER)
+    args = [os.path.abspath(pythonExec), "-c", script]
+    # The project's sources in the working directory would shadow the packed modules
+    run = sp.run(args, env=env, cwd=outputDir, capture_output=True, universal_newlines=True)
+    lines = run.stdout.splitlines()
+    if run.returncode != 0 or _MARKER not in lines:
+        raise RuntimeError(f"Importing '{app.path}' failed: Return code ({run.returncode})\n{run.stderr}")
+
+    opened = lines[len(lines) - lines[::-1].index(_MARKER):]
+    out: List[str] = []
+    seen = set()
+    for x in opened:
+        x = os.path.realpath(x)
+        if x not in seen:
+            seen.add(x)
+            out.append(x)
+    return out
+
+
+def write_readahead(outputDir: str, name: str, files: List[str], runtimeDir: Optional[str] = None) -> int:
+    """
+    Write an app's readahead list, keeping only the files inside the dist and its shared runtime
+
+    :param outputDir: The dist directory
+    :param name: The app name
+    :param files: Absolute paths, in the order they should be prefetched
+    :param runtimeDir: The shared runtime, if the dist uses one
+    :return: The number of files listed
+    """
+    roots = [("", os.path.realpath(outputDir))]
+    if runtimeDir is not None:
+        roots.append((RUNTIME_PREFIX, os.path.realpath(runtimeDir)))
+    listDir = os.path.join(outputDir, READAHEAD_DIR)
+    os.makedirs(listDir, exist_ok=True)
+    count = 0
+    with open(os.path.join(listDir, f'{name}.txt'), mode='w') as f:
+        for x in files:
+            if not os.path.isfile(x):
+                continue
+            for prefix, root in roots:
+                if x.startswith(root + os.sep):
+                    f.write(prefix + os.path.relpath(x, root).replace(os.sep, "/") + "\n")
+                    count += 1
+                    break
+    return count
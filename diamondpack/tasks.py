@@ -0,0 +1,110 @@
+# Task scheduling
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Optional
+
+from diamondpack.log import log, logErr, set_prefix
+
+
+class Task:
+
+    def __init__(self, name: str, func: Callable[[], None], deps: List[str]) -> None:
+        """
+        A single step of a task graph
+
+        :param name: The unique name of the task, also used to prefix its output
+        :param func: The work to run
+        :param deps: Names of the tasks that must finish before this one starts
+        """
+        self.name = name
+        self.func = func
+        self.deps = deps
+        # Run time in seconds, set once finished
+        self.elapsed = 0.0
+
+
+class TaskGraph:
+
+    def __init__(self, label: str = "") -> None:
+        """
+        A set of tasks with dependencies, run on a thread pool.
+        Tasks are mostly subprocesses and file copies, so threads are enough to overlap them.
+
+        :param label: Optional label prepended to each task's output prefix
+        """
+        self._label = label
+        self._tasks: Dict[str, Task] = {}
+
+    def add(self, name: str, func: Callable[[], None], deps: Optional[List[str]] = None) -> None:
+        """
+        Add a task to the graph
+
+        :param name: The unique name of the task
+        :param func: The work to run
+        :param deps: Names of the tasks that must finish before this one starts
+        """
+        if name in self._tasks:
+            raise RuntimeError(f"Duplicate task name: '{name}'")
+        self._tasks[name] = Task(name, func, [] if deps is None else deps)
+
+    def run(self, jobs: int) -> None:
+        """
+        Run every task, starting each as soon as its dependencies are done.
+        Once a task fails no new tasks are started, and the first error is raised
+        after the running tasks finish.
+
+        :param jobs: Maximum number of tasks to run at once
+        """
+        for task in self._tasks.values():
+            for dep in task.deps:
+                if dep not in self._tasks:
+                    raise RuntimeError(f"Task '{task.name}' depends on unknown task '{dep}'")
+
+        start = time.perf_counter()
+        pending = dict(self._tasks)
+        running: Dict[Future, Task] = {}
+        done = set()
+        errors: List[BaseException] = []
+
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+            while len(pending) > 0 or len(running) > 0:
+                if len(errors) == 0:
+                    ready = [x for x in pending.values() if all(dep in done for dep in x.deps)]
+                    for task in ready:
+                        del pending[task.name]
+                        running[pool.submit(self._run_task, task)] = task
+
+                if len(running) == 0:
+                    if len(errors) == 0:
+                        raise RuntimeError(f"Task dependency cycle between: {list(pending.keys())}")
+                    break
+
+                finished, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    err = future.exception()
+                    if err is not None:
+                        logErr(f"Task failed - {task.name}")
+                        errors.append(err)
+                    else:
+                        done.add(task.name)
+
+        if len(errors) > 0:
+            raise errors[0]
+
+        total = time.perf_counter() - start
+        sequential = sum(x.elapsed for x in self._tasks.values())
+        name = f" - {self._label}" if len(self._label) > 0 else ""
+        log(f"Finished {len(self._tasks)} tasks{name} in {total:.1f}s ({sequential:.1f}s of work)")
+
+    def _run_task(self, task: Task) -> None:
+        if len(self._label) > 0:
+            set_prefix(f'{self._label}:{task.name}')
+        else:
+            set_prefix(task.name)
+        start = time.perf_counter()
+        try:
+            task.func()
+        finally:
+            task.elapsed = time.perf_counter() - start
+            set_prefix("")
@@ -0,0 +1,286 @@
+# Dev mode file watching
+import ctypes
+import glob
+import os
+import py_compile
+import select
+import shutil
+import sys
+import time
+import zipfile
+import importlib.util
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from diamondpack.config import App, PackConfig
+from diamondpack.pack import DiamondPacker, DistLayout
+from diamondpack.log import log, logErr
+
+# inotify event masks
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+# Wait after the first event, editors often write a file in several steps
+_DEBOUNCE = 0.05
+
+_PROJECT_FILE = "pyproject.toml"
+
+# (mtime, size) of each watched file
+Snapshot = Dict[str, Tuple[int, int]]
+
+
+class _PollWaiter:
+
+    def __init__(self, interval: float) -> None:
+        """
+        Wakes up on a fixed interval
+        """
+        self._interval = interval
+
+    def watch_dirs(self, dirs: Set[str]) -> None:
+        pass
+
+    def wait(self) -> None:
+        time.sleep(self._interval)
+
+
+class _InotifyWaiter:
+
+    def __init__(self) -> None:
+        """
+        Wakes up when a watched directory changes, linux only
+        """
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watched: Set[str] = set()
+
+    def watch_dirs(self, dirs: Set[str]) -> None:
+        for x in dirs - self._watched:
+            if self._libc.inotify_add_watch(self._fd, os.fsencode(x), _WATCH_MASK) >= 0:
+                self._watched.add(x)
+
+    def wait(self) -> None:
+        select.select([self._fd], [], [])
+        time.sleep(_DEBOUNCE)
+        # The events themselves aren't needed, the caller rescans the files
+        try:
+            while len(os.read(self._fd, 65536)) > 0:
+                pass
+        except BlockingIOError:
+            pass
+
+
+def _make_waiter(interval: float):
+    if sys.platform.startswith("linux"):
+        try:
+            waiter = _InotifyWaiter()
+            log("Watching with inotify")
+            return waiter
+        except (OSError, AttributeError):
+            pass
+    log(f"Polling every {interval}s")
+    return _PollWaiter(interval)
+
+
+def _app_key(apps: List[App]) -> List[Tuple[str, str, Optional[str], Optional[str], Dict]]:
+    # The runtime profile is part of the launcher too
+    return [(x.name, x.path, x.entry, x.icon, vars(x.profile)) for x in apps]
+
+
+class DiamondWatcher:
+
+    def __init__(
+        self, config: PackConfig, packer: DiamondPacker, reload: Callable[[], Optional[PackConfig]], interval: float
+    ) -> None:
+        """
+        Syncs changed project files straight into a packed dist.
+        Sources are copied next to any bytecode from a full pack, python prefers the source
+
+        :param config: The pack config
+        :param packer: The packer used for the initial pack
+        :param reload: Parses the project's pyproject.toml again
+        :param interval: Poll interval in seconds, when inotify isn't available
+        """
+        self._config = config
+        self._packer = packer
+        self._reload = reload
+        self._layout = DistLayout(config)
+        self._waiter = _make_waiter(interval)
+        # source root -> site-packages destination, for each top level module of the project
+        self._roots: Dict[str, str] = {}
+        self._projectFile = os.path.join(config.project_dir, _PROJECT_FILE)
+
+    def watch(self) -> None:
+        """
+        Main entry point for watching, runs until interrupted
+        """
+        self._find_roots()
+        snapshot = self._scan()
+        log(f"Watching {len(snapshot)} files, press Ctrl+C to stop")
+        while True:
+            self._waiter.watch_dirs(self._dirs(snapshot))
+            self._waiter.wait()
+            newSnapshot = self._scan()
+            changed = [x for x, y in newSnapshot.items() if snapshot.get(x) != y]
+            removed = [x for x in snapshot.keys() if x not in newSnapshot]
+            snapshot = newSnapshot
+            if len(changed) == 0 and len(removed) == 0:
+                continue
+
+            start = time.perf_counter()
+            for path in changed:
+                self._sync(path)
+            for path in removed:
+                self._remove(path)
+            log(f"Synced {len(changed) + len(removed)} files in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def _find_roots(self) -> None:
+        """
+        Find the project's sources from the RECORD of its installed wheel
+        """
+        if len(self._config.wheels) == 0:
+            raise RuntimeError("Cannot find the project's wheel")
+
+        distInfo = f'{self._config.projectName.replace("-", "_")}-{self._config.version}.dist-info'
+        with zipfile.ZipFile(self._config.wheels[0], mode='r') as z:
+            lines = z.read(f'{distInfo}/RECORD').decode().splitlines()
+
+        topLevels = set()
+        for line in lines:
+            topLevel = line.split(",", 1)[0].split("/", 1)[0]
+            if topLevel.startswith("..") or topLevel.endswith(".dist-info") or topLevel == "__pycache__":
+                continue
+            topLevels.add(topLevel)
+
+        for topLevel in topLevels:
+            for srcDir in [self._config.project_dir, os.path.join(self._config.project_dir, "src")]:
+                src = os.path.join(srcDir, topLevel)
+                if os.path.exists(src):
+                    self._roots[src] = os.path.join(self._layout.sitePackages, topLevel)
+                    break
+            else:
+                logErr(f"Cannot find the source of '{topLevel}', it won't be watched")
+
+    def _scan(self) -> Snapshot:
+        files: List[str] = [self._projectFile]
+        for src in self._roots.keys():
+            if os.path.isfile(src):
+                files.append(src)
+                continue
+            for dirpath, dirnames, filenames in os.walk(src):
+                dirnames[:] = [x for x in dirnames if x != "__pycache__"]
+                files.extend(os.path.join(dirpath, x) for x in filenames if not x.endswith(".pyc"))
+        for globPath, _ in self._config.data_globs:
+            files.extend(glob.glob(os.path.join(self._config.project_dir, globPath)))
+
+        out: Snapshot = {}
+        for x in files:
+            try:
+                st = os.stat(x)
+            except FileNotFoundError:
+                continue
+            if os.path.isfile(x):
+                out[x] = (st.st_mtime_ns, st.st_size)
+        return out
+
+    def _dirs(self, snapshot: Snapshot) -> Set[str]:
+        dirs = set(os.path.dirname(os.path.abspath(x)) for x in snapshot.keys())
+        for src in self._roots.keys():
+            if os.path.isdir(src):
+                for dirpath, dirnames, _ in os.walk(src):
+                    dirnames[:] = [x for x in dirnames if x != "__pycache__"]
+                    dirs.add(os.path.abspath(dirpath))
+        return dirs
+
+    def _get_dests(self, path: str) -> List[str]:
+        """
+        Where a project file is copied to in the dist
+        """
+        out = []
+        for src, dst in self._roots.items():
+            if path == src:
+                out.append(dst)
+            elif path.startswith(src + os.sep):
+                out.append(os.path.join(dst, os.path.relpath(path, src)))
+        for globPath, dest in self._config.data_globs:
+            if path in glob.glob(os.path.join(self._config.project_dir, globPath)):
+                out.append(os.path.join(self._layout.outputDir, dest, os.path.basename(path)))
+        return out
+
+    def _sync(self, path: str) -> None:
+        if path == self._projectFile:
+            self._reload_project()
+            return
+
+        for dst in self._get_dests(path):
+            log(f"Updating - {os.path.relpath(dst, self._layout.outputDir)}")
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(path, dst)
+            if dst.endswith(".py"):
+                try:
+                    py_compile.compile(dst, doraise=True)
+                except py_compile.PyCompileError as err:
+                    logErr(err.msg)
+
+    def _remove(self, path: str) -> None:
+        for src, dst in self._roots.items():
+            if path != src and not path.startswith(src + os.sep):
+                continue
+            if path != src:
+                dst = os.path.join(dst, os.path.relpath(path, src))
+            log(f"Removing - {os.path.relpath(dst, self._layout.outputDir)}")
+            toRemove = [dst]
+            if dst.endswith(".py"):
+                # the cached bytecode, and the bytecode that replaced the source in a full pack
+                toRemove.append(importlib.util.cache_from_source(dst))
+                toRemove.append(dst + "c")
+            for x in toRemove:
+                if os.path.isfile(x):
+                    os.remove(x)
+
+    def _reload_project(self) -> None:
+        log(f"Reloading {_PROJECT_FILE}")
+        config = self._reload()
+        if config is None:
+            return
+
+        oldApps = _app_key(self._config.scripts) + _app_key(self._config.gui_scripts)
+        newApps = _app_key(config.scripts) + _app_key(config.gui_scripts)
+
+        # The dist was packed with these, including the command line overrides, until the next full pack
+        config.dev_mode = self._config.dev_mode
+        config.jobs = self._config.jobs
+        config.wheels = self._config.wheels
+        config.onefile = self._config.onefile
+        config.readahead = self._config.readahead
+        config.archive = self._config.archive
+        config.shared_runtime = self._config.shared_runtime
+        config.runtime_root = self._config.runtime_root
+        if config.name != self._config.name:
+            logErr("Project name or version changed, restart to pack the new dist")
+            return
+
+        self._config = config
+        self._packer = DiamondPacker(config)
+
+        if oldApps == newApps:
+            log("Scripts unchanged, other config changes apply on the next full pack")
+            return
+
+        oldByName = {
+            x[0]: x
+            for x in oldApps
+        }
+        for app in config.scripts:
+            if oldByName.get(app.name) != _app_key([app])[0]:
+                self._packer.make_app(app, False)
+        for app in config.gui_scripts:
+            if oldByName.get(app.name) != _app_key([app])[0]:
+                self._packer.make_app(app, True)
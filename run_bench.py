@@ -0,0 +1,142 @@
+from argparse import ArgumentParser, REMAINDER
+import os
+import shlex
+import statistics
+import subprocess as sp
+import time
+from typing import Dict, List, Tuple
+
+
+def evict(path: str) -> None:
+    """
+    Drop a directory's files from the page cache, so the next run reads them from disk.
+    Only clean pages are dropped, and it doesn't need root, unlike /proc/sys/vm/drop_caches
+    """
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            file = os.path.join(dirpath, name)
+            if os.path.islink(file):
+                continue
+            try:
+                fd = os.open(file, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+def time_run(args: List[str], env: Dict[str, str]) -> float:
+    start = time.perf_counter()
+    sp.run(args, env=env, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+    return time.perf_counter() - start
+
+
+def measure_run(args: List[str]) -> Tuple[float, int]:
+    """
+    Run a command, returning its wall time in seconds and the max RSS of it and its children in KiB
+    """
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        start = time.perf_counter()
+        pid = os.posix_spawnp(
+            args[0],
+            args,
+            os.environ,
+            file_actions=[(os.POSIX_SPAWN_DUP2, devnull, 1), (os.POSIX_SPAWN_DUP2, devnull, 2)]
+        )
+        _, _, usage = os.wait4(pid, 0)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.close(devnull)
+    return elapsed, usage.ru_maxrss
+
+
+def bench_launch(exes: List[str], appArgs: List[str], runs: int) -> None:
+    """
+    Compare the start up time and peak memory of several launchers,
+    e.g. the same app packed with and without a runtime profile
+    """
+    results: Dict[str, List[Tuple[float, int]]] = {
+        x: []
+        for x in exes
+    }
+    for x in exes:
+        # Warm up, so every launcher runs from the page cache
+        measure_run([x, *appArgs])
+    for _ in range(runs):
+        # Alternate, so all see the same conditions
+        for x in exes:
+            results[x].append(measure_run([x, *appArgs]))
+
+    print(f"Launch - {runs} runs each")
+    for x, values in results.items():
+        times = [y[0] * 1000 for y in values]
+        rss = [y[1] / 1024 for y in values]
+        print(
+            f"  {x}: median {statistics.median(times):7.1f} ms, min {min(times):7.1f} ms, "
+            f"max RSS median {statistics.median(rss):6.1f} MiB"
+        )
+
+
+def bench_readahead(dist: str, app: str, appArgs: List[str], runs: int, evictDirs: List[str]) -> None:
+    """
+    Compare cold starts of an app packed with --readahead, with and without the launcher's prefetch
+    """
+    exe = os.path.join(dist, app)
+    if not os.path.isfile(os.path.join(dist, "readahead", f'{app}.txt')):
+        print(f"{dist} has no readahead list for {app}, pack it with --readahead")
+        exit(1)
+
+    results: Dict[str, List[float]] = {
+        "off": [],
+        "on": []
+    }
+    for _ in range(runs):
+        # Alternate, so both see the same disk conditions
+        for mode in results.keys():
+            env = os.environ.copy()
+            env["DIAMONDPACK_READAHEAD"] = "0" if mode == "off" else "1"
+            for x in [dist] + evictDirs:
+                evict(x)
+            results[mode].append(time_run([exe, *appArgs], env))
+
+    print(f"Cold start - {exe} ({runs} runs each)")
+    for mode, times in results.items():
+        print(
+            f"  readahead {mode:>3}: median {statistics.median(times) * 1000:8.1f} ms, "
+            f"min {min(times) * 1000:8.1f} ms, max {max(times) * 1000:8.1f} ms"
+        )
+    speedup = statistics.median(results["off"]) / statistics.median(results["on"])
+    print(f"  speedup: {speedup:.2f}x")
+
+
+def main():
+    parser = ArgumentParser()
+    subs = parser.add_subparsers(dest="bench", required=True)
+
+    readahead = subs.add_parser("readahead", help="Cold start with and without the launcher's prefetch")
+    readahead.add_argument("--runs", type=int, default=10)
+    readahead.add_argument(
+        "--evict", action="append", default=[], help="Also evict this directory, e.g. a shared runtime"
+    )
+    readahead.add_argument("dist", help="Packed dist directory")
+    readahead.add_argument("app", help="App to run")
+    readahead.add_argument("args", nargs=REMAINDER, help="Arguments for the app")
+
+    launch = subs.add_parser("launch", help="Start up time and peak memory of several launchers")
+    launch.add_argument("--runs", type=int, default=20)
+    launch.add_argument("--args", default="", help="Arguments for the apps, as one string")
+    launch.add_argument("exes", nargs="+", help="Launchers to compare")
+
+    args = parser.parse_args()
+
+    if args.bench == "readahead":
+        bench_readahead(args.dist, args.app, args.args, args.runs, args.evict)
+    elif args.bench == "launch":
+        bench_launch(args.exes, shlex.split(args.args), args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import os
+import subprocess as sp
+import sys
+
+import pytest
+
+from diamondpack.config import App, PackConfig
+from diamondpack.pack import DistLayout
+
+# Module of the fake project, installed into the dist's site-packages
+APP_MODULE = "exampleapp"
+
+
+def make_config(projectDir: str) -> PackConfig:
+    """
+    Config for a minimal project with a single app
+    """
+    config = PackConfig()
+    config.project_dir = projectDir
+    config.projectName = "example"
+    config.version = "1.0.0"
+    config.name = "example-1.0.0"
+    config.scripts = [App("myScript", APP_MODULE, "main", None)]
+    return config
+
+
+def write_file(path: str, text: str = "") -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode='w') as f:
+        f.write(text)
+
+
+@pytest.fixture
+def config(tmp_path) -> PackConfig:
+    return make_config(str(tmp_path))
+
+
+@pytest.fixture
+def dev_dist(tmp_path, monkeypatch) -> PackConfig:
+    """
+    A dev mode dist, a real venv with the app's module installed.
+    The project directory, which is also the working directory, has a copy of the module that fails to import
+    """
+    config = make_config(str(tmp_path))
+    layout = DistLayout(config)
+    sp.run([sys.executable, "-m", "venv", "--without-pip", layout.venvDir], check=True)
+    write_file(
+        os.path.join(layout.sitePackages, APP_MODULE, "__init__.py"), "import json\n\ndef main():\n    return 0\n"
+    )
+    write_file(
+        os.path.join(config.project_dir, APP_MODULE, "__init__.py"),
+        "raise ImportError('imported from the project sources')\n"
+    )
+    monkeypatch.chdir(tmp_path)
+    return config
@@ -0,0 +1,102 @@
+import importlib.util
+import marshal
+import os
+
+from diamondpack.analyze import Category, DiamondAnalyzer
+from diamondpack.log import set_prefix
+from diamondpack.pack import DistLayout, sourceless_pyc
+
+from conftest import APP_MODULE, write_file
+
+
+def _rel(layout: DistLayout, path: str) -> str:
+    return os.path.relpath(path, layout.outputDir).replace(os.sep, "/")
+
+
+def test_classify(config):
+    layout = DistLayout(config)
+    analyzer = DiamondAnalyzer(config)
+
+    entry = analyzer._classify(_rel(layout, os.path.join(layout.sitePackages, "numpy", "core", "multiarray.so")))
+    assert (entry.category, entry.name) == (Category.PACKAGE, "numpy")
+
+    entry = analyzer._classify(_rel(layout, os.path.join(layout.venvLib, "json", "decoder.pyc")))
+    assert (entry.category, entry.name, entry.isPackage) == (Category.STDLIB, "json", True)
+
+    entry = analyzer._classify(_rel(layout, os.path.join(layout.venvLib, "__pycache__", "os.cpython-311.pyc")))
+    assert (entry.category, entry.name, entry.isPackage) == (Category.STDLIB, "os", False)
+
+    entry = analyzer._classify(_rel(layout, os.path.join(layout.venvLib, "lib-dynload", "_ssl.cpython-311.so")))
+    assert (entry.category, entry.name) == (Category.STDLIB, "_ssl")
+
+    entry = analyzer._classify(_rel(layout, os.path.join(layout.venvBin, "libtcl8.6.so")))
+    assert (entry.category, entry.name) == (Category.SHARED_LIB, "libtcl8.6.so")
+
+    entry = analyzer._classify("data/data1.txt")
+    assert (entry.category, entry.name) == (Category.DATA, "data")
+
+
+def test_trace_imports_from_dist(dev_dist, capsys):
+    analyzer = DiamondAnalyzer(dev_dist)
+    analyzer._walk_dist()
+    analyzer._trace_imports(dev_dist.scripts[0])
+
+    assert "failed" not in capsys.readouterr().out
+    entry = analyzer._modules[APP_MODULE]
+    assert entry.category == Category.PACKAGE
+    assert entry.imported
+    assert analyzer._modules["json"].imported
+
+
+def test_package_module(config):
+    layout = DistLayout(config)
+    write_file(os.path.join(layout.sitePackages, "cv2", "__init__.pyc"))
+    write_file(os.path.join(layout.venvLib, "tkinter", "__init__.pyc"))
+    analyzer = DiamondAnalyzer(config)
+    analyzer._walk_dist()
+
+    # Sourceless bytecode from a full pack
+    assert analyzer._package_module("cv2/__init__.py") == "cv2"
+    assert analyzer._package_module("tkinter/__init__.py") is None
+    # Sources kept with py-cache-blacklist, or a dev pack
+    assert analyzer._package_module("/opt/app/venv/lib/python3.11/site-packages/numpy/core/x.py") == "numpy"
+    assert analyzer._package_module("C:\\app\\venv\\Lib\\site-packages\\numpy\\core\\x.py") == "numpy"
+    assert analyzer._package_module("/usr/lib/python3.11/runpy.py") is None
+    assert analyzer._package_module("<frozen importlib._bootstrap>") is None
+
+
+def test_suggest_cache_blacklist(dev_dist, capsys):
+    layout = DistLayout(dev_dist)
+    # A package that only works with its sources, swapped for its bytecode like in a full pack
+    source = "import inspect\ninspect.getsource(inspect.currentframe())\n"
+    code = compile(source, os.path.join(layout.sitePackages, "needsource", "__init__.py"), "exec")
+    data = importlib.util.MAGIC_NUMBER + bytes(12) + marshal.dumps(code)
+    os.makedirs(os.path.join(layout.sitePackages, "needsource"))
+    with open(os.path.join(layout.sitePackages, "needsource", "__init__.pyc"), mode='wb') as f:
+        f.write(sourceless_pyc(data, "needsource/__init__.py"))
+    write_file(os.path.join(layout.sitePackages, APP_MODULE, "__init__.py"), "import needsource\n")
+
+    analyzer = DiamondAnalyzer(dev_dist)
+    analyzer._walk_dist()
+    analyzer._trace_imports(dev_dist.scripts[0])
+    analyzer._suggest(10)
+
+    assert analyzer._failedModules == {"needsource"}
+    assert "Candidate 'py-cache-blacklist' entries, seen in failing imports: ['needsource']" in capsys.readouterr().out
+
+
+def test_report_prefix(config, capsys):
+    write_file(os.path.join(DistLayout(config).sitePackages, "cv2", "__init__.pyc"), "cv2")
+    analyzer = DiamondAnalyzer(config)
+    analyzer._walk_dist()
+
+    set_prefix("analyze")
+    try:
+        analyzer._report(10)
+    finally:
+        set_prefix("")
+
+    # Listing lines carry the task prefix, like the rest of the output
+    lines = [x for x in capsys.readouterr().out.splitlines() if "cv2" in x]
+    assert len(lines) == 1
+    assert lines[0].startswith("  \u2502 [analyze] ")
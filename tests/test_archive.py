@@ -0,0 +1,131 @@
+import functools
+import os
+import tarfile
+
+import pytest
+
+from diamondpack import archive, delta
+from diamondpack.archive import write_archive
+from diamondpack.delta import MANIFEST_FILE, load_manifest, write_manifest
+
+from conftest import write_file
+
+FORMATS = [
+    "tar.gz",
+    "tar.xz",
+    pytest.param("tar.zst", marks=pytest.mark.skipif(archive.zstandard is None, reason="zstandard is not installed")),
+]
+
+
+def _make_dist(root: str) -> None:
+    # Incompressible enough to span several blocks
+    write_file(os.path.join(root, "venv", "lib", "big.bin"), os.urandom(200 * 1024).hex())
+    write_file(os.path.join(root, "data", "data1.txt"), "data")
+    write_file(os.path.join(root, "myScript"), "launcher")
+    os.chmod(os.path.join(root, "myScript"), 0o700)
+    os.symlink("lib", os.path.join(root, "venv", "lib64"))
+
+
+def _open(path: str, fmt: str) -> tarfile.TarFile:
+    if fmt == "tar.zst":
+        stream = archive.zstandard.ZstdDecompressor().stream_reader(open(path, mode='rb'), read_across_frames=True)
+        return tarfile.open(fileobj=stream, mode="r|")
+    return tarfile.open(path, mode="r")
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(archive, "BLOCK_SIZE", 64 * 1024)
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_round_trip(tmp_path, fmt, small_blocks):
+    dist = str(tmp_path / "example-1.0.0")
+    _make_dist(dist)
+    outFile = str(tmp_path / f"example.{fmt}")
+
+    write_archive(dist, outFile, fmt, 4)
+
+    members = {}
+    with _open(outFile, fmt) as tar:
+        for info in tar:
+            data = None
+            if info.isreg():
+                f = tar.extractfile(info)
+                assert f is not None
+                data = f.read()
+            members[info.name] = (info, data)
+
+    assert set(members.keys()) == {
+        "example-1.0.0/data",
+        "example-1.0.0/data/data1.txt",
+        "example-1.0.0/myScript",
+        "example-1.0.0/venv",
+        "example-1.0.0/venv/lib",
+        "example-1.0.0/venv/lib/big.bin",
+        "example-1.0.0/venv/lib64",
+    }
+    with open(os.path.join(dist, "venv", "lib", "big.bin"), mode='rb') as f:
+        assert members["example-1.0.0/venv/lib/big.bin"][1] == f.read()
+    assert members["example-1.0.0/venv/lib64"][0].linkname == "lib"
+    info = members["example-1.0.0/myScript"][0]
+    assert (info.mode, info.uid, info.uname) == (0o755, 0, "")
+    assert members["example-1.0.0/data/data1.txt"][0].mode == 0o644
+    assert not os.path.exists(f'{outFile}.tmp')
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_reproducible(tmp_path, fmt, small_blocks, monkeypatch):
+    dist = str(tmp_path / "example-1.0.0")
+    _make_dist(dist)
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1000")
+
+    outputs = []
+    for jobs in [1, 4]:
+        outFile = str(tmp_path / f"{jobs}.{fmt}")
+        write_archive(dist, outFile, fmt, jobs)
+        with open(outFile, mode='rb') as f:
+            outputs.append(f.read())
+
+    assert outputs[0] == outputs[1]
+    with _open(str(tmp_path / f"1.{fmt}"), fmt) as tar:
+        assert all(x.mtime == 1000 for x in tar)
+
+
+def test_mtimes_kept_without_epoch(tmp_path, monkeypatch):
+    dist = str(tmp_path / "example-1.0.0")
+    _make_dist(dist)
+    monkeypatch.delenv("SOURCE_DATE_EPOCH", raising=False)
+    os.utime(os.path.join(dist, "myScript"), (5000, 5000))
+    outFile = str(tmp_path / "example.tar.gz")
+
+    write_archive(dist, outFile, "tar.gz", 2)
+
+    with tarfile.open(outFile, mode="r") as tar:
+        assert tar.getmember("example-1.0.0/myScript").mtime == 5000
+
+
+def test_manifest_from_archive(tmp_path, monkeypatch):
+    dist = str(tmp_path / "example-1.0.0")
+    _make_dist(dist)
+    os.link(os.path.join(dist, "data", "data1.txt"), os.path.join(dist, "data", "data2.txt"))
+    outFile = str(tmp_path / "example.tar.gz")
+
+    # Every file is hashed while it is archived, none is read again
+    def hash_file(path):
+        raise AssertionError(f"Read again: {path}")
+
+    monkeypatch.setattr(delta, "_hash_file", hash_file)
+    write_archive(dist, outFile, "tar.gz", 2, functools.partial(write_manifest, dist, "example-1.0.0", 2))
+    monkeypatch.undo()
+
+    manifest = load_manifest(dist)
+    assert manifest == write_manifest(dist, "example-1.0.0", 2)
+    assert manifest["files"]["data/data2.txt"] == manifest["files"]["data/data1.txt"]
+    with tarfile.open(outFile, mode="r") as tar:
+        last = tar.getmembers()[-1]
+        assert last.name == f"example-1.0.0/{MANIFEST_FILE}"
+        f = tar.extractfile(last)
+        assert f is not None
+        with open(os.path.join(dist, MANIFEST_FILE), mode='rb') as manifestFile:
+            assert f.read() == manifestFile.read()
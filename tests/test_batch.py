@@ -0,0 +1,56 @@
+import os
+
+from diamondpack import pack
+from diamondpack.batch import read_manifest
+from diamondpack.pack import SharedCache
+
+from conftest import write_file
+
+
+def _fake_copy(calls):
+
+    def copy(config, libDir):
+        calls.append(libDir)
+        write_file(os.path.join(libDir, "os.py"), "# built\n")
+
+    return copy
+
+
+def test_read_manifest(tmp_path):
+    manifest = tmp_path / "projects.txt"
+    manifest.write_text("# comment\nprojA\n\n  projB  \n")
+    assert read_manifest(str(manifest)) == [str(tmp_path / "projA"), str(tmp_path / "projB")]
+
+
+def test_stdlib_layer_built_once(config, tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(pack, "_copy_stdlib", _fake_copy(calls))
+    monkeypatch.setattr(pack, "_swap_stdlib_cache", lambda libDir: None)
+
+    cache = SharedCache(str(tmp_path / "cache"))
+    layerDir = cache.get_stdlib_layer(config)
+    assert cache.get_stdlib_layer(config) == layerDir
+    assert len(calls) == 1
+    # Built in a directory only this process uses
+    assert calls[0] == f'{layerDir}.{os.getpid()}.tmp'
+    assert sorted(os.listdir(cache.cacheDir)) == sorted(["pip", "wheels", os.path.basename(layerDir)])
+
+
+def test_stdlib_layer_other_process_first(config, tmp_path, monkeypatch):
+    calls = []
+    copy = _fake_copy(calls)
+
+    def racing_copy(config, libDir):
+        # Another pack sharing the cache dir publishes the same layer meanwhile
+        layerDir = libDir[:-len(f'.{os.getpid()}.tmp')]
+        write_file(os.path.join(layerDir, "os.py"), "# other process\n")
+        copy(config, libDir)
+
+    monkeypatch.setattr(pack, "_copy_stdlib", racing_copy)
+    monkeypatch.setattr(pack, "_swap_stdlib_cache", lambda libDir: None)
+
+    cache = SharedCache(str(tmp_path / "cache"))
+    layerDir = cache.get_stdlib_layer(config)
+    with open(os.path.join(layerDir, "os.py")) as f:
+        assert f.read() == "# other process\n"
+    assert not os.path.exists(calls[0])
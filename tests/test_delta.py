@@ -0,0 +1,198 @@
+import os
+import json
+import shutil
+import zipfile
+from typing import Dict, Tuple
+
+import pytest
+
+from diamondpack import delta
+from diamondpack.delta import MANIFEST_FILE, apply_delta, load_manifest, make_delta, write_manifest
+
+from conftest import write_file
+
+
+def _make_old(root: str) -> None:
+    write_file(os.path.join(root, "venv", "lib", "os.pyc"), "os")
+    write_file(os.path.join(root, "venv", "lib", "site-packages", "gone", "__init__.pyc"), "gone")
+    write_file(os.path.join(root, "data", "data1.txt"), "data1")
+    write_file(os.path.join(root, "myScript"), "launcher 1")
+    os.chmod(os.path.join(root, "myScript"), 0o755)
+    os.symlink("lib", os.path.join(root, "venv", "lib64"))
+    write_manifest(root, "example-1.0.0", 2)
+
+
+def _make_new(oldDir: str, root: str) -> None:
+    shutil.copytree(oldDir, root, symlinks=True)
+    write_file(os.path.join(root, "myScript"), "launcher 2")
+    write_file(os.path.join(root, "data", "data2.txt"), "data2")
+    write_file(os.path.join(root, "venv", "lib", "site-packages", "new", "__init__.pyc"), "new")
+    shutil.rmtree(os.path.join(root, "venv", "lib", "site-packages", "gone"))
+    os.remove(os.path.join(root, "venv", "lib64"))
+    os.symlink("lib/site-packages", os.path.join(root, "venv", "lib64"))
+    write_manifest(root, "example-1.1.0", 2)
+
+
+def _tree(root: str) -> Dict[str, Tuple]:
+    """
+    Every path under a directory, with its type, mode and contents
+    """
+    out = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            relPath = os.path.relpath(path, root)
+            if os.path.islink(path):
+                out[relPath] = ("link", os.readlink(path))
+            elif os.path.isdir(path):
+                out[relPath] = ("dir", )
+            else:
+                with open(path, mode='rb') as f:
+                    out[relPath] = ("file", os.stat(path).st_mode & 0o777, f.read())
+    return out
+
+
+@pytest.fixture
+def dists(tmp_path):
+    """
+    The old and new dist, the delta between them, and an installed copy of the old dist
+    """
+    oldDir = str(tmp_path / "old")
+    newDir = str(tmp_path / "new")
+    installed = str(tmp_path / "installed" / "example")
+    _make_old(oldDir)
+    _make_new(oldDir, newDir)
+    deltaFile = str(tmp_path / "update.dpdelta")
+    make_delta(oldDir, newDir, deltaFile)
+    shutil.copytree(oldDir, installed, symlinks=True)
+    return oldDir, newDir, deltaFile, installed
+
+
+def test_round_trip(dists):
+    _, newDir, deltaFile, installed = dists
+
+    apply_delta(deltaFile, installed)
+
+    assert _tree(installed) == _tree(newDir)
+    # Only the dist is left, without staging directories
+    assert os.listdir(os.path.dirname(installed)) == ["example"]
+
+
+def test_round_trip_without_exchange(dists, monkeypatch):
+    _, newDir, deltaFile, installed = dists
+    monkeypatch.setattr(delta, "_exchange_dirs", lambda a, b: False)
+
+    apply_delta(deltaFile, installed)
+
+    assert _tree(installed) == _tree(newDir)
+    assert os.listdir(os.path.dirname(installed)) == ["example"]
+
+
+def test_delta_from_manifest(dists, tmp_path):
+    oldDir, newDir, _, installed = dists
+    deltaFile = str(tmp_path / "from-manifest.dpdelta")
+
+    make_delta(os.path.join(oldDir, MANIFEST_FILE), newDir, deltaFile)
+    apply_delta(deltaFile, installed)
+
+    assert _tree(installed) == _tree(newDir)
+
+
+def test_modified_install(dists):
+    _, _, deltaFile, installed = dists
+    write_file(os.path.join(installed, "myScript"), "edited")
+    before = _tree(installed)
+
+    with pytest.raises(RuntimeError, match="modified: myScript"):
+        apply_delta(deltaFile, installed)
+
+    assert _tree(installed) == before
+    assert os.listdir(os.path.dirname(installed)) == ["example"]
+
+
+def test_wrong_version(dists):
+    _, newDir, deltaFile, _ = dists
+
+    with pytest.raises(RuntimeError, match="Delta is for 'example-1.0.0'"):
+        apply_delta(deltaFile, newDir)
+
+
+def test_manifest(dists):
+    oldDir, _, _, _ = dists
+    manifest = load_manifest(oldDir)
+
+    assert manifest["name"] == "example-1.0.0"
+    assert manifest["files"]["venv/lib64"] == {
+        "link": "lib"
+    }
+    assert manifest["files"]["myScript"]["mode"] == 0o755
+    assert manifest["files"]["data/data1.txt"]["mode"] == 0o644
+    assert manifest["files"]["data/data1.txt"]["size"] == 5
+    # Directories aren't listed
+    assert "data" not in manifest["files"]
+
+
+def _tamper(deltaFile: str, added: Dict[str, Dict]) -> None:
+    """
+    Add entries to a delta package, each with the contents "escaped"
+    """
+    with zipfile.ZipFile(deltaFile, mode='r') as z:
+        members = {
+            x: z.read(x)
+            for x in z.namelist()
+        }
+    info = json.loads(members["delta.json"])
+    info["added"] = dict(added, **info["added"])
+    members["delta.json"] = json.dumps(info).encode()
+    with zipfile.ZipFile(deltaFile, mode='w') as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+        for relPath in added.keys():
+            z.writestr(f'files/{relPath}', "escaped")
+
+
+@pytest.mark.parametrize("relPath", ["../escape", "/tmp/escape", "C:/escape", "data/../../escape"])
+def test_path_outside_dist(dists, relPath):
+    _, newDir, deltaFile, installed = dists
+    _tamper(deltaFile, {
+        relPath: load_manifest(newDir)["files"]["data/data2.txt"]
+    })
+    before = _tree(installed)
+
+    with pytest.raises(RuntimeError, match="Invalid path in delta package"):
+        apply_delta(deltaFile, installed)
+
+    assert _tree(installed) == before
+    assert os.listdir(os.path.dirname(installed)) == ["example"]
+    assert not os.path.exists(os.path.join(os.path.dirname(os.path.dirname(installed)), "escape"))
+
+
+def test_path_through_link(dists):
+    _, newDir, deltaFile, installed = dists
+    entry = load_manifest(newDir)["files"]["data/data2.txt"]
+    # A link out of the dist, then a file below it
+    _tamper(deltaFile, {
+        "out": {
+            "link": "../.."
+        },
+        "out/escape": entry
+    })
+
+    with pytest.raises(RuntimeError, match="Invalid path in delta package: out/escape"):
+        apply_delta(deltaFile, installed)
+
+    assert not os.path.exists(os.path.join(os.path.dirname(os.path.dirname(installed)), "escape"))
+    assert os.listdir(os.path.dirname(installed)) == ["example"]
+
+
+def test_exchange_dirs(tmp_path):
+    a = tmp_path / "a"
+    b = tmp_path / "b"
+    write_file(str(a / "file"), "a")
+    write_file(str(b / "file"), "b")
+
+    if not delta._exchange_dirs(str(a), str(b)):
+        pytest.skip("renameat2(RENAME_EXCHANGE) isn't supported here")
+
+    assert (a / "file").read_text() == "b"
+    assert (b / "file").read_text() == "a"
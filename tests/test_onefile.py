@@ -0,0 +1,89 @@
+import hashlib
+import os
+import stat
+import struct
+from typing import BinaryIO, Dict, Tuple
+
+from diamondpack.onefile import ONEFILE_MAGIC, EntryType, write_onefile, write_payload
+
+from conftest import write_file
+
+TRAILER_SIZE = 8 + 64 + len(ONEFILE_MAGIC)
+
+
+def _read(f: BinaryIO, fmt: str):
+    return struct.unpack(fmt, f.read(struct.calcsize(fmt)))
+
+
+def _extract(f: BinaryIO) -> Dict[str, Tuple[int, int, bytes]]:
+    """
+    Reads a payload the same way the launcher does
+
+    :return: relative path -> (entry type, mode, contents or link target)
+    """
+    out = {}
+    while True:
+        entryType, = _read(f, "<B")
+        if entryType == EntryType.END:
+            return out
+        mode, pathLen = _read(f, "<II")
+        relPath = f.read(pathLen).decode()
+        size, = _read(f, "<Q")
+        out[relPath] = (entryType, mode, f.read(size))
+
+
+def _make_dist(root: str) -> None:
+    write_file(os.path.join(root, "venv", "lib", "os.pyc"), "bytecode")
+    write_file(os.path.join(root, "data", "data1.txt"), "data")
+    write_file(os.path.join(root, "myScript"), "launcher")
+    os.chmod(os.path.join(root, "venv", "lib", "os.pyc"), 0o644)
+    os.chmod(os.path.join(root, "myScript"), 0o755)
+    os.symlink("lib", os.path.join(root, "venv", "lib64"))
+
+
+def test_payload_round_trip(tmp_path):
+    dist = str(tmp_path / "dist")
+    _make_dist(dist)
+    payloadFile = str(tmp_path / "payload")
+
+    payloadHash = write_payload(dist, payloadFile, {"myScript"})
+
+    with open(payloadFile, mode='rb') as f:
+        assert hashlib.sha256(f.read()).hexdigest() == payloadHash
+    with open(payloadFile, mode='rb') as f:
+        entries = _extract(f)
+
+    assert entries == {
+        "data": (EntryType.DIR, 0o755, b""),
+        "data/data1.txt": (EntryType.FILE, 0o644, b"data"),
+        "venv": (EntryType.DIR, 0o755, b""),
+        "venv/lib": (EntryType.DIR, 0o755, b""),
+        "venv/lib/os.pyc": (EntryType.FILE, 0o644, b"bytecode"),
+        "venv/lib64": (EntryType.SYMLINK, 0o777, b"lib"),
+    }
+    # The same dist always gives the same payload
+    assert write_payload(dist, str(tmp_path / "payload2"), {"myScript"}) == payloadHash
+
+
+def test_onefile_trailer(tmp_path):
+    dist = str(tmp_path / "dist")
+    _make_dist(dist)
+    payloadFile = str(tmp_path / "payload")
+    payloadHash = write_payload(dist, payloadFile, {"myScript"})
+    outFile = str(tmp_path / "onefile")
+
+    write_onefile(os.path.join(dist, "myScript"), payloadFile, payloadHash, outFile)
+
+    assert os.stat(outFile).st_mode & stat.S_IXUSR
+    with open(outFile, mode='rb') as f:
+        data = f.read()
+    offset, = struct.unpack("<Q", data[-TRAILER_SIZE:-TRAILER_SIZE + 8])
+    assert data[-len(ONEFILE_MAGIC):] == ONEFILE_MAGIC
+    assert data[-TRAILER_SIZE + 8:-len(ONEFILE_MAGIC)].decode() == payloadHash
+    # The launcher comes first, unchanged
+    assert data[:offset] == b"launcher"
+    assert hashlib.sha256(data[offset:-TRAILER_SIZE]).hexdigest() == payloadHash
+
+    with open(outFile, mode='rb') as f:
+        f.seek(offset)
+        assert _extract(f)["data/data1.txt"] == (EntryType.FILE, 0o644, b"data")
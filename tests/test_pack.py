@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from diamondpack import pack
+from diamondpack.pack import DiamondPacker, DistLayout
+
+from conftest import write_file
+
+
+@pytest.fixture
+def venv_args(monkeypatch):
+    """
+    Records the arguments the packer runs instead of running them
+    """
+    calls = []
+
+    def execute(args, env=None):
+        calls.append(args)
+        return 0
+
+    monkeypatch.setattr(pack, "execute", execute)
+    return calls
+
+
+def test_create_venv_dev_reuses_venv(config, venv_args):
+    config.dev_mode = True
+    write_file(os.path.join(DistLayout(config).venvDir, "pyvenv.cfg"))
+
+    DiamondPacker(config)._create_venv()
+
+    assert venv_args == []
+
+
+def test_create_venv_dev_over_full_pack(config, venv_args):
+    # A full pack removes pyvenv.cfg and pip along with it
+    config.dev_mode = True
+    layout = DistLayout(config)
+    write_file(os.path.join(layout.venvLib, "os.pyc"))
+
+    DiamondPacker(config)._create_venv()
+
+    assert len(venv_args) == 1
+    assert venv_args[0][-3:] == [layout.venvDir, "--copies", "--clear"]
+
+
+def test_create_venv_full(config, venv_args):
+    write_file(os.path.join(DistLayout(config).venvDir, "pyvenv.cfg"))
+
+    DiamondPacker(config)._create_venv()
+
+    assert len(venv_args) == 1
+    assert "--clear" not in venv_args[0]
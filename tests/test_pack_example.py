@@ -0,0 +1,193 @@
+import base64
+import hashlib
+import json
+import os
+import shutil
+import subprocess as sp
+import sys
+import zipfile
+from typing import List
+
+import pytest
+
+from diamondpack.__main__ import parse_project
+from diamondpack.delta import MANIFEST_FILE, load_manifest
+from diamondpack.pack import DistLayout
+from diamondpack.readahead import READAHEAD_DIR, RUNTIME_PREFIX
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test")
+EXAMPLE = "example-1.0.0"
+
+# Packs the example project for real, which needs a C++ compiler for the launchers
+pytestmark = pytest.mark.skipif(
+    sys.platform == "win32" or shutil.which("cmake") is None, reason="Needs cmake to build the launchers"
+)
+
+
+def _write_wheel(projectDir: str) -> None:
+    """
+    Write the example project's wheel, like a build backend would
+    """
+    distInfo = f'{EXAMPLE}.dist-info'
+    files = {}
+    for name in sorted(os.listdir(os.path.join(projectDir, "examplePackage"))):
+        if name.endswith(".py"):
+            with open(os.path.join(projectDir, "examplePackage", name), mode='rb') as f:
+                files[f'examplePackage/{name}'] = f.read()
+    files[f'{distInfo}/METADATA'] = b"Metadata-Version: 2.1\nName: example\nVersion: 1.0.0\n"
+    files[f'{distInfo}/WHEEL'] = b"Wheel-Version: 1.0\nGenerator: test\nRoot-Is-Purelib: true\nTag: py3-none-any\n"
+    files[f'{distInfo}/entry_points.txt'] = (
+        b"[console_scripts]\nmyScript = examplePackage.myScript:main\n\n"
+        b"[gui_scripts]\ngui = examplePackage.myGUI:main\n"
+    )
+
+    record = []
+    for name, data in files.items():
+        digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=").decode()
+        record.append(f'{name},sha256={digest},{len(data)}')
+    record.append(f'{distInfo}/RECORD,,')
+
+    os.makedirs(os.path.join(projectDir, "dist"))
+    with zipfile.ZipFile(os.path.join(projectDir, "dist", f'{EXAMPLE}-py3-none-any.whl'), mode='w') as z:
+        for name, data in files.items():
+            z.writestr(name, data)
+        z.writestr(f'{distInfo}/RECORD', "\n".join(record) + "\n")
+
+
+def _pack(tmp_path_factory, name: str, *args: str) -> str:
+    """
+    Plan, then pack a copy of the example project
+
+    :return: The project directory, with the plan written to plan.json
+    """
+    projectDir = str(tmp_path_factory.mktemp(name) / "project")
+    shutil.copytree(EXAMPLE_DIR, projectDir, ignore=shutil.ignore_patterns("build", "dist"))
+    _write_wheel(projectDir)
+
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(EXAMPLE_DIR))
+    cmd = [sys.executable, "-m", "diamondpack", *args]
+    if "--shared-runtime" in args:
+        sp.run([sys.executable, "-m", "diamondpack", "runtime", *args], cwd=projectDir, env=env, check=True)
+    sp.run([*cmd, "--plan", "--output", "plan.json"], cwd=projectDir, env=env, check=True)
+    sp.run(cmd, cwd=projectDir, env=env, check=True)
+    return projectDir
+
+
+@pytest.fixture(scope="module")
+def packed(tmp_path_factory) -> str:
+    return _pack(tmp_path_factory, "packed", "--onefile", "--readahead")
+
+
+@pytest.fixture(scope="module")
+def packed_shared(tmp_path_factory) -> str:
+    runtimeRoot = str(tmp_path_factory.mktemp("runtimes"))
+    return _pack(tmp_path_factory, "shared", "--readahead", "--shared-runtime", "--runtime-root", runtimeRoot)
+
+
+def _dist(projectDir: str) -> str:
+    return os.path.join(projectDir, "dist", EXAMPLE)
+
+
+def _app_module(projectDir: str) -> str:
+    """
+    The packed app module, relative to the dist
+    """
+    layout = DistLayout(parse_project(projectDir))
+    return os.path.relpath(os.path.join(layout.sitePackages, "examplePackage", "myScript.pyc"), layout.outputDir)
+
+
+def _run(exe: str, env=None) -> List[str]:
+    """
+    Run the example script, returning its output lines, along with the launcher's debug logs
+    """
+    return sp.run([exe, "1", "2"], env=env, check=True, stdout=sp.PIPE, text=True).stdout.splitlines()
+
+
+def _check_plan(projectDir: str) -> None:
+    with open(os.path.join(projectDir, "plan.json")) as f:
+        plan = json.load(f)
+    files = load_manifest(_dist(projectDir))["files"]
+    # The manifest doesn't list itself
+    del plan["files"][MANIFEST_FILE]
+
+    assert sorted(plan["files"].keys()) == sorted(files.keys())
+    for relPath, planned in plan["files"].items():
+        packed = files[relPath]
+        if "link" in planned:
+            assert planned["link"] == packed.get("link"), relPath
+            continue
+        assert planned["mode"] == packed["mode"], relPath
+        # Launchers and traces are only known after packing
+        if planned["sha256"] is not None:
+            assert (planned["sha256"], planned["size"]) == (packed["sha256"], packed["size"]), relPath
+        elif planned["size"] is not None:
+            assert planned["size"] == packed["size"], relPath
+
+    for relPath in plan["outputs"].keys():
+        assert os.path.isfile(os.path.join(projectDir, "dist", relPath)), relPath
+
+
+def test_plan_matches_pack(packed):
+    _check_plan(packed)
+
+
+def test_launcher(packed):
+    assert "Wow, 1 + 2 = 3" in _run(os.path.join(_dist(packed), "myScript"))
+
+
+def test_onefile(packed, tmp_path):
+    exe = os.path.join(packed, "dist", f'{EXAMPLE}-onefile', "myScript")
+    env = dict(os.environ, XDG_CACHE_HOME=str(tmp_path))
+
+    # Extracting, then from the extracted copy
+    assert "Wow, 1 + 2 = 3" in _run(exe, env)
+    assert "Wow, 1 + 2 = 3" in _run(exe, env)
+    extracted = os.listdir(os.path.join(str(tmp_path), "diamondpack"))
+    assert len(extracted) == 1
+
+
+def test_readahead(packed):
+    dist = _dist(packed)
+    with open(os.path.join(dist, READAHEAD_DIR, "myScript.txt")) as f:
+        files = f.read().splitlines()
+
+    # Traced from the dist, not the project's sources
+    assert _app_module(packed) in files
+    for x in files:
+        assert os.path.isfile(os.path.join(dist, x)), x
+
+
+def test_trimmed_tcl(packed):
+    layout = DistLayout(parse_project(packed))
+    # Tcl prefers the library it was built with, if this host has it, to the one next to the executable
+    libDir = os.path.join(layout.venvDir, "lib")
+    tclLib = [x for x in os.listdir(libDir) if os.path.isfile(os.path.join(libDir, x, "init.tcl"))]
+    env = dict(os.environ, TCL_LIBRARY=os.path.join(libDir, tclLib[0]), **layout.get_env())
+    # Only loads msgcat from the dist, not from the system's Tcl
+    code = (
+        "import tkinter; tcl = tkinter.Tcl(); "
+        "[tcl.eval(f'tcl::tm::path remove {{{x}}}') for x in tcl.splitlist(tcl.eval('tcl::tm::path list')) "
+        "if not x.startswith(sys.argv[1])]; "
+        "print(tcl.eval('info library')); tcl.eval('package require msgcat')"
+    )
+
+    out = sp.run(
+        [layout.pythonExec, "-c", f'import sys; {code}', layout.venvDir],
+        env=env,
+        cwd=layout.outputDir,
+        check=True,
+        stdout=sp.PIPE,
+        text=True
+    ).stdout
+    assert out.startswith(layout.venvDir)
+
+
+def test_shared_runtime(packed_shared):
+    _check_plan(packed_shared)
+    dist = _dist(packed_shared)
+    assert "Wow, 1 + 2 = 3" in _run(os.path.join(dist, "myScript"))
+
+    with open(os.path.join(dist, READAHEAD_DIR, "myScript.txt")) as f:
+        files = f.read().splitlines()
+    assert any(x.startswith(RUNTIME_PREFIX) for x in files)
+    assert _app_module(packed_shared) in files
@@ -0,0 +1,95 @@
+import os
+import shlex
+import subprocess as sp
+import sys
+
+from diamondpack.__main__ import ProfileKeys, parse_profile, parse_project
+from diamondpack.config import DPMode
+from diamondpack.pack import DiamondPacker
+
+from conftest import write_file
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test")
+
+_PROJECT = """
+[project]
+name = "example"
+version = "1.0.0"
+
+[project.scripts]
+myScript = "{}"
+
+[tool.diamondpack.runtime.myScript]
+gc-freeze = true
+"""
+
+
+def _example_app():
+    config = parse_project(EXAMPLE_DIR)
+    app = [x for x in config.scripts if x.name == "myScript"][0]
+    return config, app
+
+
+def test_example_profile():
+    _, app = _example_app()
+
+    assert app.profile.gc_freeze
+    assert app.profile.get_env() == {
+        "MALLOC_ARENA_MAX": "2"
+    }
+
+
+def test_example_launcher():
+    config, app = _example_app()
+    cmd = '-c "from examplePackage.myScript import main; import gc; gc.freeze(); exit(main())"'
+
+    outName, template, text = DiamondPacker(config).render_app(app)
+    assert (outName, template) == ("myScript", "app-linux.cpp")
+    assert '    {"MALLOC_ARENA_MAX", "2"},\n' in text
+    assert cmd.replace('"', '\\"') in text
+
+    config.mode = DPMode.SCRIPT
+    outName, template, text = DiamondPacker(config).render_app(app)
+    assert (outName, template) == ("myScript.sh", "app.sh")
+    assert "\nexport MALLOC_ARENA_MAX=2\n" in text
+    assert f'"${{home}}/venv/bin/python" {cmd} $@' in text
+
+
+def test_launcher_command(tmp_path):
+    config, app = _example_app()
+    # Reports what the app's entry point sees
+    write_file(
+        str(tmp_path / "examplePackage" / "myScript.py"),
+        "import gc\nimport os\n\ndef main():\n    print(gc.get_freeze_count(), os.environ['MALLOC_ARENA_MAX'])\n"
+    )
+    cmd = DiamondPacker(config)._get_cmd(app)
+
+    env = dict(os.environ, PYTHONPATH=str(tmp_path), **app.profile.get_env())
+    out = sp.run([sys.executable, *shlex.split(cmd)], env=env, check=True, stdout=sp.PIPE, text=True).stdout.split()
+
+    # Everything imported by then is frozen
+    assert int(out[0]) > 0
+    assert out[1] == "2"
+
+
+def test_gc_freeze_needs_entry(tmp_path, capsys):
+    write_file(str(tmp_path / "pyproject.toml"), _PROJECT.format("examplePackage.myScript"))
+    assert parse_project(str(tmp_path)) is None
+    assert "gc-freeze' needs an entry point" in capsys.readouterr().out
+
+    write_file(str(tmp_path / "pyproject.toml"), _PROJECT.format("examplePackage.myScript:main"))
+    assert parse_project(str(tmp_path)).scripts[0].profile.gc_freeze
+
+
+def test_hash_seed(capsys):
+    for x in [42, "random"]:
+        profile = parse_profile("myScript", {
+            ProfileKeys.HASH_SEED: x
+        })
+        assert profile.get_env()["PYTHONHASHSEED"] == str(x)
+    # TOML booleans are ints to isinstance(), but PYTHONHASHSEED=True stops python at startup
+    for x in [True, -1, 4294967296, "1"]:
+        assert parse_profile("myScript", {
+            ProfileKeys.HASH_SEED: x
+        }) is None
+    assert "hash-seed' must be" in capsys.readouterr().out
@@ -0,0 +1,39 @@
+import os
+
+from diamondpack.pack import DistLayout
+from diamondpack.readahead import READAHEAD_DIR, RUNTIME_PREFIX, trace_startup_files, write_readahead
+
+from conftest import APP_MODULE, write_file
+
+
+def test_trace_from_dist(dev_dist):
+    layout = DistLayout(dev_dist)
+
+    files = trace_startup_files(
+        layout.pythonExec, layout.get_env(), dev_dist.scripts[0], layout.outputDir, layout.setup
+    )
+
+    assert os.path.realpath(os.path.join(layout.sitePackages, APP_MODULE, "__init__.py")) in files
+    assert os.path.realpath(os.path.join(dev_dist.project_dir, APP_MODULE, "__init__.py")) not in files
+
+
+def test_write_readahead(tmp_path):
+    dist = str(tmp_path / "dist")
+    runtime = str(tmp_path / "runtime")
+    files = [
+        os.path.join(runtime, "lib", "os.pyc"),
+        os.path.join(dist, "venv", "lib", "site-packages", "app.pyc"),
+        os.path.join(dist, "venv", "lib", "missing.pyc"),
+        str(tmp_path / "outside.txt"),
+    ]
+    for x in files[:2] + files[3:]:
+        write_file(x)
+
+    assert write_readahead(dist, "myScript", files, runtime) == 2
+    with open(os.path.join(dist, READAHEAD_DIR, "myScript.txt")) as f:
+        assert f.read().splitlines() == [f"{RUNTIME_PREFIX}lib/os.pyc", "venv/lib/site-packages/app.pyc"]
+
+    # Without a shared runtime, only the dist's files are listed
+    assert write_readahead(dist, "myScript", files) == 1
+    with open(os.path.join(dist, READAHEAD_DIR, "myScript.txt")) as f:
+        assert f.read().splitlines() == ["venv/lib/site-packages/app.pyc"]
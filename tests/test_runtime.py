@@ -0,0 +1,131 @@
+import os
+import shlex
+import subprocess as sp
+import sys
+
+import pytest
+
+from diamondpack import pack
+from diamondpack.config import App
+from diamondpack.pack import (
+    RUNTIME_KEY_FILE,
+    RUNTIME_ROOT_ENV,
+    DiamondPacker,
+    DistLayout,
+    build_runtime,
+    get_runtime_key,
+    get_runtime_name,
+    get_runtime_root
+)
+
+from conftest import write_file
+
+
+@pytest.fixture
+def fake_copies(monkeypatch):
+    """
+    Replaces the slow runtime copies, recording the directories they were built in
+    """
+    built = []
+
+    def copy_stdlib(config, libDir):
+        built.append(libDir)
+        write_file(os.path.join(libDir, "os.py"))
+
+    monkeypatch.setattr(pack, "_copy_stdlib", copy_stdlib)
+    monkeypatch.setattr(pack, "_swap_stdlib_cache", lambda libDir: None)
+    monkeypatch.setattr(pack, "_copy_libs", lambda config, venvDir, venvBin, venvLib: None)
+    monkeypatch.setattr(pack, "_copy_python", lambda venvBin: write_file(os.path.join(venvBin, "python")))
+    return built
+
+
+def test_runtime_key(config):
+    key = get_runtime_key(config)
+    assert get_runtime_key(config) == key
+    assert get_runtime_name(config).endswith(key[:16])
+
+    config.stdlib_blacklist = ["email"]
+    assert get_runtime_key(config) != key
+    config.stdlib_blacklist = None
+    config.include_tk = True
+    assert get_runtime_key(config) != key
+    # Not part of the runtime
+    config.include_tk = False
+    config.data_globs = [("data/*", "data")]
+    config.cache_block = ["cv2"]
+    assert get_runtime_key(config) == key
+
+
+def test_runtime_root(config, monkeypatch):
+    monkeypatch.delenv(RUNTIME_ROOT_ENV, raising=False)
+    config.runtime_root = "/opt/runtimes"
+    assert get_runtime_root(config) == "/opt/runtimes"
+    # Like in the launchers, the environment wins
+    monkeypatch.setenv(RUNTIME_ROOT_ENV, "/srv/runtimes")
+    assert get_runtime_root(config) == "/srv/runtimes"
+
+
+def test_build_runtime(config, tmp_path, fake_copies):
+    root = str(tmp_path / "runtimes")
+
+    runtimeDir = build_runtime(config, root)
+
+    assert runtimeDir == os.path.join(root, get_runtime_name(config))
+    with open(os.path.join(runtimeDir, RUNTIME_KEY_FILE)) as f:
+        assert f.read().strip() == get_runtime_key(config)
+    assert os.path.isfile(os.path.join(runtimeDir, "bin", "python"))
+    # Built elsewhere and renamed into place
+    assert fake_copies[0].startswith(f'{runtimeDir}.{os.getpid()}.tmp')
+    assert os.listdir(root) == [os.path.basename(runtimeDir)]
+
+    # Installing it again does nothing
+    assert build_runtime(config, root) == runtimeDir
+    assert len(fake_copies) == 1
+
+
+def test_build_runtime_incomplete(config, tmp_path, fake_copies):
+    root = str(tmp_path / "runtimes")
+    os.makedirs(os.path.join(root, get_runtime_name(config), "bin"))
+
+    with pytest.raises(RuntimeError, match="isn't a complete runtime"):
+        build_runtime(config, root)
+    assert fake_copies == []
+
+
+def test_shared_runtime_layout(config, tmp_path, monkeypatch):
+    monkeypatch.delenv(RUNTIME_ROOT_ENV, raising=False)
+    config.shared_runtime = True
+    config.runtime_root = str(tmp_path / "runtimes")
+    layout = DistLayout(config)
+    runtimeDir = os.path.join(config.runtime_root, get_runtime_name(config))
+
+    assert layout.runtimeDir == runtimeDir
+    assert layout.pythonExec == os.path.join(runtimeDir, "bin", "python")
+
+    env = layout.get_env()
+    assert env["PYTHONHOME"] == runtimeDir
+    assert env["PYTHONPATH"] == os.path.abspath(layout.sitePackages)
+    assert env["LD_LIBRARY_PATH"] == os.path.join(runtimeDir, "bin")
+
+
+@pytest.mark.parametrize("entry", ["main", None])
+def test_shared_runtime_pth(config, tmp_path, entry):
+    config.shared_runtime = True
+    config.runtime_root = str(tmp_path / "runtimes")
+    layout = DistLayout(config)
+    # The app is only importable through a .pth file in the dist's site-packages
+    write_file(
+        str(tmp_path / "extra" / "pthapp.py"),
+        "def main():\n    print('from pth')\n\nif __name__ == '__main__':\n    main()\n"
+    )
+    write_file(os.path.join(layout.sitePackages, "extra.pth"), str(tmp_path / "extra") + "\n")
+    app = App("myScript", "pthapp", entry, None)
+
+    cmd = DiamondPacker(config)._get_cmd(app)
+
+    # The host interpreter stands in for the runtime, the dist is only on PYTHONPATH like in the launchers
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(layout.sitePackages))
+    out = sp.run(
+        [sys.executable, *shlex.split(cmd)], env=env, cwd=layout.outputDir, check=True, stdout=sp.PIPE, text=True
+    )
+    assert out.stdout == "from pth\n"
@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+from diamondpack.tasks import TaskGraph
+
+
+def test_runs_after_dependencies():
+    order = []
+    lock = threading.Lock()
+
+    def step(name):
+
+        def run():
+            with lock:
+                order.append(name)
+
+        return run
+
+    graph = TaskGraph()
+    graph.add("install", step("install"), ["wheel", "venv"])
+    graph.add("wheel", step("wheel"))
+    graph.add("venv", step("venv"))
+    graph.add("clean", step("clean"), ["install"])
+    graph.run(4)
+
+    assert sorted(order) == ["clean", "install", "venv", "wheel"]
+    assert order.index("install") > order.index("wheel")
+    assert order.index("install") > order.index("venv")
+    assert order[-1] == "clean"
+
+
+def test_independent_tasks_overlap():
+    # Both tasks wait for each other, so this only finishes if they run at the same time
+    barrier = threading.Barrier(2, timeout=10)
+    graph = TaskGraph()
+    graph.add("a", barrier.wait)
+    graph.add("b", barrier.wait)
+    graph.run(2)
+
+
+def test_failure_stops_new_tasks():
+    ran = []
+
+    def fail():
+        raise RuntimeError("step failed")
+
+    graph = TaskGraph()
+    graph.add("fail", fail)
+    graph.add("after", lambda: ran.append("after"), ["fail"])
+    with pytest.raises(RuntimeError, match="step failed"):
+        graph.run(2)
+    assert ran == []
+
+
+def test_cycle():
+    graph = TaskGraph()
+    graph.add("a", lambda: None, ["b"])
+    graph.add("b", lambda: None, ["a"])
+    with pytest.raises(RuntimeError, match="cycle"):
+        graph.run(2)
+
+
+def test_unknown_dependency():
+    graph = TaskGraph()
+    graph.add("a", lambda: None, ["missing"])
+    with pytest.raises(RuntimeError, match="unknown task 'missing'"):
+        graph.run(2)
+
+
+def test_duplicate_name():
+    graph = TaskGraph()
+    graph.add("a", lambda: None)
+    with pytest.raises(RuntimeError, match="Duplicate"):
+        graph.add("a", lambda: None)
@@ -0,0 +1,63 @@
+import os
+import subprocess as sp
+import sys
+
+import pytest
+
+from diamondpack.pack import DistLayout, _copy_libs
+
+pytest.importorskip("tkinter")
+
+# Loads msgcat like Tk's init does, but only from the dist
+_CHECK_TCL = """
+import sys
+import tkinter
+tcl = tkinter.Tcl()
+root = sys.argv[1]
+for p in tcl.splitlist(tcl.eval("tcl::tm::path list")):
+    if not p.startswith(root):
+        tcl.eval(f"tcl::tm::path remove {{{p}}}")
+print(tcl.eval("info library"))
+print(tcl.eval("package require msgcat"))
+print(tcl.eval("encoding convertto cp1252 x"))
+"""
+
+
+@pytest.fixture
+def tk_dist(config):
+    config.include_tk = True
+    config.tk_encodings = ["cp1252"]
+    layout = DistLayout(config)
+    os.makedirs(layout.venvBin)
+    os.makedirs(layout.venvLib)
+    return config
+
+
+def _check_tcl(venvDir: str) -> list:
+    lib = os.path.join(venvDir, "lib")
+    tclLib = [x for x in os.listdir(lib) if x.startswith("tcl") and os.path.isfile(os.path.join(lib, x, "init.tcl"))]
+    env = dict(os.environ, TCL_LIBRARY=os.path.join(lib, tclLib[0]))
+    return sp.run([sys.executable, "-c", _CHECK_TCL, lib], env=env, check=True, stdout=sp.PIPE,
+                  text=True).stdout.splitlines()
+
+
+def test_trimmed_tcl(tk_dist):
+    layout = DistLayout(tk_dist)
+    _copy_libs(tk_dist, layout.venvDir, layout.venvBin, layout.venvLib)
+
+    out = _check_tcl(layout.venvDir)
+    assert out[0].startswith(os.path.join(layout.venvDir, "lib"))
+    assert out[2] == "x"
+    # Only what tkinter needs
+    assert not os.path.exists(os.path.join(out[0], "encoding", "cp1251.enc"))
+    assert not os.path.exists(os.path.join(out[0], "msgs"))
+
+
+def test_full_tcl(tk_dist):
+    tk_dist.tk_full = True
+    layout = DistLayout(tk_dist)
+    _copy_libs(tk_dist, layout.venvDir, layout.venvBin, layout.venvLib)
+
+    out = _check_tcl(layout.venvDir)
+    assert os.path.isfile(os.path.join(out[0], "encoding", "cp1251.enc"))
+    assert len(os.listdir(os.path.join(out[0], "msgs"))) > 0
@@ -0,0 +1,182 @@
+import importlib.util
+import os
+import py_compile
+import zipfile
+
+import pytest
+
+from diamondpack.config import App
+from diamondpack.pack import DiamondPacker, DistLayout, _keep_cache
+from diamondpack.watch import DiamondWatcher
+
+from conftest import make_config, write_file
+
+
+class _StopWatching(Exception):
+    pass
+
+
+class _ScriptedWaiter:
+
+    def __init__(self, steps) -> None:
+        """
+        Runs one step per wait, then stops the watch loop
+        """
+        self._steps = list(steps)
+
+    def watch_dirs(self, dirs) -> None:
+        pass
+
+    def wait(self) -> None:
+        if len(self._steps) == 0:
+            raise _StopWatching()
+        self._steps.pop(0)()
+
+
+def _make_config(projectDir: str):
+    config = make_config(projectDir)
+    config.scripts = [App("myScript", "examplepkg.mod", "main", None)]
+    config.data_globs = [("exampleData/data*.txt", "data")]
+    return config
+
+
+@pytest.fixture
+def project(tmp_path):
+    """
+    A project with a built wheel, and a dist from a full pack with the module swapped for its bytecode
+    """
+    config = _make_config(str(tmp_path))
+    write_file(str(tmp_path / "examplepkg" / "__init__.py"))
+    write_file(str(tmp_path / "examplepkg" / "mod.py"), "def main():\n    return 1\n")
+    write_file(str(tmp_path / "exampleData" / "data1.txt"), "data1")
+    write_file(str(tmp_path / "pyproject.toml"))
+
+    wheel = str(tmp_path / "dist" / "example-1.0.0-py3-none-any.whl")
+    os.makedirs(os.path.dirname(wheel))
+    with zipfile.ZipFile(wheel, mode='w') as z:
+        z.writestr("examplepkg/__init__.py", "")
+        z.writestr("examplepkg/mod.py", "")
+        z.writestr("example-1.0.0.dist-info/RECORD", "examplepkg/__init__.py,,\nexamplepkg/mod.py,,\n")
+    config.wheels = [wheel]
+
+    sitePackages = DistLayout(config).sitePackages
+    write_file(os.path.join(sitePackages, "examplepkg", "__init__.py"))
+    write_file(os.path.join(sitePackages, "examplepkg", "mod.py"), "def main():\n    return 1\n")
+    py_compile.compile(os.path.join(sitePackages, "examplepkg", "mod.py"))
+    _keep_cache(os.path.join(sitePackages, "examplepkg", "mod.py"), sitePackages)
+    return config
+
+
+def _watcher(config, reload=None) -> DiamondWatcher:
+    return DiamondWatcher(config, DiamondPacker(config), reload or (lambda: None), 0.01)
+
+
+def test_find_roots(project):
+    watcher = _watcher(project)
+    watcher._find_roots()
+    assert watcher._roots == {
+        os.path.join(project.project_dir, "examplepkg"): os.path.join(DistLayout(project).sitePackages, "examplepkg")
+    }
+
+
+def test_watch_syncs_changes(project):
+    layout = DistLayout(project)
+    source = os.path.join(project.project_dir, "examplepkg", "mod.py")
+    added = os.path.join(project.project_dir, "examplepkg", "added.py")
+    data = os.path.join(project.project_dir, "exampleData", "data2.txt")
+
+    def edit():
+        write_file(source, "def main():\n    return 2\n")
+        write_file(added, "")
+        write_file(data, "data2")
+
+    def remove():
+        os.remove(source)
+
+    watcher = _watcher(project)
+    watcher._waiter = _ScriptedWaiter([edit])
+    with pytest.raises(_StopWatching):
+        watcher.watch()
+
+    dst = os.path.join(layout.sitePackages, "examplepkg", "mod.py")
+    with open(dst) as f:
+        assert f.read() == "def main():\n    return 2\n"
+    # Next to the full pack's bytecode, python prefers the source's own cache
+    assert os.path.isfile(dst + "c")
+    assert os.path.isfile(importlib.util.cache_from_source(dst))
+    assert os.path.isfile(os.path.join(layout.sitePackages, "examplepkg", "added.py"))
+    with open(os.path.join(layout.outputDir, "data", "data2.txt")) as f:
+        assert f.read() == "data2"
+
+    watcher._waiter = _ScriptedWaiter([remove])
+    with pytest.raises(_StopWatching):
+        watcher.watch()
+
+    # The source, its cache, and the full pack's bytecode
+    assert not os.path.exists(dst)
+    assert not os.path.exists(importlib.util.cache_from_source(dst))
+    assert not os.path.exists(dst + "c")
+
+
+def test_reload_rebuilds_changed_apps(project, monkeypatch):
+    built = []
+    monkeypatch.setattr(DiamondPacker, "make_app", lambda self, app, is_gui: built.append((app.name, is_gui)))
+
+    def reload():
+        config = _make_config(project.project_dir)
+        config.scripts[0].profile.gc_freeze = True
+        config.gui_scripts = [App("gui", "examplepkg.gui", "main", None)]
+        return config
+
+    watcher = _watcher(project, reload)
+    watcher._find_roots()
+    watcher._sync(os.path.join(project.project_dir, "pyproject.toml"))
+
+    assert sorted(built) == [("gui", True), ("myScript", False)]
+    assert watcher._config.wheels == project.wheels
+
+
+def test_reload_keeps_overrides(project, monkeypatch):
+    # Options the dist was packed with from the command line, missing from pyproject.toml
+    project.dev_mode = True
+    project.jobs = 3
+    project.onefile = True
+    project.readahead = True
+    project.archive = "tar.gz"
+    project.shared_runtime = True
+    project.runtime_root = "/srv/runtimes"
+    built = []
+    monkeypatch.setattr(DiamondPacker, "make_app", lambda self, app, is_gui: built.append(self._config.shared_runtime))
+
+    def reload():
+        config = _make_config(project.project_dir)
+        config.scripts[0].profile.gc_freeze = True
+        return config
+
+    watcher = _watcher(project, reload)
+    watcher._sync(os.path.join(project.project_dir, "pyproject.toml"))
+
+    # The launcher is rebuilt for the shared runtime the dist uses
+    assert built == [True]
+    config = watcher._config
+    assert config is not project
+    assert config.dev_mode and config.jobs == 3
+    assert config.onefile and config.readahead and config.archive == "tar.gz"
+    assert config.shared_runtime and config.runtime_root == "/srv/runtimes"
+
+
+def test_reload_name_change(project, monkeypatch, capsys):
+    built = []
+    monkeypatch.setattr(DiamondPacker, "make_app", lambda self, app, is_gui: built.append(app.name))
+
+    def reload():
+        config = _make_config(project.project_dir)
+        config.name = "example-2.0.0"
+        return config
+
+    watcher = _watcher(project, reload)
+    watcher._sync(os.path.join(project.project_dir, "pyproject.toml"))
+
+    assert built == []
+    assert watcher._config is project
+    assert "restart to pack the new dist" in capsys.readouterr().out